@@ -0,0 +1,226 @@
+# Допуск запросов: бюджеты одновременной работы LLM и модели эмбеддингов с очередью по приоритету
+# (интерактивные /ask раньше фоновых загрузок), сброс нагрузки по таймауту очереди и лимиты клиентов
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+# Настройки читаются при первом обращении к бюджетам, а не при импорте модуля
+from config import AdmissionSettings, get_settings
+from metrics import ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+
+# Приоритеты: меньше — раньше
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Приоритет текущего запроса. По умолчанию — фоновая работа (загрузки, синхронизации, вебхуки),
+# /ask и /ask_stream помечаются явно. Задачи asyncio наследуют значение при создании
+_priority: ContextVar[int] = ContextVar("admission_priority", default=BULK)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+@contextmanager
+def priority(level: int):
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+# Ресурс перегружен: очередь полна или запрос не дождался места (503 с Retry-After)
+class Overloaded(Exception):
+    def __init__(self, resource: str, reason: str, retry_after: int):
+        super().__init__(f"Server is busy: {resource} {reason.replace('_', ' ')}, retry in {retry_after}s")
+        self.resource = resource
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# Клиент превысил лимит запросов (429 с Retry-After)
+class RateLimited(Exception):
+    def __init__(self, scope: str, retry_after: int):
+        super().__init__(f"Too many {scope} requests, retry in {retry_after}s")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+# Не больше capacity одновременных работ; ожидающие получают место по приоритету, внутри приоритета — по очереди.
+# Интерактивный запрос ждет не дольше queue_timeout и не встает в очередь длиннее max_queue,
+# фоновая работа ждет без предела: она не теряется, а только уступает место
+class PriorityLimiter:
+    def __init__(self, name: str, capacity: int, max_queue: int = 32, queue_timeout: float = 10.0):
+        self.name = name
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        # Среднее время занятия места (экспоненциальное), для оценки Retry-After
+        self._hold_seconds = 0.0
+        self.admitted = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+        self.rejected = {"queue_full": 0, "timeout": 0}
+        self._wait_total = dict.fromkeys(PRIORITY_NAMES.values(), 0.0)
+        self._wait_max = dict.fromkeys(PRIORITY_NAMES.values(), 0.0)
+
+    def queued(self, level: int | None = None) -> int:
+        return sum(
+            1 for waiter_level, _, future in self._waiters
+            if not future.done() and (level is None or waiter_level == level)
+        )
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self._hold_seconds * (self.queued() + 1) / self.capacity))
+
+    def _reject(self, reason: str):
+        self.rejected[reason] += 1
+        ADMISSION_REJECTED.labels(self.name, reason).inc()
+        raise Overloaded(self.name, reason, self.retry_after())
+
+    # Быстрый отказ до начала работы (например, до начала потокового ответа, когда статус еще можно вернуть)
+    def check(self, level: int):
+        if level == INTERACTIVE and self.active >= self.capacity and self.queued(INTERACTIVE) >= self.max_queue:
+            self._reject("queue_full")
+
+    async def acquire(self, level: int):
+        started = time.perf_counter()
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        if self.active < self.capacity and not self._waiters:
+            self.active += 1
+        else:
+            self.check(level)
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (level, next(self._sequence), future))
+            try:
+                await asyncio.wait_for(future, self.queue_timeout if level == INTERACTIVE else None)
+            except asyncio.TimeoutError:
+                self._reject("timeout")
+            except asyncio.CancelledError:
+                # Место могли передать одновременно с отменой — возвращаем его следующему
+                if future.done() and not future.cancelled():
+                    self.release()
+                raise
+        waited = time.perf_counter() - started
+        name = PRIORITY_NAMES[level]
+        self.admitted[name] += 1
+        self._wait_total[name] += waited
+        self._wait_max[name] = max(self._wait_max[name], waited)
+        ADMISSION_WAIT_SECONDS.labels(self.name, name).observe(waited)
+
+    # Освободившееся место сразу передается первому ожидающему, счетчик active не меняется
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, level: int | None = None):
+        level = current_priority() if level is None else level
+        await self.acquire(level)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * (time.perf_counter() - started)
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "active": self.active,
+            "queued": {name: self.queued(level) for level, name in PRIORITY_NAMES.items()},
+            "admitted": dict(self.admitted),
+            "rejected": dict(self.rejected),
+            "wait_avg_ms": {
+                name: self._wait_total[name] / self.admitted[name] * 1000 if self.admitted[name] else 0.0
+                for name in PRIORITY_NAMES.values()
+            },
+            "wait_max_ms": {name: wait * 1000 for name, wait in self._wait_max.items()},
+            "hold_avg_ms": self._hold_seconds * 1000,
+        }
+
+
+# Лимит запросов клиента: токен-бакет на клиента (burst запросов подряд, затем per_minute в минуту).
+# Бакеты давно не приходивших клиентов вытесняются сверх max_clients
+class RateLimiter:
+    def __init__(self, scope: str, per_minute: int, burst: int, max_clients: int = 10000):
+        self.scope = scope
+        self.per_minute = per_minute
+        self.burst = max(1, min(burst, per_minute)) if per_minute > 0 else 0
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self.limited = 0
+
+    def check(self, client: str):
+        if self.per_minute <= 0:
+            return
+        now = time.monotonic()
+        rate = self.per_minute / 60
+        tokens, updated = self._buckets.pop(client, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - updated) * rate)
+        if tokens < 1:
+            self._buckets[client] = (tokens, now)
+            self.limited += 1
+            ADMISSION_REJECTED.labels(self.scope, "rate_limited").inc()
+            raise RateLimited(self.scope, max(1, math.ceil((1 - tokens) / rate)))
+        self._buckets[client] = (tokens - 1, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"per_minute": self.per_minute, "burst": self.burst, "clients": len(self._buckets), "limited": self.limited}
+
+
+# Бюджеты и лимиты процесса по настройкам допуска
+class Admission:
+    def __init__(self, config: AdmissionSettings):
+        # Генерации в Ollama: сервер обрабатывает ограниченное число запросов параллельно, остальные лучше
+        # держать в нашей очереди (с приоритетом и таймаутом), чем копить на сервере
+        self.llm = PriorityLimiter(
+            "llm", config.LLM_MAX_CONCURRENT, config.ADMISSION_MAX_QUEUE, config.ADMISSION_QUEUE_TIMEOUT
+        )
+        # Задачи пула эмбеддингов: эмбеддинг вопроса /ask обгоняет пакеты загрузок и синхронизаций
+        self.embedding = PriorityLimiter(
+            "embedding", config.EMBEDDING_MAX_CONCURRENT, config.ADMISSION_MAX_QUEUE, config.ADMISSION_QUEUE_TIMEOUT
+        )
+        # Лимиты клиентов для вопросов и для загрузок
+        self.ask_rate = RateLimiter("ask", config.RATE_LIMIT_ASK_PER_MINUTE, config.RATE_LIMIT_BURST)
+        self.bulk_rate = RateLimiter("bulk", config.RATE_LIMIT_BULK_PER_MINUTE, config.RATE_LIMIT_BURST)
+
+    def stats(self) -> dict:
+        return {
+            "llm": self.llm.stats(),
+            "embedding": self.embedding.stats(),
+            "rate_limits": {"ask": self.ask_rate.stats(), "bulk": self.bulk_rate.stats()},
+        }
+
+
+_admission: Admission | None = None
+_admission_lock = threading.Lock()
+
+# Бюджеты создаются один раз на процесс: из настроек контейнера в lifespan или, если обращение
+# случилось раньше (бенчмарки без приложения), из глобальных настроек
+def get_admission(config: AdmissionSettings | None = None) -> Admission:
+    global _admission
+    if _admission is None:
+        with _admission_lock:
+            if _admission is None:
+                _admission = Admission(config or get_settings().admission)
+    return _admission
+
+
+def admission_stats() -> dict:
+    return get_admission().stats()
@@ -0,0 +1,7 @@
+# Бенчмарки запускаются без .env и не трогают данные приложения:
+# база Chroma и кэш эмбеддингов только в памяти, ключи Trello не нужны (используется FakeTrelloClient)
+import os
+
+os.environ.setdefault("CHROMA_PERSIST_DIR", "")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("TRELLO_BOARD_ID", "synthetic-board")
@@ -0,0 +1,133 @@
+# Бенчмарк допуска запросов. Первая часть: задержка эмбеддинга вопроса, пока пакетная загрузка занимает
+# пул эмбеддингов, — с приоритетом вопросов и без него (все задачи в одной очереди).
+# Вторая часть: всплеск вопросов к медленному LLM без бюджета генераций и с бюджетом, очередью и таймаутом:
+# сколько запросов отклонено сразу (503) и сколько ждали принятые.
+# Запуск из каталога app:
+#   python -m benchmarks.admission --bulk-workers 8 --queries 40 --burst 32
+import os
+
+# Кэш эмбеддингов отдавал бы повторы без модели
+os.environ.setdefault("EMBEDDING_CACHE_SIZE", "0")
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import httpx
+from admission import BULK, INTERACTIVE, Overloaded, PriorityLimiter, priority
+from benchmarks.fake_ollama import FakeOllamaServer
+from config import settings
+from executors import run_embedding
+from services.ollama_client import OllamaClient
+
+WORDS = "задача колонка дедлайн ответственный описание комментарий релиз баг ревью тест деплой".split()
+
+
+def make_texts(count: int, rng: random.Random) -> list[str]:
+    return [" ".join(rng.choices(WORDS, k=rng.randint(20, 60))) + f" {rng.random()}" for _ in range(count)]
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def summary(latencies: list[float]) -> dict:
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+
+# Вопросы с приоритетом query_level на фоне bulk_workers загрузчиков, шлющих пакеты по batch_size текстов
+async def embedding_under_load(args, query_level: int) -> dict:
+    embedding_function = settings.chroma_db.embedding_function
+    rng = random.Random(args.seed)
+    stop = asyncio.Event()
+    bulk_batches = 0
+
+    async def loader():
+        nonlocal bulk_batches
+        with priority(BULK):
+            while not stop.is_set():
+                await run_embedding(embedding_function, make_texts(args.batch_size, rng))
+                bulk_batches += 1
+
+    loaders = [asyncio.create_task(loader()) for _ in range(args.bulk_workers)]
+    # Даем загрузке занять пул
+    await asyncio.sleep(0.5)
+    latencies = []
+    with priority(query_level):
+        for _ in range(args.queries):
+            started = time.perf_counter()
+            await run_embedding(embedding_function, make_texts(1, rng))
+            latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(args.query_interval)
+    stop.set()
+    await asyncio.gather(*loaders)
+    return {**summary(latencies), "bulk_batches": bulk_batches}
+
+
+# Всплеск из burst вопросов к LLM; limiter=None — все сразу идут в Ollama
+async def llm_burst(args, base_url: str, limiter: PriorityLimiter | None) -> dict:
+    latencies, rejected = [], {"queue_full": 0, "timeout": 0}
+    async with httpx.AsyncClient(timeout=120.0, limits=httpx.Limits(max_connections=args.burst)) as http_client:
+        llm = OllamaClient(http_client, "fake", base_url)
+
+        async def ask():
+            started = time.perf_counter()
+            try:
+                if limiter is None:
+                    await llm.ainvoke("Какие задачи в процессе?")
+                else:
+                    async with limiter.slot(INTERACTIVE):
+                        await llm.ainvoke("Какие задачи в процессе?")
+            except Overloaded as e:
+                rejected[e.reason] += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(ask() for _ in range(args.burst)))
+        elapsed = time.perf_counter() - started
+    return {"answered": summary(latencies), "rejected": rejected, "seconds": elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Priority and load-shedding benchmark for LLM and embedding budgets")
+    parser.add_argument("--bulk-workers", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=40)
+    parser.add_argument("--query-interval", type=float, default=0.05)
+    parser.add_argument("--burst", type=int, default=32, help="Concurrent questions to the LLM")
+    parser.add_argument("--llm-concurrency", type=int, default=2)
+    parser.add_argument("--llm-queue", type=int, default=8)
+    parser.add_argument("--llm-timeout", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Загружаем модель до замеров
+    settings.chroma_db.embedding_function.warm_up()
+    result = {
+        "embedding_budget": settings.admission.EMBEDDING_MAX_CONCURRENT,
+        "query_embedding_fifo": asyncio.run(embedding_under_load(args, BULK)),
+        "query_embedding_priority": asyncio.run(embedding_under_load(args, INTERACTIVE)),
+    }
+    # Ollama генерирует parallel ответов одновременно, лишние запросы ждут в его очереди без таймаута
+    with FakeOllamaServer(
+        tokens=20, first_token_delay=0.2, token_delay=0.01, parallel=args.llm_concurrency
+    ) as server:
+        result["llm_unbounded"] = asyncio.run(llm_burst(args, server.base_url, None))
+        limiter = PriorityLimiter("llm", args.llm_concurrency, args.llm_queue, args.llm_timeout)
+        result["llm_admission"] = asyncio.run(llm_burst(args, server.base_url, limiter))
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
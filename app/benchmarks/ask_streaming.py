@@ -0,0 +1,55 @@
+# Бенчмарк времени до первого токена: потоковая генерация против ожидания полного ответа
+# Запуск из каталога app:
+#   python -m benchmarks.ask_streaming --runs 10
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import httpx
+from benchmarks.fake_ollama import FakeOllamaServer
+from services.ollama_client import OllamaClient
+
+PROMPT = "Какие задачи в процессе?"
+
+async def measure(llm: OllamaClient, runs: int) -> dict:
+    full, first_token, stream_total = [], [], []
+    for _ in range(runs):
+        # Текущий путь /ask: пользователь видит ответ только после полной генерации
+        started = time.perf_counter()
+        await llm.ainvoke(PROMPT)
+        full.append(time.perf_counter() - started)
+
+        # Путь /ask_stream: первый токен доступен сразу после начала генерации
+        started = time.perf_counter()
+        first = None
+        async for _ in llm.astream(PROMPT):
+            if first is None:
+                first = time.perf_counter() - started
+        stream_total.append(time.perf_counter() - started)
+        first_token.append(first)
+    return {
+        "runs": runs,
+        "ainvoke_first_visible_ms": statistics.median(full) * 1000,
+        "astream_ttft_ms": statistics.median(first_token) * 1000,
+        "astream_total_ms": statistics.median(stream_total) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Time-to-first-token benchmark against a fake Ollama server")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    async def run(base_url: str) -> dict:
+        async with httpx.AsyncClient(timeout=30.0) as http_client:
+            return await measure(OllamaClient(http_client, "fake", base_url), args.runs)
+
+    with FakeOllamaServer(args.tokens, args.first_token_delay, args.token_delay) as server:
+        result = asyncio.run(run(server.base_url))
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# Задержка /ask на фоне массовой загрузки: p50/p95 вопросов без нагрузки, во время непрерывной
+# синхронизации доски (каждый проход меняет все карточки, поэтому они заново режутся и эмбеддятся)
+# и во время непрерывного /ingest. Приложение работает целиком (TestClient), Trello — FakeTrelloClient
+# с синтетической доской, Ollama — FakeOllamaServer; кэш ответов и лимиты клиентов выключены.
+# Запуск из каталога app:
+#   python -m benchmarks.ask_under_load --cards 500 --queries 50
+import os
+
+os.environ.setdefault("SYNC_JOBS_PATH", "")
+# Синхронизация и вебхуки требуют ключ и токен Trello; запросы уходят в FakeTrelloClient, поэтому подойдут любые
+os.environ.setdefault("TRELLO_API_KEY", "fake-key")
+os.environ.setdefault("TRELLO_TOKEN", "fake-token")
+os.environ.setdefault("WARMUP_ON_START", "false")
+os.environ.setdefault("ANSWER_CACHE_SIZE", "0")
+os.environ.setdefault("EMBEDDING_CACHE_SIZE", "0")
+os.environ.setdefault("RATE_LIMIT_ASK_PER_MINUTE", "0")
+os.environ.setdefault("RATE_LIMIT_BULK_PER_MINUTE", "0")
+
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from datetime import datetime, timezone
+from benchmarks.fake_ollama import FakeOllamaServer
+from benchmarks.fake_trello import FakeTrelloClient
+from benchmarks.synthetic_board import _sentence, make_board, make_queries
+
+# Корень репозитория: main монтирует каталог static относительно текущего каталога
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def latency_summary(latencies: list[float]) -> dict:
+    if not latencies:
+        return {"count": 0}
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "p50_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+# Фоновая нагрузка в отдельном потоке: step() повторяется, пока идут вопросы
+class BackgroundLoad:
+    def __init__(self, step):
+        self.step = step
+        self.steps = 0
+        self.error: str | None = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.step()
+            except Exception as e:
+                self.error = str(e)
+                return
+            self.steps += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run(args) -> dict:
+    from fastapi.testclient import TestClient
+    os.chdir(ROOT_DIR)
+    import main
+
+    rng = random.Random(args.seed)
+    board = make_board(args.cards, seed=args.seed, board_id=os.environ["TRELLO_BOARD_ID"])
+    queries = [query["query"] for query in make_queries(board, args.queries)]
+    fake = FakeTrelloClient(board)
+    with TestClient(main.app) as client:
+        main.app.state.container.trello_client = fake
+
+        def full_sync():
+            job = client.post("/assistant/load_trello").json()
+            while job["status"] in ("queued", "running"):
+                time.sleep(0.02)
+                job = client.get(f"/assistant/sync_jobs/{job['job_id']}").json()
+            if job["status"] != "completed":
+                raise RuntimeError(f"Sync failed: {job['error']}")
+
+        # Каждый проход меняет описание и время активности всех карточек — синхронизация пересчитывает все
+        def changed_sync():
+            now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+            for card in board["cards"]:
+                card["desc"] = _sentence(rng) + " " + card["desc"]
+                card["dateLastActivity"] = now
+            full_sync()
+
+        def ingest_batch():
+            lines = [
+                json.dumps({"name": f"Заметка {rng.random()}", "text": " ".join(_sentence(rng) for _ in range(8))},
+                           ensure_ascii=False)
+                for _ in range(args.ingest_batch)
+            ]
+            response = client.post(
+                "/assistant/ingest", content="\n".join(lines).encode("utf-8"),
+                headers={"content-type": "application/x-ndjson"},
+            )
+            if response.status_code != 200:
+                raise RuntimeError(f"Ingest failed: {response.status_code} {response.text}")
+
+        def ask_all() -> dict:
+            latencies, rejected = [], 0
+            for query in queries:
+                started = time.perf_counter()
+                response = client.post("/assistant/ask", json={"query": query})
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    rejected += 1
+                time.sleep(args.query_interval)
+            return {**latency_summary(latencies), "rejected": rejected}
+
+        started = time.perf_counter()
+        full_sync()
+        result = {"cards": args.cards, "queries": len(queries), "initial_sync_seconds": time.perf_counter() - started}
+        # Первые вопросы загружают модель и BM25-индекс, в замеры они не попадают
+        for query in queries[:3]:
+            client.post("/assistant/ask", json={"query": query})
+
+        result["idle"] = ask_all()
+        with BackgroundLoad(changed_sync) as load:
+            result["during_sync"] = {**ask_all(), "syncs_completed": load.steps}
+        result["during_sync"]["load_error"] = load.error
+        with BackgroundLoad(ingest_batch) as load:
+            result["during_ingest"] = {**ask_all(), "ingest_batches": load.steps}
+        result["during_ingest"]["load_error"] = load.error
+        for phase in ("during_sync", "during_ingest"):
+            if result["idle"]["count"] and result[phase]["count"]:
+                result[phase]["p95_vs_idle"] = result[phase]["p95_ms"] / result["idle"]["p95_ms"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/ask latency with and without a concurrent sync or ingest")
+    parser.add_argument("--cards", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--query-interval", type=float, default=0.02, help="Pause between questions, seconds")
+    parser.add_argument("--ingest-batch", type=int, default=200, help="Documents per /ingest request")
+    parser.add_argument("--llm-first-token-delay", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with FakeOllamaServer(tokens=20, first_token_delay=args.llm_first_token_delay, token_delay=0.002) as server:
+        os.environ["OLLAMA_BASE_URL"] = server.base_url
+        result = run(args)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Бенчмарк нарезки и загрузки длинных документов
+# Запуск из каталога app:
+#   python -m benchmarks.chunking --docs 200 --sentences 120
+import argparse
+import json
+import random
+import time
+from sentence_transformers import SentenceTransformer
+from services.chunker import TextChunker
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+WORDS = "задача колонка дедлайн ответственный описание комментарий релиз баг ревью тест деплой клиент".split()
+
+# Длинные документы из случайных предложений
+def make_documents(count: int, sentences: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [
+        " ".join(" ".join(rng.choices(WORDS, k=rng.randint(5, 20))).capitalize() + "." for _ in range(sentences))
+        for _ in range(count)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunking and ingest throughput benchmark")
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--sentences", type=int, default=120, help="Sentences per document")
+    parser.add_argument("--max-tokens", type=int, default=200)
+    parser.add_argument("--overlap", type=int, default=30)
+    args = parser.parse_args()
+
+    model = SentenceTransformer(MODEL_NAME)
+    count_tokens = lambda text: len(model.tokenizer.encode(text, add_special_tokens=False))
+    chunker = TextChunker(count_tokens, max_tokens=args.max_tokens, overlap_tokens=args.overlap)
+    documents = make_documents(args.docs, args.sentences)
+    model.encode(documents[:2])
+
+    started = time.perf_counter()
+    chunked = [chunker.chunk(document) for document in documents]
+    chunk_seconds = time.perf_counter() - started
+    chunk_texts = [chunk.text for chunks in chunked for chunk in chunks]
+
+    started = time.perf_counter()
+    model.encode(chunk_texts)
+    chunked_encode_seconds = time.perf_counter() - started
+
+    # Прежний путь: документ целиком, модель обрезает все после max_seq_length токенов
+    started = time.perf_counter()
+    model.encode(documents)
+    whole_encode_seconds = time.perf_counter() - started
+
+    doc_tokens = [count_tokens(document) for document in documents]
+    chunk_tokens = [count_tokens(text) for text in chunk_texts]
+    window = model.max_seq_length
+    print(json.dumps({
+        "documents": len(documents),
+        "chunks": len(chunk_texts),
+        "chunking_docs_per_s": len(documents) / chunk_seconds,
+        "chunked_ingest_docs_per_s": len(documents) / (chunk_seconds + chunked_encode_seconds),
+        "whole_ingest_docs_per_s": len(documents) / whole_encode_seconds,
+        "avg_doc_tokens": sum(doc_tokens) / len(doc_tokens),
+        "avg_chunk_tokens": sum(chunk_tokens) / len(chunk_tokens),
+        # Доля текста, которую модель видит при эмбеддинге документа целиком
+        "whole_doc_coverage": sum(min(tokens, window) for tokens in doc_tokens) / sum(doc_tokens),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# Бенчмарк холодного старта: время импорта модулей в свежем интерпретаторе, время до первого ответа
+# сервера (порт открыт, / отвечает), до готовности (/ready, модель и индекс прогреты) и первого запроса.
+# Каждый замер — отдельный процесс, поэтому кэши импорта и модели не переживают прогоны.
+# Запуск из каталога app:
+#   python -m benchmarks.cold_start --runs 3 [--lazy]
+import os
+
+# Контрольная точка задач синхронизации бенчмарку не нужна
+os.environ.setdefault("SYNC_JOBS_PATH", "")
+
+import argparse
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+from benchmarks.fake_ollama import FakeOllamaServer
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Сервер запускается из корня репозитория: там лежит каталог static
+ROOT_DIR = os.path.dirname(APP_DIR)
+
+# Что импортируем: модуль настроек, настройки целиком и приложение со всеми маршрутами
+IMPORTS = {
+    "config": "import config",
+    "settings": "import config; config.settings",
+    "main": "import main",
+}
+
+def import_seconds(statement: str) -> float:
+    code = f"import time; started = time.perf_counter(); {statement}; print(time.perf_counter() - started)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT_DIR, env={**os.environ, "PYTHONPATH": APP_DIR},
+        capture_output=True, text=True, check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+# Опрашиваем адрес, пока check не вернет True; None — не дождались за timeout
+def wait_for(client: httpx.Client, path: str, check, started: float, timeout: float) -> float | None:
+    while time.perf_counter() - started < timeout:
+        try:
+            if check(client.get(path)):
+                return time.perf_counter() - started
+        except httpx.TransportError:
+            pass
+        time.sleep(0.02)
+    return None
+
+def server_run(args, llm_url: str) -> dict:
+    port = free_port()
+    env = {**os.environ, "OLLAMA_BASE_URL": llm_url, "WARMUP_ON_START": "false" if args.lazy else "true"}
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", APP_DIR, "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR, env=env,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout) as client:
+            serving = wait_for(client, "/", lambda response: response.status_code == 200, started, args.timeout)
+            ready = wait_for(
+                client, "/ready",
+                lambda response: response.status_code == 200 or response.json()["warmup"]["status"] == "failed",
+                started, args.timeout,
+            )
+            readiness = client.get("/ready").json() if ready is not None else None
+            first_query = None
+            if readiness is not None and readiness["ready"]:
+                query_started = time.perf_counter()
+                client.post("/assistant/ask", json={"query": "Какие задачи в процессе?"}).raise_for_status()
+                first_query = time.perf_counter() - query_started
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        "serving_seconds": serving,
+        "ready_seconds": ready if readiness is not None and readiness["ready"] else None,
+        "first_query_seconds": first_query,
+        "warmup": readiness["warmup"] if readiness is not None else None,
+    }
+
+def median(values: list) -> float | None:
+    values = [value for value in values if value is not None]
+    return statistics.median(values) if values else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and cold start benchmark")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--lazy", action="store_true", help="Disable background warm-up (WARMUP_ON_START=false)")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds to wait for the server to become ready")
+    args = parser.parse_args()
+
+    imports = {name: median([import_seconds(statement) for _ in range(args.runs)]) for name, statement in IMPORTS.items()}
+    with FakeOllamaServer(tokens=5, first_token_delay=0.0, token_delay=0.0) as llm:
+        runs = [server_run(args, llm.base_url) for _ in range(args.runs)]
+    result = {
+        "runs": args.runs,
+        "warmup_on_start": not args.lazy,
+        "import_seconds": imports,
+        "serving_seconds": median([run["serving_seconds"] for run in runs]),
+        "ready_seconds": median([run["ready_seconds"] for run in runs]),
+        "first_query_seconds": median([run["first_query_seconds"] for run in runs]),
+        "last_warmup": runs[-1]["warmup"],
+    }
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
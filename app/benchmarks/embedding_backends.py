@@ -0,0 +1,128 @@
+# Бенчмарк движков эмбеддингов: время загрузки, скорость кодирования, пиковая память процесса (RSS)
+# и recall@k поиска по синтетической доске для каждого движка и формата хранения векторов.
+# Каждый движок — отдельный процесс, чтобы память и загруженные библиотеки не смешивались.
+# agreement@k — доля общих карточек в top-k с первым движком списка (обычно torch).
+# Запуск из каталога app (onnx и openvino требуют optimum[onnxruntime] / optimum[openvino]):
+#   python -m benchmarks.embedding_backends --cards 2000 --queries 200 \
+#       --backends torch onnx onnx:onnx/model_qint8_avx512_vnni.onnx openvino
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+from config import ChromaDB, LocalEmbeddingFunction
+from embedding_cache import STORAGE_DTYPES, dequantize, quantize
+from benchmarks.synthetic_board import make_board, make_queries
+
+
+# "onnx:onnx/model_qint8_avx512_vnni.onnx" -> ("onnx", "onnx/model_qint8_avx512_vnni.onnx")
+def parse_backend(spec: str) -> tuple[str, str]:
+    backend, _, model_file = spec.partition(":")
+    return backend, model_file
+
+
+def peak_rss_mb() -> float:
+    # В Linux ru_maxrss в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Индексы top-k документов для каждого вопроса; векторы нормализованы, поэтому косинус — скалярное произведение
+def top_k(queries: np.ndarray, documents: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ documents.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+# Замеры одного движка в текущем процессе
+def measure(args, spec: str) -> dict:
+    backend, model_file = parse_backend(spec)
+    board = make_board(args.cards, seed=args.seed)
+    ids = [f"card_{card['id']}" for card in board["cards"]]
+    texts = [f"{card['name']}\n{card['desc']}" for card in board["cards"]]
+    queries = make_queries(board, args.queries)
+    rss_before = peak_rss_mb()
+
+    embedding_function = LocalEmbeddingFunction(
+        ChromaDB.vector_model, batch_size=args.batch_size, batch_wait_ms=0, backend=backend, model_file=model_file
+    )
+    started = time.perf_counter()
+    embedding_function.warm_up()
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    documents = np.stack(embedding_function(texts))
+    encode_seconds = time.perf_counter() - started
+    query_vectors = np.stack(embedding_function([query["query"] for query in queries]))
+
+    position = {doc_id: i for i, doc_id in enumerate(ids)}
+    relevant = [{position[doc_id] for doc_id in query["relevant"]} for query in queries]
+    storage = {}
+    for dtype in STORAGE_DTYPES:
+        blobs = [quantize(vector, dtype) for vector in documents]
+        stored = np.stack([dequantize(blob, dtype) for blob in blobs])
+        found = top_k(query_vectors, stored, args.k)
+        storage[dtype] = {
+            "bytes_per_vector": len(blobs[0]),
+            f"recall@{args.k}": sum(bool(wanted & set(row)) for wanted, row in zip(relevant, found)) / len(queries),
+        }
+    return {
+        "backend": backend,
+        "model_file": model_file or None,
+        "dimension": int(documents.shape[1]),
+        "load_seconds": load_seconds,
+        "encode_seconds": encode_seconds,
+        "texts_per_s": len(texts) / encode_seconds,
+        "rss_before_mb": rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+        "model_rss_mb": peak_rss_mb() - rss_before,
+        "storage": storage,
+        "top_k": top_k(query_vectors, documents, args.k).tolist(),
+    }
+
+
+# Запускаем замер движка в отдельном процессе; ошибка загрузки (нет optimum) — в результат, а не падение
+def run_backend(args, spec: str) -> dict:
+    command = [
+        sys.executable, "-m", "benchmarks.embedding_backends", "--worker", spec,
+        "--cards", str(args.cards), "--queries", str(args.queries), "--k", str(args.k),
+        "--batch-size", str(args.batch_size), "--seed", str(args.seed),
+    ]
+    process = subprocess.run(command, capture_output=True, text=True)
+    if process.returncode != 0:
+        lines = process.stderr.strip().splitlines()
+        return {"backend": spec, "error": lines[-1] if lines else f"exit code {process.returncode}"}
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend throughput, memory and recall benchmark")
+    parser.add_argument(
+        "--backends", nargs="+", default=["torch", "onnx", "openvino"],
+        help="backend or backend:model_file, e.g. onnx:onnx/model_qint8_avx512_vnni.onnx",
+    )
+    parser.add_argument("--cards", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args, args.worker)))
+        return
+
+    results = [run_backend(args, spec) for spec in args.backends]
+    reference = next((result["top_k"] for result in results if "top_k" in result), None)
+    for result in results:
+        found = result.pop("top_k", None)
+        if found is not None:
+            result[f"agreement@{args.k}"] = sum(
+                len(set(row) & set(expected)) / args.k for row, expected in zip(found, reference)
+            ) / len(found)
+    print(json.dumps({"cards": args.cards, "queries": args.queries, "results": results}, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
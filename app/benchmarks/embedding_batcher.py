@@ -0,0 +1,73 @@
+# Бенчмарк микробатчинга эмбеддингов против вызова модели на каждый запрос
+# Запуск из каталога app:
+#   python -m benchmarks.embedding_batcher --clients 16 --requests 50
+import argparse
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sentence_transformers import SentenceTransformer
+from embedding_batcher import EmbeddingBatcher
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+WORDS = "задача колонка дедлайн ответственный описание комментарий релиз баг ревью тест деплой".split()
+
+# Случайные короткие запросы разной длины, похожие на вопросы к ассистенту
+def make_texts(count: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(3, 40))) for _ in range(count)]
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+# Гоняем clients параллельных клиентов, каждый шлет по одному тексту за вызов
+def run(encode, texts: list[str], clients: int) -> dict:
+    latencies = []
+
+    def call(text: str):
+        started = time.perf_counter()
+        encode([text])
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(call, texts))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(texts),
+        "throughput_rps": len(texts) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding micro-batching benchmark")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=50, help="Requests per client")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    model = SentenceTransformer(MODEL_NAME)
+    texts = make_texts(args.clients * args.requests)
+    # Прогрев модели
+    model.encode(texts[:8])
+
+    per_call = run(lambda batch: model.encode(batch), texts, args.clients)
+    batcher = EmbeddingBatcher(
+        lambda batch: model.encode(batch, batch_size=args.batch_size),
+        max_batch_size=args.batch_size,
+        max_wait_ms=args.wait_ms,
+    )
+    batched = run(batcher.encode, texts, args.clients)
+    batched["batcher"] = batcher.stats()
+    batcher.close()
+
+    print(json.dumps({"clients": args.clients, "per_call": per_call, "batched": batched}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Локальный фейковый сервер Ollama для бенчмарков без настоящей модели
+# Отдает /api/generate потоком NDJSON с заданной задержкой перед первым и между токенами.
+# parallel > 0 — как OLLAMA_NUM_PARALLEL: столько генераций одновременно, остальные ждут на сервере
+import contextlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeOllamaServer:
+    def __init__(
+        self,
+        tokens: int = 50,
+        first_token_delay: float = 0.3,
+        token_delay: float = 0.02,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        parallel: int = 0,
+    ):
+        self.tokens = tokens
+        self.slots = threading.Semaphore(parallel) if parallel > 0 else contextlib.nullcontext()
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1, чтобы клиенты могли переиспользовать соединения
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                server.requests += 1
+                with server.slots:
+                    self.generate(body)
+
+            def generate(self, body: dict):
+                model = body.get("model", "")
+                # Детерминированный ответ: нумерованные токены
+                tokens = [f"t{i} " for i in range(server.tokens)]
+                time.sleep(server.first_token_delay)
+                if not body.get("stream", True):
+                    time.sleep(server.token_delay * len(tokens))
+                    payload = json.dumps({"model": model, "response": "".join(tokens), "done": True}).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in tokens:
+                    self.write_chunk(json.dumps({"model": model, "response": token, "done": False}).encode() + b"\n")
+                    time.sleep(server.token_delay)
+                final = {"model": model, "response": "", "done": True, "eval_count": len(tokens)}
+                self.write_chunk(json.dumps(final).encode() + b"\n")
+                self.write_chunk(b"")
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,79 @@
+# Фейковый клиент Trello: отвечает на fetch_json из записанной или синтетической доски без сети
+# и считает запросы, чтобы проверять число обращений загрузчика к API.
+# Записанная доска — JSON-экспорт доски Trello (id, lists, members, labels, cards, actions),
+# например benchmarks/fixtures/trello_board.json
+import json
+import re
+from urllib.parse import parse_qsl, urlsplit
+
+ACTIONS_PATH = re.compile(r"^/boards/(?P<board>[^/]+)(?:/(?P<resource>lists|members|labels|cards|actions))?$")
+CARD_PATH = re.compile(r"^/cards/(?P<card>[^/]+)(?P<actions>/actions)?$")
+
+
+class FakeTrelloClient:
+    def __init__(self, board: dict):
+        self.board = board
+        self.requests: list[tuple[str, dict]] = []
+        # Имитация недоступности Trello: запросы считаются, но падают с ошибкой соединения
+        self.unavailable = False
+
+    @classmethod
+    def from_fixture(cls, path: str) -> "FakeTrelloClient":
+        with open(path, encoding="utf-8") as fixture:
+            return cls(json.load(fixture))
+
+    @property
+    def request_count(self) -> int:
+        return len(self.requests)
+
+    def fetch_json(self, uri_path: str, http_method: str = "GET", query_params: dict | None = None, **kwargs):
+        query_params = query_params or {}
+        self.requests.append((uri_path, query_params))
+        if self.unavailable:
+            raise ConnectionError("Trello is unavailable")
+        if uri_path == "/batch":
+            return [self.batch_item(url) for url in query_params["urls"].split(",")]
+        match = ACTIONS_PATH.match(uri_path)
+        if not match or match["board"] != self.board["id"]:
+            raise KeyError(f"Unexpected Trello request: {uri_path}")
+        resource = match["resource"]
+        if resource is None:
+            return {"id": self.board["id"]}
+        if resource == "cards" and query_params.get("filter") == "open":
+            return [card for card in self.board["cards"] if not card.get("closed")]
+        if resource == "actions":
+            return self.page_actions(query_params)
+        if resource == "labels" and "labels" not in self.board:
+            # У синтетической доски метки есть только в карточках
+            labels = {label["id"]: label for card in self.board["cards"] for label in card.get("labels", [])}
+            return list(labels.values())
+        return self.board[resource]
+
+    # Ответ на один адрес из /batch в формате Trello: {"200": тело} или ошибка со statusCode
+    def batch_item(self, url: str) -> dict:
+        parts = urlsplit(url)
+        match = CARD_PATH.match(parts.path)
+        if not match:
+            raise KeyError(f"Unexpected Trello batch request: {url}")
+        card = next((card for card in self.board["cards"] if card["id"] == match["card"]), None)
+        if card is None:
+            return {"name": "NotFoundError", "message": "The requested resource was not found.", "statusCode": 404}
+        if not match["actions"]:
+            return {"200": {**card, "idBoard": self.board["id"]}}
+        params = dict(parse_qsl(parts.query))
+        actions = [
+            action for action in self.board["actions"]
+            if action["type"] == params.get("filter", action["type"]) and action["data"]["card"]["id"] == card["id"]
+        ]
+        return {"200": actions[:int(params.get("limit", 50))]}
+
+    # Постраничная выдача действий как в Trello: filter по типу, limit и before (ID последнего действия страницы)
+    def page_actions(self, query_params: dict) -> list[dict]:
+        actions = self.board["actions"]
+        if query_params.get("filter"):
+            actions = [action for action in actions if action["type"] == query_params["filter"]]
+        before = query_params.get("before")
+        if before:
+            ids = [action["id"] for action in actions]
+            actions = actions[ids.index(before) + 1:]
+        return actions[:int(query_params.get("limit", 50))]
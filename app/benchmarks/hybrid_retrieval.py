@@ -0,0 +1,103 @@
+# Бенчмарк гибридного поиска: задержка и recall векторного, BM25 и гибридного поиска
+# на синтетической доске с размеченными вопросами
+# Запуск из каталога app:
+#   python -m benchmarks.hybrid_retrieval --cards 2000 --queries 200 [--rerank-model cross-encoder/...]
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from config import settings
+from schemas import RetrievalOptions
+from services.chunker import TextChunker
+from db.collection_registry import BoardIndex
+from services.retriever import HybridRetriever
+from services.trello_sync import TrelloSyncEngine
+from benchmarks.fake_trello import FakeTrelloClient
+from benchmarks.synthetic_board import make_board, make_queries
+
+COLLECTION_NAME = "benchmark_hybrid_retrieval"
+
+MODES = {
+    "vector": RetrievalOptions(vector_weight=1.0, lexical_weight=0.0, rerank=False),
+    "lexical": RetrievalOptions(vector_weight=0.0, lexical_weight=1.0, rerank=False),
+    "hybrid": RetrievalOptions(vector_weight=1.0, lexical_weight=1.0, rerank=False),
+    "hybrid_rerank": RetrievalOptions(vector_weight=1.0, lexical_weight=1.0, rerank=True),
+}
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def evaluate(retriever: HybridRetriever, index: BoardIndex, queries: list[dict], embeddings, options, k: int) -> dict:
+    latencies, hits = [], []
+    by_kind: dict[str, list[int]] = {}
+    for query, embedding in zip(queries, embeddings):
+        started = time.perf_counter()
+        sources = await retriever.retrieve(query["query"], embedding, index, None, options)
+        latencies.append(time.perf_counter() - started)
+        found = int(any(source.id in query["relevant"] for source in sources[:k]))
+        hits.append(found)
+        by_kind.setdefault(query["kind"], []).append(found)
+    return {
+        f"recall@{k}": statistics.mean(hits),
+        "recall_by_kind": {kind: statistics.mean(values) for kind, values in sorted(by_kind.items())},
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+    }
+
+async def run(args) -> dict:
+    embedding_function = settings.chroma_db.embedding_function
+    client = settings.chroma_db.client
+    if COLLECTION_NAME in client.list_collections():
+        client.delete_collection(COLLECTION_NAME)
+    collection = client.create_collection(COLLECTION_NAME, embedding_function=embedding_function)
+
+    board = make_board(args.cards)
+    queries = make_queries(board, args.queries)
+    chunker = TextChunker(
+        embedding_function.count_tokens,
+        max_tokens=settings.chunking.CHUNK_MAX_TOKENS,
+        overlap_tokens=settings.chunking.CHUNK_OVERLAP_TOKENS,
+        model_max_tokens=embedding_function.max_tokens,
+    )
+    index = BoardIndex(board["id"], collection)
+    started = time.perf_counter()
+    engine = TrelloSyncEngine(collection, FakeTrelloClient(board), chunker=chunker, lexical_index=index.lexical_index)
+    await engine.sync(board["id"])
+    ingest_seconds = time.perf_counter() - started
+    # Индекс уже заполнен при загрузке, повторно из коллекции его не строим
+    index.lexical_index.loaded = True
+
+    reranker = None
+    if args.rerank_model:
+        from sentence_transformers import CrossEncoder
+        reranker = CrossEncoder(args.rerank_model)
+    retriever = HybridRetriever(reranker=reranker, n_results=args.k)
+    embeddings = embedding_function([query["query"] for query in queries])
+
+    results = {}
+    for mode, options in MODES.items():
+        if options.rerank and reranker is None:
+            continue
+        results[mode] = await evaluate(retriever, index, queries, embeddings, options, args.k)
+    return {
+        "cards": args.cards,
+        "chunks": collection.count(),
+        "queries": len(queries),
+        "ingest_seconds": ingest_seconds,
+        "modes": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector vs BM25 vs hybrid retrieval benchmark")
+    parser.add_argument("--cards", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3, help="Sources per answer (recall@k)")
+    parser.add_argument("--rerank-model", default="", help="CrossEncoder model for the rerank mode")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
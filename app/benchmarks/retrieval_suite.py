@@ -0,0 +1,220 @@
+# Сквозной бенчмарк качества и скорости: синтетическая доска Trello загружается через ChromaService,
+# размеченные вопросы проходят весь путь /ask_stream с детерминированной заглушкой вместо Ollama.
+# Результат — JSON, который можно сохранять и сравнивать между версиями.
+# Запуск из каталога app:
+#   python -m benchmarks.retrieval_suite --cards 1000 --queries 200 --output results/baseline.json
+#   python -m benchmarks.retrieval_suite --cards 1000 --baseline results/baseline.json
+import os
+
+# Кэш ответов выключен, чтобы повторы не искажали задержки (база и кэш эмбеддингов — см. benchmarks/__init__.py)
+os.environ.setdefault("ANSWER_CACHE_SIZE", "0")
+
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+from config import settings
+from container import AppContainer
+from schemas import RetrievalOptions
+from benchmarks.fake_ollama import FakeOllamaServer
+from benchmarks.fake_trello import FakeTrelloClient
+from benchmarks.synthetic_board import make_board, make_queries
+
+# Метрики, по которым сравниваем с базовым прогоном: (путь в JSON, больше — лучше)
+COMPARED_METRICS = [
+    (("ingest", "cards_per_s"), True),
+    (("ingest", "embedding_seconds"), False),
+    (("query", "total_ms", "p50"), False),
+    (("query", "total_ms", "p95"), False),
+    (("query", "total_ms", "p99"), False),
+    (("query", "retrieval_ms", "p95"), False),
+    (("quality", "mrr"), True),
+]
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def distribution(seconds: list[float]) -> dict:
+    return {f"p{q}": percentile(seconds, q) * 1000 for q in (50, 95, 99)}
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+# Считаем время модели эмбеддингов поверх кэша и батчера
+class EncodeTimer:
+    def __init__(self, embedding_function):
+        self.seconds = 0.0
+        self.texts = 0
+        encode = embedding_function.encode
+
+        def timed(texts):
+            started = time.perf_counter()
+            try:
+                return encode(texts)
+            finally:
+                self.seconds += time.perf_counter() - started
+                self.texts += len(texts)
+
+        embedding_function.encode = timed
+
+    def reset(self) -> tuple[float, int]:
+        measured = self.seconds, self.texts
+        self.seconds, self.texts = 0.0, 0
+        return measured
+
+async def ingest(container: AppContainer, board: dict, timer: EncodeTimer) -> dict:
+    index = await container.registry.get(board["id"])
+    trello_client = FakeTrelloClient(board)
+    started = time.perf_counter()
+    report = await container.service.add_trello_cards(index, trello_client)
+    elapsed = time.perf_counter() - started
+    embedding_seconds, embedded_texts = timer.reset()
+    return {
+        "seconds": elapsed,
+        "cards_per_s": len(board["cards"]) / elapsed,
+        "added": report.added,
+        "chunks": index.collection.count(),
+        "embedding_seconds": embedding_seconds,
+        "embedded_chunks": embedded_texts,
+        "trello_requests": trello_client.request_count,
+    }
+
+# Один вопрос через query_stream: источники по рангу, время до источников, до первого токена и полное
+async def ask(container: AppContainer, query: str, options: RetrievalOptions) -> dict:
+    index = await container.registry.get()
+    started = time.perf_counter()
+    timings, sources = {}, []
+    async for event in container.service.query_stream(query, index, options):
+        if event["event"] == "sources":
+            timings["retrieval"] = time.perf_counter() - started
+            sources = [source["id"] for source in event["sources"]]
+        elif event["event"] == "token" and "first_token" not in timings:
+            timings["first_token"] = time.perf_counter() - started
+        elif event["event"] == "error":
+            raise RuntimeError(event["detail"])
+    timings["total"] = time.perf_counter() - started
+    return {"sources": sources, **timings}
+
+async def evaluate(container: AppContainer, queries: list[dict], ks: list[int], timer: EncodeTimer) -> tuple[dict, dict]:
+    options = RetrievalOptions(n_results=max(ks))
+    # Прогрев: первая загрузка словаря доски и BM25-индекса не должна попадать в перцентили
+    await ask(container, queries[0]["query"], options)
+    timer.reset()
+
+    latencies = {"retrieval": [], "first_token": [], "total": []}
+    reciprocal_ranks, hits = [], {k: [] for k in ks}
+    by_kind: dict[str, list[float]] = {}
+    for query in queries:
+        result = await ask(container, query["query"], options)
+        for stage in latencies:
+            latencies[stage].append(result.get(stage, result["total"]))
+        rank = next((i for i, doc_id in enumerate(result["sources"], start=1) if doc_id in query["relevant"]), None)
+        reciprocal_rank = 1 / rank if rank else 0.0
+        reciprocal_ranks.append(reciprocal_rank)
+        by_kind.setdefault(query["kind"], []).append(reciprocal_rank)
+        for k in ks:
+            hits[k].append(int(rank is not None and rank <= k))
+    embedding_seconds, embedded_texts = timer.reset()
+
+    query_metrics = {
+        "count": len(queries),
+        "retrieval_ms": distribution(latencies["retrieval"]),
+        "first_token_ms": distribution(latencies["first_token"]),
+        "total_ms": distribution(latencies["total"]),
+        "embedding_ms_per_query": embedding_seconds / embedded_texts * 1000 if embedded_texts else 0.0,
+    }
+    quality = {
+        **{f"recall@{k}": sum(values) / len(values) for k, values in hits.items()},
+        "mrr": sum(reciprocal_ranks) / len(reciprocal_ranks),
+        "mrr_by_kind": {kind: sum(values) / len(values) for kind, values in sorted(by_kind.items())},
+    }
+    return query_metrics, quality
+
+def lookup(result: dict, path: tuple[str, ...]):
+    for key in path:
+        result = result.get(key) if isinstance(result, dict) else None
+    return result
+
+# Изменения ключевых метрик относительно сохраненного прогона; regression — стало хуже больше чем на tolerance
+def compare(result: dict, baseline: dict, tolerance: float) -> dict:
+    changes = {}
+    for path, higher_is_better in COMPARED_METRICS:
+        current, previous = lookup(result, path), lookup(baseline, path)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        changes[".".join(path)] = {
+            "baseline": previous,
+            "current": current,
+            "change": change,
+            "regression": (-change if higher_is_better else change) > tolerance,
+        }
+    return changes
+
+async def run(args) -> dict:
+    board = make_board(args.cards, seed=args.seed)
+    queries = make_queries(board, args.queries, seed=args.seed + 1)
+    ks = sorted({int(k) for k in args.k.split(",")})
+    with FakeOllamaServer(tokens=args.llm_tokens, first_token_delay=args.llm_delay_ms / 1000, token_delay=0.0) as llm:
+        settings.ollama.OLLAMA_BASE_URL = llm.base_url
+        container = AppContainer(settings)
+        timer = EncodeTimer(container.settings.chroma_db.embedding_function)
+        try:
+            ingest_metrics = await ingest(container, board, timer)
+            query_metrics, quality = await evaluate(container, queries, ks, timer)
+        finally:
+            await container.aclose()
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "cards": args.cards,
+            "queries": len(queries),
+            "seed": args.seed,
+            "embedding_model": settings.chroma_db.vector_model,
+            "llm_stub_delay_ms": args.llm_delay_ms,
+        },
+        "ingest": ingest_metrics,
+        "query": query_metrics,
+        "quality": quality,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality and latency benchmark on a synthetic Trello board")
+    parser.add_argument("--cards", type=int, default=1000, help="Synthetic board size (1k-100k)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", default="1,3,10", help="Comma-separated k values for recall@k")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-tokens", type=int, default=20, help="Tokens returned by the LLM stub")
+    parser.add_argument("--llm-delay-ms", type=float, default=0.0, help="LLM stub delay before the first token")
+    parser.add_argument("--output", default="", help="Write the JSON result to this file")
+    parser.add_argument("--baseline", default="", help="Previous JSON result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline:
+            result["comparison"] = compare(result, json.load(baseline), args.tolerance)
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output)
+    print(output)
+    if any(change["regression"] for change in result.get("comparison", {}).values()):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
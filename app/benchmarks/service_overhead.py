@@ -0,0 +1,58 @@
+# Бенчмарк накладных расходов на запрос: сервис и HTTP-клиент на каждый запрос против общих из контейнера
+# Запуск из каталога app:
+#   python -m benchmarks.service_overhead --requests 200
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import httpx
+from benchmarks.fake_ollama import FakeOllamaServer
+from db.chroma_repository import ChromaRepository
+from services.chroma_service import ChromaService
+from services.ollama_client import OllamaClient
+
+PROMPT = "Какие задачи в процессе?"
+
+# Прежняя схема: новый сервис, репозиторий (Agent) и HTTP-клиент без keep-alive на каждый запрос
+async def per_request(base_url: str, requests: int) -> list[float]:
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        async with httpx.AsyncClient(timeout=30.0) as http_client:
+            service = ChromaService(ChromaRepository(), OllamaClient(http_client, "fake", base_url), embedding_function=None)
+            await service.llm.ainvoke(PROMPT)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+# Новая схема: сервис и пул соединений созданы один раз
+async def shared(base_url: str, requests: int) -> list[float]:
+    latencies = []
+    async with httpx.AsyncClient(timeout=30.0, limits=httpx.Limits(max_keepalive_connections=10)) as http_client:
+        service = ChromaService(ChromaRepository(), OllamaClient(http_client, "fake", base_url), embedding_function=None)
+        for _ in range(requests):
+            started = time.perf_counter()
+            await service.llm.ainvoke(PROMPT)
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+def summary(latencies: list[float]) -> dict:
+    return {
+        "requests": len(latencies),
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": statistics.median(latencies) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request service and connection overhead benchmark")
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    # Фейковый Ollama отвечает сразу, поэтому измеряем только накладные расходы
+    with FakeOllamaServer(tokens=1, first_token_delay=0.0, token_delay=0.0) as server:
+        before = asyncio.run(per_request(server.base_url, args.requests))
+        after = asyncio.run(shared(server.base_url, args.requests))
+    print(json.dumps({"per_request": summary(before), "shared": summary(after)}, indent=2))
+
+if __name__ == "__main__":
+    main()
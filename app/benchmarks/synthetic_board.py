@@ -0,0 +1,86 @@
+# Синтетическая доска Trello и размеченные вопросы к ней для бенчмарков поиска
+import random
+from datetime import datetime, timedelta, timezone
+
+LISTS = ["Бэклог", "В процессе", "На ревью", "Тестирование", "Готово"]
+FIRST_NAMES = ["Иван", "Мария", "Алексей", "Ольга", "Дмитрий", "Анна", "Сергей", "Елена", "Павел", "Наталья"]
+LAST_NAMES = ["Петров", "Смирнова", "Кузнецов", "Попова", "Соколов", "Лебедева", "Козлов", "Новикова"]
+LABELS = ["Баг", "Фича", "Срочно", "Техдолг", "Дизайн"]
+VERBS = ["Починить", "Добавить", "Переписать", "Оптимизировать", "Проверить", "Обновить", "Удалить", "Настроить"]
+OBJECTS = [
+    "авторизацию", "экспорт отчетов", "импорт CSV", "push-уведомления", "платежный шлюз", "поиск по каталогу",
+    "личный кабинет", "корзину", "мобильное меню", "API заказов", "кэш профилей", "логирование ошибок",
+    "рассылку писем", "фильтры товаров", "интеграцию с CRM", "резервное копирование", "миграцию базы",
+]
+MODULES = ["web", "android", "ios", "backend", "admin", "billing", "search", "infra"]
+SENTENCE_WORDS = (
+    "нужно проверить сценарий пользователя после релиза падает запрос сервер возвращает ошибку "
+    "клиент жалуется на медленную загрузку страницы добавить тесты обновить документацию согласовать "
+    "с командой дизайн макет готов ждем ревью требуется доступ к стенду"
+).split()
+
+
+def _sentence(rng: random.Random) -> str:
+    return " ".join(rng.choices(SENTENCE_WORDS, k=rng.randint(6, 16))).capitalize() + "."
+
+
+def _iso(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+# Доска в формате ответов Trello API: lists, members, cards и действия-комментарии
+def make_board(cards: int, seed: int = 0, board_id: str = "synthetic-board") -> dict:
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    lists = [{"id": f"list{i}", "name": name} for i, name in enumerate(LISTS)]
+    members = [
+        {"id": f"member{i}", "fullName": f"{first} {last}", "username": f"user{i}"}
+        for i, (first, last) in enumerate((f, l) for f in FIRST_NAMES for l in LAST_NAMES[:2])
+    ]
+    labels = [{"id": f"label{i}", "name": name, "color": "green"} for i, name in enumerate(LABELS)]
+    card_list, actions = [], []
+    for i in range(cards):
+        card_id = f"card{i:06d}"
+        ticket = f"PROJ-{i + 1}"
+        due = now + timedelta(days=rng.randint(-20, 30)) if rng.random() < 0.7 else None
+        card_list.append({
+            "id": card_id,
+            "name": f"{ticket} {rng.choice(VERBS)} {rng.choice(OBJECTS)} ({rng.choice(MODULES)})",
+            "desc": " ".join(_sentence(rng) for _ in range(rng.randint(1, 6))),
+            "due": _iso(due) if due else None,
+            "dueComplete": bool(due and rng.random() < 0.3),
+            "idList": rng.choice(lists)["id"],
+            "idMembers": [member["id"] for member in rng.sample(members, rng.randint(0, 2))],
+            "labels": rng.sample(labels, rng.randint(0, 2)),
+            "dateLastActivity": _iso(now - timedelta(minutes=rng.randint(0, 100000))),
+            "closed": False,
+        })
+        for _ in range(rng.randint(0, 3)):
+            actions.append({
+                "id": f"action{len(actions):07d}",
+                "type": "commentCard",
+                "data": {"card": {"id": card_id}, "text": _sentence(rng)},
+            })
+    # Trello отдает действия от новых к старым
+    actions.reverse()
+    return {"id": board_id, "lists": lists, "members": members, "cards": card_list, "actions": actions}
+
+
+# Размеченные вопросы: текст, ID документов карточек, которые должны найтись, и тип вопроса
+def make_queries(board: dict, count: int, seed: int = 1) -> list[dict]:
+    rng = random.Random(seed)
+    lists = {item["id"]: item["name"] for item in board["lists"]}
+    members = {item["id"]: item["fullName"] for item in board["members"]}
+    queries = []
+    for card in rng.sample(board["cards"], min(count, len(board["cards"]))):
+        ticket, title = card["name"].split(" ", 1)
+        kind = rng.choice(["ticket", "title", "member"] if card["idMembers"] else ["ticket", "title"])
+        if kind == "ticket":
+            text = f"Что с задачей {ticket}?"
+        elif kind == "title":
+            text = f"Какой статус у задачи «{title}»?"
+        else:
+            member = members[rng.choice(card["idMembers"])]
+            text = f"Задача {member.split()[0]}а в колонке «{lists[card['idList']]}»: {title.split(' (')[0].lower()}"
+        queries.append({"query": text, "relevant": [f"card_{card['id']}"], "kind": kind})
+    return queries
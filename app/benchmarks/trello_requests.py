@@ -0,0 +1,105 @@
+# Число запросов к Trello API при загрузке доски. Снимок (колонки, участники, карточки, страницы
+# комментариев) и синхронизация в Chroma не должны зависеть от числа карточек: пока комментарии
+# помещаются в одну страницу actions, это 4 запроса на доску любого размера. Повторная синхронизация
+# без изменений не читает комментарии — 3 запроса.
+# Доски — записанная (JSON-экспорт Trello, по умолчанию benchmarks/fixtures/trello_board.json)
+# и синтетические на --cards карточек, Trello — FakeTrelloClient без сети.
+# --check завершает процесс с кодом 1, если число запросов отличается от ожидаемого.
+# Запуск из каталога app:
+#   python -m benchmarks.trello_requests --cards 10 100 500 --check
+#   python -m benchmarks.trello_requests --fixture board_export.json
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from config import settings
+from services.trello_loader import ACTIONS_PAGE_LIMIT, TrelloBoardLoader
+from services.trello_sync import TrelloSyncEngine
+from benchmarks.fake_trello import FakeTrelloClient
+from benchmarks.synthetic_board import make_board
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "trello_board.json")
+COLLECTION_NAME = "benchmark_trello_requests"
+# Повторная синхронизация без изменений: колонки, участники и карточки, комментарии не нужны
+UNCHANGED_SYNC_REQUESTS = 3
+
+
+# Колонки, участники и карточки — по запросу, комментарии — страницами по ACTIONS_PAGE_LIMIT
+def expected_requests(board: dict) -> int:
+    comments = sum(1 for action in board["actions"] if action["type"] == "commentCard")
+    return 3 + comments // ACTIONS_PAGE_LIMIT + 1
+
+
+def snapshot_requests(board: dict) -> int:
+    trello_client = FakeTrelloClient(board)
+    loader = TrelloBoardLoader(trello_client)
+    snapshot = loader.fetch_snapshot(board["id"])
+    loader.load_comments(snapshot)
+    return trello_client.request_count
+
+
+# Первая синхронизация в пустую коллекцию и повторная без изменений
+async def sync_requests(board: dict) -> dict:
+    client = settings.chroma_db.client
+    if COLLECTION_NAME in client.list_collections():
+        client.delete_collection(COLLECTION_NAME)
+    collection = client.create_collection(COLLECTION_NAME, embedding_function=settings.chroma_db.embedding_function)
+    result = {}
+    for run in ("sync", "resync"):
+        trello_client = FakeTrelloClient(board)
+        started = time.perf_counter()
+        await TrelloSyncEngine(collection, trello_client).sync(board["id"])
+        result[f"{run}_requests"] = trello_client.request_count
+        result[f"{run}_seconds"] = time.perf_counter() - started
+    result["documents"] = collection.count()
+    return result
+
+
+def measure(name: str, board: dict) -> dict:
+    return {
+        "board": name,
+        "cards": len(board["cards"]),
+        "comments": sum(1 for action in board["actions"] if action["type"] == "commentCard"),
+        "expected_requests": expected_requests(board),
+        "snapshot_requests": snapshot_requests(board),
+        **asyncio.run(sync_requests(board)),
+    }
+
+
+def check(results: list[dict]) -> list[str]:
+    failures = []
+    for result in results:
+        expected = {
+            "snapshot_requests": result["expected_requests"],
+            "sync_requests": result["expected_requests"],
+            "resync_requests": UNCHANGED_SYNC_REQUESTS,
+        }
+        for key, value in expected.items():
+            if result[key] != value:
+                failures.append(f"{result['board']}: {key} = {result[key]}, expected {value}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trello API requests per board snapshot and sync")
+    parser.add_argument("--fixture", default=FIXTURE, help="Trello board JSON export")
+    parser.add_argument("--cards", type=int, nargs="+", default=[10, 100, 500], help="Synthetic board sizes")
+    parser.add_argument("--check", action="store_true", help="Exit with code 1 if request counts differ")
+    args = parser.parse_args()
+
+    boards = [(os.path.basename(args.fixture), FakeTrelloClient.from_fixture(args.fixture).board)]
+    boards += [(f"synthetic-{cards}", make_board(cards)) for cards in args.cards]
+    results = [measure(name, board) for name, board in boards]
+    print(json.dumps({"results": results}, indent=2, ensure_ascii=False))
+    if args.check:
+        failures = check(results)
+        for failure in failures:
+            print(f"FAILED: {failure}", file=sys.stderr)
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+# Воспроизведение вебхуков Trello. Синтетический режим: по доске FakeTrelloClient генерируется поток событий
+# (комментарии, правки, переносы, удаления, новые карточки, переименование колонки, серии правок одной
+# карточки), события подписываются и отправляются в /assistant/trello_webhook приложения в этом процессе.
+# После обработки очереди проверяется, что документы всех карточек совпадают с доской, и время с числом
+# запросов к Trello сравнивается с полной перезагрузкой доски.
+# Затем Trello «отключается»: обновления должны повторяться с растущей паузой, а не в цикле, и после
+# WEBHOOK_MAX_RETRIES ошибок оставляться сверке, которая после восстановления догоняет доску.
+# С --check результаты проверяются утверждениями, при расхождении процесс завершается с кодом 1.
+# Режим записи: тела вебхуков, записанные приложением (WEBHOOK_RECORD_PATH), отправляются в запущенный сервер.
+# Запуск из каталога app:
+#   python -m benchmarks.webhook_replay --cards 500 --events 200 [--record webhooks.ndjson] [--check]
+#   python -m benchmarks.webhook_replay --payloads webhooks.ndjson --url http://localhost:8000 [--secret ...]
+import os
+
+# Подпись проверяется с известным секретом и адресом тестового клиента; сверка по таймеру не нужна
+os.environ.setdefault("SYNC_JOBS_PATH", "")
+# Синхронизация и вебхуки требуют ключ и токен Trello; запросы уходят в FakeTrelloClient, поэтому подойдут любые
+os.environ.setdefault("TRELLO_API_KEY", "fake-key")
+os.environ.setdefault("TRELLO_TOKEN", "fake-token")
+os.environ.setdefault("WARMUP_ON_START", "false")
+os.environ.setdefault("TRELLO_API_SECRET", "replay-secret")
+os.environ.setdefault("TRELLO_WEBHOOK_CALLBACK_URL", "http://testserver/assistant/trello_webhook")
+os.environ.setdefault("WEBHOOK_DEBOUNCE_SECONDS", "0.2")
+os.environ.setdefault("WEBHOOK_RECONCILE_SECONDS", "0")
+os.environ.setdefault("WEBHOOK_RETRY_BASE_SECONDS", "0.2")
+os.environ.setdefault("WEBHOOK_RETRY_MAX_SECONDS", "1.0")
+os.environ.setdefault("WEBHOOK_MAX_RETRIES", "3")
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+import httpx
+from benchmarks.fake_trello import FakeTrelloClient
+from benchmarks.synthetic_board import _sentence, make_board
+from services.trello_loader import BoardSnapshot
+from services.trello_sync import TRELLO_SOURCE, build_card_document, card_document_id, content_hash
+from services.trello_webhooks import webhook_signature
+
+WEBHOOK_PATH = "/assistant/trello_webhook"
+# Приложение монтирует каталог static относительно корня репозитория
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+# Генератор событий: меняет доску так же, как это сделал бы пользователь в Trello,
+# и возвращает тело вебхука в формате Trello для каждого изменения
+class EventGenerator:
+    def __init__(self, board: dict, seed: int):
+        self.board = board
+        self.rng = random.Random(seed)
+        self.count = 0
+
+    def payload(self, action_type: str, data: dict) -> dict:
+        self.count += 1
+        board_ref = {"id": self.board["id"], "name": "Synthetic board"}
+        return {
+            "model": board_ref,
+            "action": {
+                "id": f"replay{self.count:07d}",
+                "idMemberCreator": "member0",
+                "type": action_type,
+                "date": _now(),
+                "data": {**data, "board": board_ref},
+            },
+        }
+
+    def touch(self, card: dict) -> dict:
+        card["dateLastActivity"] = _now()
+        return {"id": card["id"], "name": card["name"]}
+
+    def comment(self, card: dict) -> dict:
+        text = _sentence(self.rng)
+        # Trello отдает действия от новых к старым
+        self.board["actions"].insert(0, {
+            "id": f"replay-comment{self.count:07d}", "type": "commentCard",
+            "data": {"card": {"id": card["id"]}, "text": text},
+        })
+        return self.payload("commentCard", {"card": self.touch(card), "text": text})
+
+    def rename(self, card: dict) -> dict:
+        old = card["name"]
+        card["name"] = f"{old.split(' (')[0]} ({self.rng.choice(['v2', 'срочно', 'после ревью'])})"
+        return self.payload("updateCard", {"card": self.touch(card), "old": {"name": old}})
+
+    def describe(self, card: dict) -> dict:
+        old = card["desc"]
+        card["desc"] = " ".join(_sentence(self.rng) for _ in range(self.rng.randint(1, 4)))
+        return self.payload("updateCard", {"card": self.touch(card), "old": {"desc": old}})
+
+    def move(self, card: dict) -> dict:
+        old = card["idList"]
+        card["idList"] = self.rng.choice([item["id"] for item in self.board["lists"] if item["id"] != old])
+        return self.payload("updateCard", {
+            "card": {**self.touch(card), "idList": card["idList"]},
+            "old": {"idList": old},
+            "listBefore": {"id": old},
+            "listAfter": {"id": card["idList"]},
+        })
+
+    def assign(self, card: dict) -> dict:
+        member = self.rng.choice(self.board["members"])
+        if member["id"] not in card["idMembers"]:
+            card["idMembers"].append(member["id"])
+        return self.payload("addMemberToCard", {
+            "card": self.touch(card), "idMember": member["id"], "member": {"id": member["id"], "name": member["fullName"]},
+        })
+
+    def delete(self, card: dict) -> dict:
+        self.board["cards"].remove(card)
+        return self.payload("deleteCard", {"card": {"id": card["id"]}, "list": {"id": card["idList"]}})
+
+    def create(self) -> dict:
+        number = len(self.board["cards"]) + self.count + 1
+        card = {
+            "id": f"replay-card{self.count:06d}",
+            "name": f"PROJ-{number} Новая задача {self.count}",
+            "desc": _sentence(self.rng),
+            "due": None,
+            "dueComplete": False,
+            "idList": self.board["lists"][0]["id"],
+            "idMembers": [],
+            "labels": [],
+            "dateLastActivity": _now(),
+            "closed": False,
+        }
+        self.board["cards"].append(card)
+        return self.payload("createCard", {"card": self.touch(card), "list": {"id": card["idList"]}})
+
+    def rename_list(self) -> dict:
+        item = self.rng.choice(self.board["lists"])
+        old = item["name"]
+        item["name"] = f"{old.split(' #')[0]} #{self.count}"
+        return self.payload("updateList", {"list": {"id": item["id"], "name": item["name"]}, "old": {"name": old}})
+
+    # Поток событий: серии из нескольких правок одной карточки подряд (их должна слить очередь)
+    def events(self, count: int, max_burst: int) -> list[dict]:
+        edits = [self.comment, self.rename, self.describe, self.move, self.assign]
+        events = []
+        while len(events) < count:
+            roll = self.rng.random()
+            if roll < 0.03:
+                events.append(self.rename_list())
+            elif roll < 0.08:
+                events.append(self.create())
+            elif roll < 0.12:
+                events.append(self.delete(self.rng.choice(self.board["cards"])))
+            else:
+                card = self.rng.choice(self.board["cards"])
+                for _ in range(self.rng.randint(1, max_burst)):
+                    events.append(self.rng.choice(edits)(card))
+        return events[:count]
+
+
+# Расхождения коллекции с доской: карточки без документа или с устаревшим текстом и документы лишних карточек
+def compare_with_board(collection, board: dict) -> dict:
+    snapshot = BoardSnapshot(board["id"], board["lists"], board["members"], board["cards"])
+    for action in board["actions"]:
+        snapshot.comments.setdefault(action["data"]["card"]["id"], []).append(action["data"]["text"])
+    stored = collection.get(where={"source": TRELLO_SOURCE}, include=["metadatas"])
+    hashes = {meta["parent_id"]: meta["content_hash"] for meta in stored["metadatas"]}
+    expected = {
+        card_document_id(card["id"]): content_hash(build_card_document(card, snapshot)) for card in board["cards"]
+    }
+    return {
+        "stale_documents": sum(1 for doc_id, text_hash in expected.items() if hashes.get(doc_id) != text_hash),
+        "orphan_documents": len(set(hashes) - set(expected)),
+    }
+
+
+def wait_for_queue(get_stats, timeout: float) -> float | None:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        stats = get_stats()
+        if not stats["pending_cards"] and not stats["pending_scopes"] and not stats["updating_boards"]:
+            return time.perf_counter() - started
+        time.sleep(0.05)
+    return None
+
+
+def post_events(client: httpx.Client, records: list[dict], speed: float) -> tuple[list[float], dict]:
+    latencies, statuses = [], {}
+    previous = None
+    for record in records:
+        if speed > 0 and previous is not None:
+            time.sleep(max(0.0, (record["received_at"] - previous) / speed))
+        previous = record["received_at"]
+        started = time.perf_counter()
+        response = client.post(
+            WEBHOOK_PATH, content=record["body"].encode("utf-8"),
+            headers={"Content-Type": "application/json", "X-Trello-Webhook": record["signature"]},
+        )
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    return latencies, statuses
+
+
+def latency_summary(latencies: list[float]) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "p50_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+    }
+
+
+def synthetic(args) -> dict:
+    from fastapi.testclient import TestClient
+    os.chdir(ROOT_DIR)
+    import main
+
+    board = make_board(args.cards, seed=args.seed)
+    fake = FakeTrelloClient(board)
+    secret = os.environ["TRELLO_API_SECRET"]
+    callback_url = os.environ["TRELLO_WEBHOOK_CALLBACK_URL"]
+    with TestClient(main.app) as client:
+        container = main.app.state.container
+        container.trello_client = fake
+        container.webhooks.trello_client = fake
+
+        def run_full_sync() -> float:
+            started = time.perf_counter()
+            job = client.post("/assistant/load_trello").json()
+            while job["status"] in ("queued", "running"):
+                time.sleep(0.05)
+                job = client.get(f"/assistant/sync_jobs/{job['job_id']}").json()
+            if job["status"] != "completed":
+                raise RuntimeError(f"Full sync failed: {job['error']}")
+            return time.perf_counter() - started
+
+        # Запись в формате WEBHOOK_RECORD_PATH
+        def sign(payload: dict) -> dict:
+            body = json.dumps(payload, ensure_ascii=False)
+            return {
+                "received_at": time.time(),
+                "callback_url": callback_url,
+                "signature": webhook_signature(secret, body.encode("utf-8"), callback_url),
+                "body": body,
+            }
+
+        run_full_sync()
+        generator = EventGenerator(board, args.seed + 1)
+        records = [sign(payload) for payload in generator.events(args.events, args.max_burst)]
+        if args.record:
+            with open(args.record, "w", encoding="utf-8") as file:
+                for record in records:
+                    file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        requests_before = fake.request_count
+        started = time.perf_counter()
+        latencies, statuses = post_events(client, records, speed=0)
+        drained = wait_for_queue(container.webhooks.stats, args.timeout)
+        webhook_seconds = time.perf_counter() - started
+        webhook_requests = fake.request_count - requests_before
+        index = container.registry.loaded(container.registry.default_board_id)
+        consistency = compare_with_board(index.collection, board)
+
+        # Для сравнения — полная перезагрузка доски, которую заменяют вебхуки (изменений уже нет)
+        requests_before = fake.request_count
+        full_seconds = run_full_sync()
+        full_requests = fake.request_count - requests_before
+
+        # Trello недоступен: считаем попытки обновления за время, пока они не будут оставлены сверке
+        webhooks = container.webhooks
+        fake.unavailable = True
+        requests_before, retries_before = fake.request_count, webhooks.counters["retries"]
+        outage_records = [sign(payload) for payload in generator.events(args.outage_events, 1)]
+        post_events(client, outage_records, speed=0)
+        outage_drained = wait_for_queue(webhooks.stats, args.timeout)
+        outage = {
+            "events": len(outage_records),
+            "update_attempts": webhooks.counters["retries"] - retries_before + 1,
+            "trello_requests": fake.request_count - requests_before,
+            "dropped_cards": webhooks.counters["dropped_cards"],
+            "gave_up": outage_drained is not None,
+        }
+        # Trello снова доступен: сверка находит карточки, оставленные очередью
+        fake.unavailable = False
+        client.portal.call(webhooks.reconcile)
+        outage["recovered"] = wait_for_queue(webhooks.stats, args.timeout) is not None
+        outage.update(compare_with_board(index.collection, board))
+        stats = client.get("/assistant/stats").json()["trello_webhooks"]
+
+    return {
+        "cards": args.cards,
+        "events": len(records),
+        "responses": statuses,
+        "post_latency": latency_summary(latencies),
+        "queue_drained": drained is not None,
+        "webhook_update_seconds": webhook_seconds,
+        "webhook_trello_requests": webhook_requests,
+        "full_reload_seconds": full_seconds,
+        "full_reload_trello_requests": full_requests,
+        **consistency,
+        "outage": outage,
+        "webhooks": {key: stats[key] for key in (
+            "accepted", "ignored", "coalesced", "batches", "cards_added", "cards_updated", "cards_unchanged",
+            "cards_removed", "errors", "retries", "dropped_cards", "reconciled_cards",
+        )},
+    }
+
+
+# Утверждения о результате синтетического прогона; возвращает список нарушенных
+def check_synthetic(result: dict, args) -> list[str]:
+    max_retries = int(os.environ["WEBHOOK_MAX_RETRIES"])
+    checks = {
+        "every webhook is accepted with 200": result["responses"] == {200: result["events"]},
+        "queue drains after the replay": result["queue_drained"],
+        "no card document is stale after the replay": result["stale_documents"] == 0,
+        "no document is left for deleted cards": result["orphan_documents"] == 0,
+        "repeated events of one card are coalesced": args.max_burst < 2 or result["webhooks"]["coalesced"] > 0,
+        "webhook updates need fewer Trello requests than reloading the board per event": (
+            result["webhook_trello_requests"] < result["events"] * result["full_reload_trello_requests"]
+        ),
+        "failed updates are retried with backoff, not in a loop": (
+            result["outage"]["update_attempts"] <= max_retries + 1
+        ),
+        "cards are left to reconciliation after the retries": (
+            result["outage"]["gave_up"] and result["outage"]["dropped_cards"] > 0
+        ),
+        "reconciliation catches up once Trello is back": (
+            result["outage"]["recovered"]
+            and result["outage"]["stale_documents"] == 0
+            and result["outage"]["orphan_documents"] == 0
+        ),
+    }
+    return [name for name, passed in checks.items() if not passed]
+
+
+def check_recorded(result: dict) -> list[str]:
+    checks = {
+        "every webhook is accepted with 200": result["responses"] == {200: result["events"]},
+        "queue drains after the replay": result["queue_drained"],
+        "no update errors": result["webhooks"]["errors"] == 0,
+    }
+    return [name for name, passed in checks.items() if not passed]
+
+
+def recorded(args) -> dict:
+    with open(args.payloads, encoding="utf-8") as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    if args.secret:
+        # Перед отправкой на другой адрес подписываем тела заново
+        for record in records:
+            callback_url = args.callback_url or f"{args.url.rstrip('/')}{WEBHOOK_PATH}"
+            record["signature"] = webhook_signature(args.secret, record["body"].encode("utf-8"), callback_url)
+    with httpx.Client(base_url=args.url, timeout=30.0) as client:
+        started = time.perf_counter()
+        latencies, statuses = post_events(client, records, args.speed)
+        drained = wait_for_queue(
+            lambda: client.get("/assistant/stats").json()["trello_webhooks"], args.timeout
+        )
+        seconds = time.perf_counter() - started
+        stats = client.get("/assistant/stats").json()["trello_webhooks"]
+    return {
+        "events": len(records),
+        "responses": statuses,
+        "post_latency": latency_summary(latencies),
+        "queue_drained": drained is not None,
+        "seconds": seconds,
+        "webhooks": stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay Trello webhook payloads and measure incremental updates")
+    parser.add_argument("--cards", type=int, default=500)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--max-burst", type=int, default=4, help="Edits of the same card in a row")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", help="Write the generated payloads in the WEBHOOK_RECORD_PATH format")
+    parser.add_argument("--payloads", help="Recorded payloads (NDJSON from WEBHOOK_RECORD_PATH) to send to --url")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--secret", help="Re-sign recorded payloads with this Trello app secret")
+    parser.add_argument("--callback-url", help="Callback URL for re-signing (default: --url + webhook path)")
+    parser.add_argument("--speed", type=float, default=0.0, help="Replay speed vs recorded timing, 0 — no pauses")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds to wait for the queue to drain")
+    parser.add_argument("--outage-events", type=int, default=20, help="Events sent while Trello is unavailable")
+    parser.add_argument("--check", action="store_true", help="Assert consistency and retry behaviour, exit 1 on failure")
+    args = parser.parse_args()
+
+    result = recorded(args) if args.payloads else synthetic(args)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.check:
+        failed = check_recorded(result) if args.payloads else check_synthetic(result, args)
+        for name in failed:
+            print(f"FAILED: {name}", file=sys.stderr)
+        if failed:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# Снимок и восстановление постоянного хранилища ChromaDB
+# Использование:
+#   python chroma_snapshot.py snapshot chroma_index.tar.gz
+#   python chroma_snapshot.py restore chroma_index.tar.gz [--force]
+# Снимок делается при остановленном сервисе, чтобы SQLite и HNSW-индексы были согласованы
+import argparse
+import os
+import shutil
+import tarfile
+# Загружаем .env, чтобы взять тот же путь хранилища, что и сервис
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Путь хранилища берем из той же переменной окружения, что и config.ChromaDB
+# (без импорта config, чтобы не загружать модель эмбеддингов)
+DEFAULT_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "chroma_data")
+
+# Упаковываем каталог хранилища в архив
+def snapshot(persist_directory: str, archive_path: str):
+    if not os.path.isdir(persist_directory):
+        raise SystemExit(f"Storage directory '{persist_directory}' does not exist")
+    with tarfile.open(archive_path, "w:gz") as archive:
+        archive.add(persist_directory, arcname=".")
+    print(f"Snapshot of '{persist_directory}' written to '{archive_path}'")
+
+# Распаковываем архив в каталог хранилища
+def restore(persist_directory: str, archive_path: str, force: bool = False):
+    if os.path.isdir(persist_directory) and os.listdir(persist_directory):
+        if not force:
+            raise SystemExit(f"Storage directory '{persist_directory}' is not empty, use --force to replace it")
+        shutil.rmtree(persist_directory)
+    os.makedirs(persist_directory, exist_ok=True)
+    with tarfile.open(archive_path, "r:gz") as archive:
+        archive.extractall(persist_directory, filter="data")
+    print(f"Snapshot '{archive_path}' restored to '{persist_directory}'")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot or restore the ChromaDB storage directory")
+    parser.add_argument("command", choices=["snapshot", "restore"])
+    parser.add_argument("archive", help="Path to the .tar.gz archive")
+    parser.add_argument("--path", default=DEFAULT_PERSIST_DIR, help="ChromaDB storage directory")
+    parser.add_argument("--force", action="store_true", help="Replace a non-empty storage directory on restore")
+    args = parser.parse_args()
+    if args.command == "snapshot":
+        snapshot(args.path, args.archive)
+    else:
+        restore(args.path, args.archive, args.force)
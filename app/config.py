@@ -4,31 +4,319 @@ from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
 # ChromaDB для векторного хранилища
 import chromadb
-from chromadb import Client
+from chromadb import Client, Collection, PersistentClient
+from chromadb.errors import InvalidCollectionException
 # Локальная модель для эмбеддингов
 from chromadb.utils import embedding_functions
-from sentence_transformers import SentenceTransformer
+# Кэш и микробатчинг эмбеддингов
+from embedding_cache import EmbeddingCache
+from embedding_batcher import EmbeddingBatcher
+from functools import cached_property
+import logging
+import threading
+import time
+import numpy as np
 # Для доступа к переменным окружения
 import os
 
-# Загружаем .env при запуске модуля
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# Кастомная функция эмбеддингов
+# Движки модели эмбеддингов: PyTorch или экспорт в ONNX Runtime / OpenVINO (нужен optimum)
+EMBEDDING_BACKENDS = ("torch", "onnx", "openvino")
+
+
+# Идентификатор модели для кэша: другой движок или файл весов (например, int8) дает немного другие векторы
+def embedding_model_id(model_name: str, backend: str = "torch", model_file: str = "") -> str:
+    if backend == "torch" and not model_file:
+        return model_name
+    return f"{model_name}:{backend}:{model_file or 'model'}"
+
+
+# Кастомная функция эмбеддингов; модель загружается при первом обращении или прогреве,
+# а не при создании настроек (импорт sentence_transformers и загрузка весов — секунды).
+# Векторы нормализуются и отдаются в Chroma массивами NumPy float32, без перевода в списки Python
 class LocalEmbeddingFunction(embedding_functions.EmbeddingFunction):
-    def __init__(self, model_name: str):
-        self.model = SentenceTransformer(model_name)
+    def __init__(
+        self,
+        model_name: str,
+        cache: EmbeddingCache | None = None,
+        batch_size: int = 64,
+        batch_wait_ms: float = 5.0,
+        backend: str = "torch",
+        model_file: str = "",
+    ):
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}', expected one of {', '.join(EMBEDDING_BACKENDS)}")
+        self.model_name = model_name
+        self.backend = backend
+        # Файл весов внутри репозитория модели, например onnx/model_qint8_avx512_vnni.onnx
+        self.model_file = model_file
+        self.batch_size = batch_size
+        self._model = None
+        self._model_lock = threading.Lock()
+        # Общий кэш для загрузки документов и запросов
+        self.cache = cache
+        # Параллельные вызовы объединяются в общие пакеты; batch_wait_ms=0 — кодируем сразу
+        self.batcher = None
+        if batch_wait_ms > 0:
+            self.batcher = EmbeddingBatcher(
+                self._encode,
+                max_batch_size=batch_size,
+                max_wait_ms=batch_wait_ms,
+            )
+
+    # Модель загружается один раз; параллельные обращения ждут первую загрузку
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    started = time.perf_counter()
+                    self._model = SentenceTransformer(
+                        self.model_name,
+                        backend=self.backend,
+                        model_kwargs={"file_name": self.model_file} if self.model_file else None,
+                    )
+                    logger.info(
+                        "Loaded embedding model %s (%s%s) in %.1fs", self.model_name, self.backend,
+                        f", {self.model_file}" if self.model_file else "", time.perf_counter() - started,
+                    )
+        return self._model
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    # Прогрев: загрузка модели и пробный проход, чтобы первый запрос не платил за инициализацию
+    def warm_up(self):
+        self._encode(["warm-up"])
+
+    # Один проход модели: матрица float32 из нормализованных векторов
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        return self.model.encode(
+            texts, batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True
+        ).astype(np.float32, copy=False)
+
+    # Кодирование без кэша: через общий пакет, если батчинг включен
+    def encode(self, texts: list[str]) -> list[np.ndarray]:
+        if self.batcher is not None:
+            return self.batcher.encode(list(texts))
+        return list(self._encode(list(texts)))
+
+    def __call__(self, texts) -> list[np.ndarray]:
+        if self.cache is None:
+            return self.encode(texts)
+        keys = [self.cache.key(text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Кодируем только тексты, которых нет в кэше (повторы внутри пакета — один раз)
+            unique = {}
+            for i in missing:
+                unique.setdefault(keys[i], texts[i])
+            started = time.perf_counter()
+            encoded = self.encode(list(unique.values()))
+            self.cache.record_encode(len(unique), time.perf_counter() - started)
+            self.cache.put_many(list(unique.keys()), list(encoded))
+            by_key = dict(zip(unique.keys(), encoded))
+            for i in missing:
+                vectors[i] = by_key[keys[i]]
+        return vectors
 
-    def __call__(self, texts):
-        return self.model.encode(texts).tolist()
+    # Размерность векторов модели
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    # Число токенов текста в токенизаторе модели (без служебных токенов)
+    def count_tokens(self, text: str) -> int:
+        return len(self.model.tokenizer.encode(text, add_special_tokens=False))
+
+    # Максимальная длина входа модели в токенах
+    def max_tokens(self) -> int:
+        return self.model.max_seq_length
 
 # Класс для API-ключей
 class Keys(BaseSettings):
     # Ключ Hugging Face больше не нужен, но оставим для совместимости
-    HUGGING_FACE_KEY: str = os.getenv("HUGGING_FACE_KEY", "")
-    # Ключ и токен Trello API
-    TRELLO_API_KEY: str = os.getenv("TRELLO_API_KEY")
-    TRELLO_TOKEN: str = os.getenv("TRELLO_TOKEN")
+    HUGGING_FACE_KEY: str = ""
+    # Ключ и токен Trello API (читаются из окружения при создании настроек). Без них работают /ask,
+    # /add_context и /ingest, а синхронизация и вебхуки Trello отвечают ошибкой
+    TRELLO_API_KEY: str | None = None
+    TRELLO_TOKEN: str | None = None
+
+    def trello_configured(self) -> bool:
+        return bool(self.TRELLO_API_KEY and self.TRELLO_TOKEN)
+
+# Класс для настройки LLM (Ollama)
+class OllamaSettings(BaseSettings):
+    # Адрес сервера Ollama
+    OLLAMA_BASE_URL: str = "http://localhost:11434"
+    # Имя модели
+    OLLAMA_MODEL: str = "llama3.2"
+    # Таймаут ожидания ответа LLM, секунды
+    OLLAMA_TIMEOUT: float = 120.0
+
+# Класс для настройки семантического кэша ответов
+class AnswerCacheSettings(BaseSettings):
+    # Максимум сохраненных ответов, 0 — кэш выключен
+    ANSWER_CACHE_SIZE: int = 256
+    # Время жизни ответа, секунды
+    ANSWER_CACHE_TTL: float = 3600.0
+    # Минимальное косинусное сходство вопросов для попадания в кэш
+    ANSWER_CACHE_THRESHOLD: float = 0.95
+
+# Класс для настройки нарезки документов на фрагменты
+class ChunkingSettings(BaseSettings):
+    # Максимальный размер фрагмента в токенах модели эмбеддингов (окно MiniLM — 256 токенов)
+    CHUNK_MAX_TOKENS: int = 200
+    # Перекрытие соседних фрагментов в токенах
+    CHUNK_OVERLAP_TOKENS: int = 30
+
+# Класс для настройки гибридного поиска
+class RetrievalSettings(BaseSettings):
+    # Сколько документов передать в промпт
+    RETRIEVAL_N_RESULTS: int = 3
+    # Веса векторного поиска и BM25 в reciprocal rank fusion
+    RETRIEVAL_VECTOR_WEIGHT: float = 1.0
+    RETRIEVAL_LEXICAL_WEIGHT: float = 1.0
+    # Константа k в формуле RRF: 1 / (k + rank)
+    RETRIEVAL_RRF_K: int = 60
+    # Модель кросс-энкодера для переранжирования, пустая строка — без переранжирования
+    RERANK_MODEL: str = ""
+    # Сколько лучших кандидатов переранжировать
+    RERANK_TOP_K: int = 20
+
+# Класс для настройки сборки промпта
+class PromptSettings(BaseSettings):
+    # Бюджет контекста (найденных фрагментов) в промпте, токены модели эмбеддингов
+    PROMPT_CONTEXT_TOKENS: int = 1200
+    # Сходство (Жаккар по шинглам из 3 слов), начиная с которого фрагмент считается повтором уже взятого
+    PROMPT_DUPLICATE_THRESHOLD: float = 0.8
+    # Оставлять у карточек только поля, о которых спрашивают
+    PROMPT_FILTER_FIELDS: bool = True
+
+# Класс для настройки фоновых задач синхронизации Trello
+class SyncJobSettings(BaseSettings):
+    # Файл контрольной точки задач, пустая строка — задачи только в памяти
+    SYNC_JOBS_PATH: str = "sync_jobs.json"
+    # Сколько завершенных задач хранить для запросов статуса
+    SYNC_JOBS_HISTORY: int = 50
+    # Сколько досок синхронизируется одновременно
+    SYNC_MAX_CONCURRENT: int = 2
+
+# Класс для настройки приема вебхуков Trello (/assistant/trello_webhook)
+class WebhookSettings(BaseSettings):
+    # Секрет приложения Trello (https://trello.com/app-key), им подписаны тела вебхуков; пустая строка — прием выключен
+    TRELLO_API_SECRET: str = ""
+    # Адрес, с которым зарегистрирован вебхук (входит в подпись); пустая строка — адрес входящего запроса
+    TRELLO_WEBHOOK_CALLBACK_URL: str = ""
+    # Пауза после последнего события карточки перед ее обновлением, секунды: серия правок — один пересчет
+    WEBHOOK_DEBOUNCE_SECONDS: float = 2.0
+    # Максимальная задержка обновления карточки при непрерывном потоке событий, секунды
+    WEBHOOK_MAX_DELAY_SECONDS: float = 30.0
+    # Карточек в одном пакете обновления (два запроса на карточку в /batch Trello)
+    WEBHOOK_BATCH_SIZE: int = 10
+    # Период сверки с Trello на случай пропущенных событий, секунды; 0 — без сверки
+    WEBHOOK_RECONCILE_SECONDS: float = 900.0
+    # Файл (NDJSON), куда записываются принятые вебхуки для воспроизведения; пустая строка — не записывать
+    WEBHOOK_RECORD_PATH: str = ""
+    # Пауза перед повтором обновления доски после ошибки (например, Trello недоступен), секунды;
+    # удваивается с каждой ошибкой подряд до WEBHOOK_RETRY_MAX_SECONDS
+    WEBHOOK_RETRY_BASE_SECONDS: float = 5.0
+    WEBHOOK_RETRY_MAX_SECONDS: float = 300.0
+    # Ошибок подряд, после которых карточки доски снимаются с очереди: их догонит сверка с Trello
+    WEBHOOK_MAX_RETRIES: int = 6
+
+# Класс для настройки массовой загрузки документов (/assistant/ingest)
+class IngestSettings(BaseSettings):
+    # Фрагментов в одном пакете эмбеддингов и upsert
+    INGEST_BATCH_SIZE: int = 64
+    # Максимальный размер раздела Markdown или текста, символы; длинные разделы делятся
+    INGEST_MAX_SECTION_CHARS: int = 8000
+    # Максимальная длина строки NDJSON, байты (строка с экспортом доски Trello бывает большой)
+    INGEST_MAX_LINE_BYTES: int = 16 * 1024 * 1024
+    # Максимальный размер файла экспорта Trello (.json читается целиком), байты
+    INGEST_MAX_JSON_BYTES: int = 64 * 1024 * 1024
+    # Сколько ошибок возвращать в отчете с подробностями
+    INGEST_MAX_ERRORS: int = 100
+
+# Класс для настройки допуска запросов: бюджеты LLM и эмбеддингов, приоритет /ask, лимиты клиентов
+class AdmissionSettings(BaseSettings):
+    # Одновременных генераций в Ollama (как OLLAMA_NUM_PARALLEL на сервере), остальные ждут в очереди
+    LLM_MAX_CONCURRENT: int = 2
+    # Одновременных задач в пуле эмбеддингов; очередь сверх них упорядочена по приоритету
+    EMBEDDING_MAX_CONCURRENT: int = 4
+    # Максимум вопросов в очереди к LLM или эмбеддингам, дальше — сразу 503
+    ADMISSION_MAX_QUEUE: int = 32
+    # Сколько вопрос ждет места, секунды, дольше — 503; загрузки и синхронизации ждут без предела
+    ADMISSION_QUEUE_TIMEOUT: float = 10.0
+    # Вопросов (/ask, /ask_stream) в минуту от одного клиента, 0 — без лимита
+    RATE_LIMIT_ASK_PER_MINUTE: int = 60
+    # Загрузок (/add_context, /ingest, /load_trello) в минуту от одного клиента, 0 — без лимита
+    RATE_LIMIT_BULK_PER_MINUTE: int = 20
+    # Сколько запросов клиент может отправить подряд, прежде чем сработает лимит в минуту
+    RATE_LIMIT_BURST: int = 10
+    # Заголовок с ID клиента (например, X-API-Key от прокси); пустая строка — IP-адрес клиента
+    RATE_LIMIT_CLIENT_HEADER: str = ""
+
+# Класс для настройки реестра коллекций по доскам
+class BoardRegistrySettings(BaseSettings):
+    # Через сколько секунд простоя выгружать индекс доски (BM25 и словарь) из памяти
+    BOARD_IDLE_SECONDS: float = 900.0
+    # Максимум одновременно открытых досок, самые давние сверх предела выгружаются
+    BOARD_MAX_OPEN: int = 32
+    # Дополнительные доски через запятую (кроме TRELLO_BOARD_ID), в которые можно загружать документы
+    # и задавать вопросы до первой синхронизации; остальные доски появляются после /load_trello
+    BOARD_IDS: str = ""
+
+    def board_ids(self) -> list[str]:
+        return [board_id.strip() for board_id in self.BOARD_IDS.split(",") if board_id.strip()]
+
+# Класс для настройки запуска приложения
+class StartupSettings(BaseSettings):
+    # Прогревать модель эмбеддингов, коллекцию и BM25-индекс доски по умолчанию в фоне после старта.
+    # False — все загружается при первом запросе, /ready сразу отвечает готовностью
+    WARMUP_ON_START: bool = True
+
+# Класс для настройки пулов HTTP-соединений (Ollama и Trello)
+class HttpPoolSettings(BaseSettings):
+    # Максимум одновременных соединений к одному бэкенду
+    HTTP_MAX_CONNECTIONS: int = 20
+    # Сколько соединений держать открытыми между запросами
+    HTTP_MAX_KEEPALIVE: int = 10
+    # Через сколько секунд простоя закрывать keep-alive соединение
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+
+# Класс для настройки пулов потоков под блокирующие операции
+class ExecutorSettings(BaseSettings):
+    # Потоки для задач с эмбеддингами; сама модель работает в потоке микробатчера,
+    # поэтому несколько потоков дают ему параллельные запросы для объединения
+    EMBEDDING_WORKERS: int = 4
+    # Максимум задач эмбеддинга в работе и очереди, остальные ждут свободного места
+    EMBEDDING_MAX_PENDING: int = 32
+    # Потоки для блокирующего I/O (Trello API, чтение и удаление в ChromaDB)
+    IO_WORKERS: int = 8
+    # Максимум I/O-задач в работе и очереди
+    IO_MAX_PENDING: int = 64
+
+# Класс для настройки эмбеддингов: кэш и микробатчинг
+class EmbeddingSettings(BaseSettings):
+    # Размер LRU-кэша в памяти (число векторов), 0 — кэш выключен
+    EMBEDDING_CACHE_SIZE: int = 10000
+    # Файл SQLite для дискового уровня кэша, пустая строка — только память
+    EMBEDDING_CACHE_PATH: str = "embedding_cache.sqlite3"
+    # Максимум текстов в одном проходе модели
+    EMBEDDING_BATCH_SIZE: int = 64
+    # Сколько ждать параллельные запросы перед проходом модели, 0 — без батчинга
+    EMBEDDING_BATCH_WAIT_MS: float = 5.0
+    # Движок модели: torch, onnx (ONNX Runtime) или openvino; для onnx и openvino нужен optimum
+    EMBEDDING_BACKEND: str = "torch"
+    # Файл весов в репозитории модели, пустая строка — по умолчанию для движка.
+    # Квантованная int8-модель: onnx/model_qint8_avx512_vnni.onnx или openvino/openvino_model_qint8_quantized.xml
+    EMBEDDING_MODEL_FILE: str = ""
+    # Формат векторов в кэше (память и SQLite): float32, float16 (вдвое меньше) или int8 (вчетверо)
+    EMBEDDING_STORAGE_DTYPE: str = "float32"
     
 # Класс для настройки ChromaDB
 class ChromaDB:
@@ -37,21 +325,138 @@ class ChromaDB:
     # Имя коллекции для данных Trello
     collection_name: str = "trello_assistant"
 
-    def __init__(self, hugging_face_key: str = None):  # hugging_face_key не используется
-        # Создаем клиент ChromaDB (локальная база)
-        self.client = Client()
+    def __init__(
+        self,
+        hugging_face_key: str = None,  # hugging_face_key не используется
+        embedding_settings: EmbeddingSettings | None = None,
+    ):
+        # Каталог постоянного хранилища; пустая строка — база только в памяти
+        self.persist_directory = os.getenv("CHROMA_PERSIST_DIR", "chroma_data")
+        # Предел памяти под индексы коллекций; при превышении Chroma выгружает давно не используемые (LRU).
+        # 0 — без предела
+        self.memory_limit_bytes = int(os.getenv("CHROMA_MEMORY_LIMIT_BYTES", "0"))
+        self._client = None
+        self._client_lock = threading.Lock()
+        # Настраиваем кэш эмбеддингов
+        embedding_settings = embedding_settings or EmbeddingSettings()
+        self.model_id = embedding_model_id(
+            self.vector_model, embedding_settings.EMBEDDING_BACKEND, embedding_settings.EMBEDDING_MODEL_FILE
+        )
+        # Повторные тексты получают векторы из кэша, поэтому в коллекцию попадают векторы в его формате
+        self.storage_dtype = "float32"
+        cache = None
+        if embedding_settings.EMBEDDING_CACHE_SIZE > 0:
+            self.storage_dtype = embedding_settings.EMBEDDING_STORAGE_DTYPE
+            cache = EmbeddingCache(
+                self.model_id,
+                max_items=embedding_settings.EMBEDDING_CACHE_SIZE,
+                path=embedding_settings.EMBEDDING_CACHE_PATH,
+                dtype=embedding_settings.EMBEDDING_STORAGE_DTYPE,
+            )
         # Настраиваем локальные эмбеддинги
-        self.embedding_function = LocalEmbeddingFunction(self.vector_model)
-        # Создаем или получаем коллекцию
-        self.collection = self.client.get_or_create_collection(
-            name=self.collection_name,
+        self.embedding_function = LocalEmbeddingFunction(
+            self.vector_model,
+            cache=cache,
+            batch_size=embedding_settings.EMBEDDING_BATCH_SIZE,
+            batch_wait_ms=embedding_settings.EMBEDDING_BATCH_WAIT_MS,
+            backend=embedding_settings.EMBEDDING_BACKEND,
+            model_file=embedding_settings.EMBEDDING_MODEL_FILE,
+        )
+
+    # Клиент ChromaDB создается при первом обращении: на диске, чтобы эмбеддинги переживали перезапуск
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    client_settings = chromadb.config.Settings()
+                    if self.memory_limit_bytes > 0:
+                        client_settings.chroma_segment_cache_policy = "LRU"
+                        client_settings.chroma_memory_limit_bytes = self.memory_limit_bytes
+                    self._client = (
+                        PersistentClient(path=self.persist_directory, settings=client_settings)
+                        if self.persist_directory
+                        else Client(client_settings)
+                    )
+        return self._client
+
+    # Коллекция доски по умолчанию (доски из реестра открываются через open_collection)
+    @cached_property
+    def collection(self) -> Collection:
+        return self.open_collection(self.collection_name)
+
+    # Метаданные коллекции записываются при создании и проверяются при открытии: модель, ее полный
+    # идентификатор (движок и файл весов), формат векторов кэша и размерность. Без размерности
+    # проверка не загружает модель (проверка при старте)
+    def collection_metadata(self, with_dimension: bool = True) -> dict:
+        metadata = {
+            "embedding_model": self.vector_model,
+            "embedding_model_id": self.model_id,
+            "embedding_storage_dtype": self.storage_dtype,
+        }
+        if with_dimension:
+            metadata["embedding_dimension"] = self.embedding_function.dimension()
+        return metadata
+
+    # Проверка всех сохраненных коллекций при старте: коллекция другой модели или другого движка
+    # останавливает запуск, а не первый запрос к доске
+    def validate_collections(self):
+        expected = self.collection_metadata(with_dimension=False)
+        for name in self.client.list_collections():
+            self.validate_collection(self.client.get_collection(name=name, embedding_function=self.embedding_function), expected)
+
+    # Существующая коллекция или None; ничего не создает
+    def find_collection(self, name: str) -> Collection | None:
+        try:
+            collection = self.client.get_collection(name=name, embedding_function=self.embedding_function)
+        except InvalidCollectionException:
+            return None
+        self.validate_collection(collection, self.collection_metadata())
+        return collection
+
+    # Создаем или получаем коллекцию и проверяем, что она построена той же моделью
+    def open_collection(self, name: str) -> Collection:
+        expected = self.collection_metadata()
+        collection = self.client.get_or_create_collection(
+            name=name,
             embedding_function=self.embedding_function,
+            metadata=expected,
         )
+        self.validate_collection(collection, expected)
+        return collection
+
+    # Проверяем, что сохраненная коллекция построена той же моделью, движком и форматом и той же размерности.
+    # Коллекции, созданные до записи идентификатора модели и формата, построены torch-моделью во float32
+    def validate_collection(self, collection: Collection, expected: dict):
+        stored = collection.metadata or {}
+        legacy = {"embedding_model_id": stored.get("embedding_model"), "embedding_storage_dtype": "float32"}
+        for key, value in expected.items():
+            actual = stored.get(key, legacy.get(key))
+            if actual is not None and actual != value:
+                raise RuntimeError(
+                    f"Collection '{collection.name}' in '{self.persist_directory}' was built with "
+                    f"{key}={actual!r}, but the configured value is {value!r}. "
+                    f"Restore a matching snapshot or remove the storage directory to rebuild the index."
+                )
 
 # Главный класс настроек
 class Settings(BaseSettings):
     # Объявляем поля с типами, необязательные с None по умолчанию
     keys: Keys | None = None
+    ollama: OllamaSettings | None = None
+    http_pool: HttpPoolSettings | None = None
+    answer_cache: AnswerCacheSettings | None = None
+    chunking: ChunkingSettings | None = None
+    retrieval: RetrievalSettings | None = None
+    prompt: PromptSettings | None = None
+    sync_jobs: SyncJobSettings | None = None
+    webhooks: WebhookSettings | None = None
+    startup: StartupSettings | None = None
+    ingest: IngestSettings | None = None
+    boards: BoardRegistrySettings | None = None
+    admission: AdmissionSettings | None = None
+    executors: ExecutorSettings | None = None
+    embedding: EmbeddingSettings | None = None
     chroma_db: ChromaDB | None = None
     trello_board_id: str
 
@@ -63,10 +468,55 @@ class Settings(BaseSettings):
         super().__init__(**data)
         # Инициализируем ключи, если не переданы
         self.keys = Keys() if self.keys is None else self.keys
-        # Инициализируем ChromaDB, если не передан
-        self.chroma_db = ChromaDB() if self.chroma_db is None else self.chroma_db
+        # Инициализируем настройки LLM, если не переданы
+        self.ollama = OllamaSettings() if self.ollama is None else self.ollama
+        # Инициализируем настройки пулов HTTP-соединений, если не переданы
+        self.http_pool = HttpPoolSettings() if self.http_pool is None else self.http_pool
+        # Инициализируем настройки кэша ответов, если не переданы
+        self.answer_cache = AnswerCacheSettings() if self.answer_cache is None else self.answer_cache
+        # Инициализируем настройки нарезки документов, если не переданы
+        self.chunking = ChunkingSettings() if self.chunking is None else self.chunking
+        # Инициализируем настройки поиска, если не переданы
+        self.retrieval = RetrievalSettings() if self.retrieval is None else self.retrieval
+        # Инициализируем настройки сборки промпта, если не переданы
+        self.prompt = PromptSettings() if self.prompt is None else self.prompt
+        # Инициализируем настройки фоновой синхронизации, если не переданы
+        self.sync_jobs = SyncJobSettings() if self.sync_jobs is None else self.sync_jobs
+        # Инициализируем настройки вебхуков Trello, если не переданы
+        self.webhooks = WebhookSettings() if self.webhooks is None else self.webhooks
+        # Инициализируем настройки запуска, если не переданы
+        self.startup = StartupSettings() if self.startup is None else self.startup
+        # Инициализируем настройки массовой загрузки, если не переданы
+        self.ingest = IngestSettings() if self.ingest is None else self.ingest
+        # Инициализируем настройки реестра досок, если не переданы
+        self.boards = BoardRegistrySettings() if self.boards is None else self.boards
+        # Инициализируем настройки допуска запросов, если не переданы
+        self.admission = AdmissionSettings() if self.admission is None else self.admission
+        # Инициализируем настройки пулов потоков, если не переданы
+        self.executors = ExecutorSettings() if self.executors is None else self.executors
+        # Инициализируем настройки эмбеддингов, если не переданы
+        self.embedding = EmbeddingSettings() if self.embedding is None else self.embedding
+        # Инициализируем ChromaDB (без загрузки модели и открытия базы), если не передан
+        self.chroma_db = ChromaDB(embedding_settings=self.embedding) if self.chroma_db is None else self.chroma_db
         # Устанавливаем trello_board_id из .env, если не передан
         self.trello_board_id = data.get("trello_board_id", os.getenv("TRELLO_BOARD_ID"))
 
-# Создаем глобальный объект настроек
-settings = Settings()
\ No newline at end of file
+_settings: Settings | None = None
+_settings_lock = threading.Lock()
+
+# Глобальный объект настроек создается при первом обращении: импорт модуля не читает .env
+def get_settings() -> Settings:
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                # Загружаем .env перед чтением переменных окружения
+                load_dotenv()
+                _settings = Settings()
+    return _settings
+
+# from config import settings продолжает работать и создает настройки при первом импорте имени
+def __getattr__(name: str):
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
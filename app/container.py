@@ -0,0 +1,245 @@
+# Контейнер приложения: сервис, LLM-клиент и пулы соединений создаются один раз на процесс
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager, suppress
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from fastapi import FastAPI
+from trello import TrelloClient
+# Импортируем настройки
+from config import Settings, get_settings
+# Сервис, репозиторий и клиент LLM
+from services.chroma_service import ChromaService
+from services.ollama_client import OllamaClient
+from services.answer_cache import AnswerCache
+from services.chunker import TextChunker
+from services.prompt_builder import PromptBuilder
+from services.retriever import HybridRetriever
+from services.sync_jobs import SyncJobManager
+from services.trello_loader import TrelloBoardLoader, TrelloNotConfigured
+from services.trello_sync import SyncProgress
+from services.trello_webhooks import TrelloWebhookProcessor
+from db.chroma_repository import ChromaRepository
+from db.collection_registry import CollectionRegistry
+# Пулы потоков и бюджеты допуска создаются вместе с контейнером и останавливаются при завершении
+from executors import configure_executors, run_embedding, run_io, shutdown_executors
+from admission import get_admission
+
+logger = logging.getLogger(__name__)
+
+# Все тяжелое (модель эмбеддингов, клиент ChromaDB, коллекции, кросс-энкодер) загружается лениво
+# или в фоновом прогреве, поэтому создание контейнера не задерживает старт сервера
+class AppContainer:
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        configure_executors(settings.executors)
+        get_admission(settings.admission)
+        pool = settings.http_pool
+        # Общий HTTP-клиент для Ollama с keep-alive
+        self.http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.ollama.OLLAMA_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=pool.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=pool.HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=pool.HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+        self.llm = OllamaClient(self.http_client, settings.ollama.OLLAMA_MODEL, settings.ollama.OLLAMA_BASE_URL)
+        # Сессия requests с пулом соединений для py-trello
+        self.trello_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool.HTTP_MAX_CONNECTIONS)
+        self.trello_session.mount("https://", adapter)
+        self.trello_client = TrelloClient(
+            api_key=settings.keys.TRELLO_API_KEY,
+            token=settings.keys.TRELLO_TOKEN,
+            http_service=self.trello_session,
+        )
+        # Нарезчик документов по токенам модели эмбеддингов, не длиннее ее окна
+        embedding_function = settings.chroma_db.embedding_function
+        self.chunker = TextChunker(
+            embedding_function.count_tokens,
+            max_tokens=settings.chunking.CHUNK_MAX_TOKENS,
+            overlap_tokens=settings.chunking.CHUNK_OVERLAP_TOKENS,
+            model_max_tokens=embedding_function.max_tokens,
+        )
+        # Коллекции досок (с BM25-индексами и словарями) открываются по первому запросу к доске
+        self.registry = CollectionRegistry(
+            settings.chroma_db.open_collection,
+            base_name=settings.chroma_db.collection_name,
+            default_board_id=settings.trello_board_id,
+            idle_seconds=settings.boards.BOARD_IDLE_SECONDS,
+            max_open=settings.boards.BOARD_MAX_OPEN,
+            find_collection=settings.chroma_db.find_collection,
+            board_ids=settings.boards.board_ids(),
+        )
+        self._evictor: asyncio.Task | None = None
+        # Гибридный поиск: BM25 по тем же фрагментам плюс необязательный кросс-энкодер
+        # (загружается при первом переранжировании, прогрев только делает это заранее)
+        retrieval = settings.retrieval
+        self.retriever = HybridRetriever(
+            rerank_model=retrieval.RERANK_MODEL,
+            n_results=retrieval.RETRIEVAL_N_RESULTS,
+            vector_weight=retrieval.RETRIEVAL_VECTOR_WEIGHT,
+            lexical_weight=retrieval.RETRIEVAL_LEXICAL_WEIGHT,
+            rrf_k=retrieval.RETRIEVAL_RRF_K,
+            rerank_top_k=retrieval.RERANK_TOP_K,
+        )
+        # Промпт в пределах бюджета токенов, считаем тем же токенизатором, что и размер фрагментов
+        self.prompt_builder = PromptBuilder(
+            embedding_function.count_tokens,
+            context_tokens=settings.prompt.PROMPT_CONTEXT_TOKENS,
+            duplicate_threshold=settings.prompt.PROMPT_DUPLICATE_THRESHOLD,
+            filter_fields=settings.prompt.PROMPT_FILTER_FIELDS,
+        )
+        self.repository = ChromaRepository(self.chunker, self.prompt_builder)
+        # Кэш ответов общий для всех запросов процесса
+        answer_cache = None
+        if settings.answer_cache.ANSWER_CACHE_SIZE > 0:
+            answer_cache = AnswerCache(
+                max_items=settings.answer_cache.ANSWER_CACHE_SIZE,
+                ttl_seconds=settings.answer_cache.ANSWER_CACHE_TTL,
+                similarity_threshold=settings.answer_cache.ANSWER_CACHE_THRESHOLD,
+            )
+        self.service = ChromaService(
+            self.repository,
+            self.llm,
+            embedding_function=embedding_function,
+            answer_cache=answer_cache,
+            chunker=self.chunker,
+            retriever=self.retriever,
+            prompt_builder=self.prompt_builder,
+        )
+        # Фоновые задачи синхронизации Trello с контрольной точкой на диске
+        self.sync_jobs = SyncJobManager(
+            self.sync_board,
+            path=settings.sync_jobs.SYNC_JOBS_PATH,
+            history=settings.sync_jobs.SYNC_JOBS_HISTORY,
+            max_concurrent=settings.sync_jobs.SYNC_MAX_CONCURRENT,
+        )
+        # Вебхуки Trello: обновляются только карточки из событий, сверка с Trello ловит пропущенные события
+        webhooks = settings.webhooks
+        self.webhooks = TrelloWebhookProcessor(
+            self.registry,
+            self.trello_client,
+            chunker=self.chunker,
+            on_change=self.service.invalidate_documents,
+            is_syncing=self.sync_jobs.is_active,
+            secret=webhooks.TRELLO_API_SECRET,
+            trello_configured=settings.keys.trello_configured(),
+            callback_url=webhooks.TRELLO_WEBHOOK_CALLBACK_URL,
+            debounce_seconds=webhooks.WEBHOOK_DEBOUNCE_SECONDS,
+            max_delay_seconds=webhooks.WEBHOOK_MAX_DELAY_SECONDS,
+            batch_size=webhooks.WEBHOOK_BATCH_SIZE,
+            reconcile_seconds=webhooks.WEBHOOK_RECONCILE_SECONDS,
+            record_path=webhooks.WEBHOOK_RECORD_PATH,
+            retry_base_seconds=webhooks.WEBHOOK_RETRY_BASE_SECONDS,
+            retry_max_seconds=webhooks.WEBHOOK_RETRY_MAX_SECONDS,
+            max_retries=webhooks.WEBHOOK_MAX_RETRIES,
+        )
+        # Ход фонового прогрева для /ready
+        self.warmup_enabled = settings.startup.WARMUP_ON_START
+        self.warmup_status = "pending" if self.warmup_enabled else "disabled"
+        self.warmup_error: str | None = None
+        self.warmup_timings: dict[str, float] = {}
+        self._warmup: asyncio.Task | None = None
+
+    # Пути, которые ходят в Trello, без ключа и токена сразу отвечают понятной ошибкой
+    def require_trello(self):
+        if not self.settings.keys.trello_configured():
+            raise TrelloNotConfigured()
+
+    # Синхронизация доски в ее коллекцию; индекс доски не выгружается, пока идет синхронизация
+    async def sync_board(self, board_id: str, progress: SyncProgress):
+        self.require_trello()
+        if not await run_io(self.registry.known, board_id):
+            # Коллекцию новой доски создаем, только если такая доска есть в Trello (иначе ошибка Trello API)
+            await run_io(TrelloBoardLoader(self.trello_client).fetch_json, f"/boards/{board_id}", {"fields": "id"})
+        async with self.registry.use(board_id, create=True) as index:
+            return await self.service.add_trello_cards(index, self.trello_client, progress)
+
+    # Этап прогрева с замером времени в секундах
+    async def _warm_up_stage(self, stage: str, fn, *args):
+        started = time.perf_counter()
+        result = await fn(*args)
+        self.warmup_timings[stage] = time.perf_counter() - started
+        return result
+
+    # Прогрев: модель эмбеддингов, коллекция и BM25-индекс доски по умолчанию, кросс-энкодер.
+    # Запросы, пришедшие раньше, не ждут прогрева целиком: каждый загружает то, что ему нужно, сам
+    async def warm_up(self):
+        self.warmup_status = "running"
+        started = time.perf_counter()
+        try:
+            embedding_function = self.settings.chroma_db.embedding_function
+            await self._warm_up_stage("embedding_model", run_embedding, embedding_function.warm_up)
+            if self.registry.default_board_id:
+                index = await self._warm_up_stage("collection", self.registry.get)
+                await self._warm_up_stage("lexical_index", self.retriever.ensure_lexical_index, index)
+            if self.retriever.rerank_model:
+                await self._warm_up_stage("reranker", self.retriever.ensure_reranker)
+        except Exception as e:
+            self.warmup_status = "failed"
+            self.warmup_error = str(e)
+            logger.error("Warm-up failed: %s", e)
+            return
+        self.warmup_status = "completed"
+        logger.info("Warm-up completed in %.1fs: %s", time.perf_counter() - started, self.warmup_timings)
+
+    # Готовность к запросам: прогрев завершен (или выключен), плюс что из тяжелых ресурсов уже загружено
+    def readiness(self) -> dict:
+        default_index = self.registry.loaded(self.registry.default_board_id) if self.registry.default_board_id else None
+        return {
+            "ready": self.warmup_status in ("completed", "disabled"),
+            "warmup": {
+                "status": self.warmup_status,
+                "error": self.warmup_error,
+                "seconds": self.warmup_timings,
+            },
+            "embedding_model": self.settings.chroma_db.embedding_function.loaded,
+            "collection": default_index is not None,
+            "lexical_index": default_index is not None and default_index.lexical_index.loaded,
+            "reranker": self.retriever.reranker is not None if self.settings.retrieval.RERANK_MODEL else None,
+        }
+
+    # Фоновая работа после старта: прогрев, продолжение прерванных синхронизаций, очередь вебхуков
+    # и выгрузка простаивающих досок
+    def start(self):
+        if self.warmup_enabled:
+            self._warmup = asyncio.create_task(self.warm_up())
+        self.sync_jobs.resume()
+        self.webhooks.start()
+        self._evictor = asyncio.create_task(self.registry.run_evictor())
+
+    async def aclose(self):
+        for task in (self._warmup, self._evictor):
+            if task is not None:
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        # Ожидающие события вебхуков теряются, их подберет сверка после перезапуска
+        await self.webhooks.aclose()
+        # Прерванные задачи остаются в контрольной точке и продолжатся при следующем запуске
+        await self.sync_jobs.aclose()
+        await self.http_client.aclose()
+        self.trello_session.close()
+        embedding_function = self.settings.chroma_db.embedding_function
+        if embedding_function.batcher is not None:
+            embedding_function.batcher.close()
+        shutdown_executors()
+
+# Lifespan FastAPI: настройки и контейнер создаются при старте, тяжелые ресурсы прогреваются в фоне,
+# поэтому сервер начинает принимать соединения сразу
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = get_settings()
+    # Коллекции другой модели эмбеддингов останавливают запуск сразу (модель для этого не загружается)
+    await run_io(settings.chroma_db.validate_collections)
+    container = AppContainer(settings)
+    app.state.container = container
+    container.start()
+    try:
+        yield
+    finally:
+        await container.aclose()
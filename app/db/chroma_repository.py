@@ -1,15 +1,36 @@
 # Импортируем ABC для создания абстрактного класса
 from abc import ABC, abstractmethod
+# Стабильный хэш содержимого для ID документов
+import hashlib
 # Импортируем тип коллекции ChromaDB
 from chromadb import Collection
 # Импортируем Agent для работы с LLM (Ollama)
 from pydantic_ai import Agent
+# Пулы потоков для блокирующих вызовов
+from executors import run_embedding, run_io
+# Нарезка длинных документов на фрагменты
+from services.chunker import Chunk, TextChunker, chunk_id
+# Индекс доски: коллекция и BM25-индекс, который поддерживается синхронно с ней
+from db.collection_registry import BoardIndex
+# Счетчик записанных фрагментов
+from metrics import DOCUMENTS
+# Сборка контекста промпта в пределах бюджета токенов
+from services.prompt_builder import PromptBuilder
+from schemas import SourceDocument
+
+# Метка источника в метаданных Chroma для текстов, добавленных через API
+CONTEXT_SOURCE = "context"
+
+# ID документа по очищенному тексту: sha256 одинаков между процессами (в отличие от hash()),
+# поэтому тот же текст после перезапуска попадает в те же записи
+def document_id(cleaned_text: str) -> str:
+    return f"doc_{hashlib.sha256(cleaned_text.encode('utf-8')).hexdigest()}"
 
 # Абстрактный интерфейс репозитория
 class AbstractRepository(ABC):
-    # Метод для добавления документа
+    # Метод для добавления документа: возвращает очищенный текст и False, если такой документ уже был
     @abstractmethod
-    async def add_document(self, document: str, collection: Collection) -> str:
+    async def add_document(self, document: str, index: BoardIndex) -> tuple[str, bool]:
         pass
 
     # Метод для выполнения запроса
@@ -19,23 +40,59 @@ class AbstractRepository(ABC):
 
 # Реализация репозитория для ChromaDB и LLM
 class ChromaRepository(AbstractRepository):
-    def __init__(self):
+    def __init__(self, chunker: TextChunker | None = None, prompt_builder: PromptBuilder | None = None):
         # Инициализируем Agent без параметров, полагаясь на конфигурацию по умолчанию
         self.agent = Agent()
+        # Без нарезчика документ хранится целиком
+        self.chunker = chunker
+        self.prompt_builder = prompt_builder or PromptBuilder()
+
+    # Документ с этим ID уже в коллекции: ID выводится из текста, а нарезка детерминирована,
+    # поэтому достаточно найти его первый фрагмент
+    def _exists(self, parent_id: str, index: BoardIndex) -> bool:
+        return bool(index.collection.get(ids=[chunk_id(parent_id, 0)], include=[])["ids"])
+
+    # Нарезка и добавление фрагментов; токенизация и эмбеддинги — CPU-работа, выполняется в пуле
+    def _add_chunks(self, cleaned_text: str, parent_id: str, index: BoardIndex):
+        chunks = self.chunker.chunk(cleaned_text) if self.chunker else [Chunk(cleaned_text, 0, 1)]
+        documents = [chunk.text for chunk in chunks]
+        ids = [chunk_id(parent_id, chunk.index) for chunk in chunks]
+        metadatas = [
+            {
+                "source": CONTEXT_SOURCE,
+                "parent_id": parent_id,
+                "chunk_index": chunk.index,
+                "chunk_count": chunk.count,
+            }
+            for chunk in chunks
+        ]
+        # upsert вместо add: параллельная загрузка того же текста перезапишет те же записи без ошибки
+        index.collection.upsert(documents=documents, ids=ids, metadatas=metadatas)
+        DOCUMENTS.labels("embedded").inc(len(ids))
+        index.lexical_index.upsert(ids, documents, metadatas)
 
-    async def add_document(self, document: str, collection: Collection) -> str:
+    async def add_document(self, document: str, index: BoardIndex) -> tuple[str, bool]:
         # Очищаем текст от лишних пробелов
         cleaned_text = " ".join(document.strip().split())
-        # Добавляем документ в ChromaDB с уникальным ID
-        collection.add(documents=[cleaned_text], ids=[f"doc_{hash(cleaned_text)}"])
+        parent_id = document_id(cleaned_text)
+        # Тот же текст уже добавлен (например, тот же context в каждом /ask) — не нарезаем и не считаем эмбеддинги
+        if await run_io(self._exists, parent_id, index):
+            DOCUMENTS.labels("unchanged").inc()
+            return cleaned_text, False
+        # Добавляем фрагменты документа в ChromaDB с ID родителя в метаданных
+        await run_embedding(self._add_chunks, cleaned_text, parent_id, index)
         # Возвращаем очищенный текст
-        return cleaned_text
+        return cleaned_text, True
 
     async def query(self, query: str, collection: Collection) -> str:
         # Ищем до 3 релевантных документов в ChromaDB
-        results = collection.query(query_texts=[query], n_results=3)
-        # Собираем найденные документы в контекст
-        context = "\n".join(results["documents"][0]) if results["documents"] else ""
+        results = await run_embedding(collection.query, query_texts=[query], n_results=3)
+        # Собираем найденные документы в контекст в пределах бюджета токенов, без повторов
+        sources = [
+            SourceDocument(id=doc_id, text=text)
+            for doc_id, text in zip(results["ids"][0], results["documents"][0])
+        ] if results["documents"] else []
+        context = self.prompt_builder.pack(query, sources).text
         # Формируем промпт для LLM
         prompt = f"Context:\n{context}\n\nQuestion: {query}\nAnswer:"
         # Запрашиваем ответ у LLM
@@ -0,0 +1,188 @@
+# Реестр коллекций ChromaDB по доскам: коллекция доски открывается при первом обращении,
+# вместе с ней живут BM25-индекс и словарь доски, простаивающие доски выгружаются из памяти
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable
+from chromadb import Collection
+from executors import run_io
+from services.lexical_index import BM25Index
+from services.query_planner import BoardVocabulary, QueryPlanner
+
+logger = logging.getLogger(__name__)
+
+# Символы, недопустимые в имени коллекции Chroma
+INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_-]")
+# Максимальная длина имени коллекции в Chroma
+MAX_COLLECTION_NAME = 63
+# ID доски Trello (24 шестнадцатеричных символа) или ее короткая ссылка (8 символов)
+TRELLO_BOARD_ID = re.compile(r"^(?:[0-9a-fA-F]{24}|[a-zA-Z0-9]{8})$")
+
+
+# Доски нет ни среди настроенных, ни среди уже загруженных в Chroma (404)
+class UnknownBoard(LookupError):
+    def __init__(self, board_id: str):
+        super().__init__(f"Board {board_id} is not loaded: run /assistant/load_trello for it first")
+        self.board_id = board_id
+
+
+# Индекс одной доски: коллекция, BM25 по ее фрагментам и словарь для фильтров
+class BoardIndex:
+    def __init__(self, board_id: str, collection: Collection):
+        self.board_id = board_id
+        self.collection = collection
+        self.lexical_index = BM25Index()
+        # BM25-индекс строится из коллекции один раз, параллельные запросы ждут эту загрузку
+        self.lexical_lock = asyncio.Lock()
+        self.vocabulary = BoardVocabulary()
+        self.planner = QueryPlanner(self.vocabulary)
+        self.last_used = time.monotonic()
+        # Сколько запросов и синхронизаций сейчас работают с индексом (такой индекс не выгружается)
+        self.users = 0
+
+
+class CollectionRegistry:
+    def __init__(
+        self,
+        open_collection: Callable[[str], Collection],
+        base_name: str,
+        default_board_id: str | None = None,
+        idle_seconds: float = 900.0,
+        max_open: int = 32,
+        find_collection: Callable[[str], Collection | None] | None = None,
+        board_ids: list[str] | None = None,
+    ):
+        # open_collection создает коллекцию при необходимости, find_collection только открывает существующую
+        self.open_collection = open_collection
+        self.find_collection = find_collection
+        self.base_name = base_name
+        self.default_board_id = default_board_id
+        # Настроенные доски: их коллекции создаются при первом обращении, ID не обязан быть в формате Trello
+        self.board_ids = {board_id for board_id in [default_board_id, *(board_ids or [])] if board_id}
+        self.idle_seconds = idle_seconds
+        self.max_open = max_open
+        self._indexes: dict[str, BoardIndex] = {}
+        self._opening: dict[str, asyncio.Task] = {}
+        self.opened = 0
+        self.evicted = 0
+
+    # Доска по умолчанию хранится в исходной коллекции, остальные — в коллекциях с ID доски в имени.
+    # ID из букв и цифр входит в имя как есть; прочие ID очищаются и укорачиваются, а чтобы разные ID
+    # не дали одно имя, к ним добавляется хэш (через дефис, которого нет в именах первого вида)
+    def collection_name(self, board_id: str) -> str:
+        if board_id == self.default_board_id:
+            return self.base_name
+        if board_id.isalnum() and board_id.isascii() and len(self.base_name) + 1 + len(board_id) <= MAX_COLLECTION_NAME:
+            return f"{self.base_name}_{board_id}"
+        digest = hashlib.sha256(board_id.encode("utf-8")).hexdigest()[:12]
+        prefix = INVALID_NAME_CHARS.sub("-", board_id)[:MAX_COLLECTION_NAME - len(self.base_name) - len(digest) - 2]
+        return f"{self.base_name}_{prefix}-{digest}"
+
+    # ID доски из запроса или доска по умолчанию; чужие ID допускаются только в формате Trello
+    def resolve_board(self, board_id: str | None) -> str:
+        board_id = board_id or self.default_board_id
+        if not board_id:
+            raise ValueError("board_id is required: no default Trello board is configured")
+        if board_id not in self.board_ids and not TRELLO_BOARD_ID.match(board_id):
+            raise ValueError(f"Invalid board_id {board_id!r}: expected a Trello board id")
+        return board_id
+
+    # Есть ли у доски коллекция (настроенные доски считаются известными всегда)
+    def known(self, board_id: str) -> bool:
+        if board_id in self.board_ids or board_id in self._indexes:
+            return True
+        return self.find_collection is None or self.find_collection(self.collection_name(board_id)) is not None
+
+    # Уже открытый индекс доски (без открытия и без отметки использования)
+    def loaded(self, board_id: str) -> BoardIndex | None:
+        return self._indexes.get(board_id)
+
+    # create=False (запросы и загрузка документов) открывает только настроенные и уже загруженные доски,
+    # иначе UnknownBoard; create=True (синхронизация из Trello) создает коллекцию новой доски
+    async def get(self, board_id: str | None = None, create: bool = False) -> BoardIndex:
+        board_id = self.resolve_board(board_id)
+        index = self._indexes.get(board_id)
+        if index is None:
+            # Параллельные запросы к еще не открытой доске ждут одно открытие
+            task = self._opening.get(board_id)
+            if task is None:
+                task = asyncio.create_task(self._open(board_id, create or board_id in self.board_ids))
+                self._opening[board_id] = task
+            index = await asyncio.shield(task)
+        index.last_used = time.monotonic()
+        return index
+
+    async def _open(self, board_id: str, create: bool) -> BoardIndex:
+        try:
+            name = self.collection_name(board_id)
+            if create or self.find_collection is None:
+                collection = await run_io(self.open_collection, name)
+            else:
+                collection = await run_io(self.find_collection, name)
+                if collection is None:
+                    raise UnknownBoard(board_id)
+            index = BoardIndex(board_id, collection)
+            self._indexes[board_id] = index
+            self.opened += 1
+            logger.info("Opened collection %s for board %s", collection.name, board_id)
+            self.evict()
+            return index
+        finally:
+            self._opening.pop(board_id, None)
+
+    # Индекс доски, который не выгрузится, пока с ним работают (запрос или синхронизация)
+    @asynccontextmanager
+    async def use(self, board_id: str | None = None, create: bool = False) -> AsyncIterator[BoardIndex]:
+        index = await self.get(board_id, create)
+        index.users += 1
+        try:
+            yield index
+        finally:
+            index.users -= 1
+            index.last_used = time.monotonic()
+
+    # Выгружаем доски, простаивающие дольше idle_seconds, и самые старые сверх max_open.
+    # Данные остаются в Chroma; при следующем обращении индекс доски строится заново
+    def evict(self, now: float | None = None) -> int:
+        now = now if now is not None else time.monotonic()
+        idle = sorted(
+            (index for index in self._indexes.values() if index.users == 0),
+            key=lambda index: index.last_used,
+        )
+        excess = len(self._indexes) - self.max_open
+        evicted = 0
+        for index in idle:
+            if now - index.last_used < self.idle_seconds and evicted >= excess:
+                break
+            del self._indexes[index.board_id]
+            evicted += 1
+            logger.info("Evicted idle board %s from memory", index.board_id)
+        self.evicted += evicted
+        return evicted
+
+    # Периодическая выгрузка простаивающих досок (запускается из lifespan)
+    async def run_evictor(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_seconds / 4))
+            self.evict()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "open_boards": len(self._indexes),
+            "max_open": self.max_open,
+            "opened": self.opened,
+            "evicted": self.evicted,
+            "boards": {
+                board_id: {
+                    "collection": index.collection.name,
+                    "bm25_chunks": len(index.lexical_index),
+                    "idle_seconds": now - index.last_used,
+                    "in_use": index.users,
+                }
+                for board_id, index in self._indexes.items()
+            },
+        }
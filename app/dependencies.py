@@ -1,20 +1,57 @@
-# Импортируем настройки из config.py
-from config import settings
-# Импортируем сервис и репозиторий
+# Импортируем сервис
 from services.chroma_service import ChromaService
-from db.chroma_repository import ChromaRepository
-# Тип коллекции ChromaDB
-from chromadb import Collection
-
-# Функция возвращает коллекцию ChromaDB
-def get_collection() -> Collection:
-    # Проверяем, что коллекция инициализирована
-    if not settings.chroma_db.collection:
-        raise RuntimeError("ChromaDB collection not initialized")
-    # Возвращаем коллекцию из настроек
-    return settings.chroma_db.collection
+from services.sync_jobs import SyncJobManager
+from services.trello_webhooks import TrelloWebhookProcessor
+# Контейнер приложения хранится в app.state
+from fastapi import Request
+from trello import TrelloClient
+# Реестр коллекций по доскам
+from db.collection_registry import CollectionRegistry
+# Лимиты запросов клиентов
+from admission import get_admission
+# Настройки, с которыми создан контейнер
+from config import Settings
+
+# Функция возвращает настройки приложения (созданные в lifespan)
+def get_app_settings(request: Request) -> Settings:
+    return request.app.state.container.settings
+
+# Функция возвращает реестр коллекций досок
+def get_registry(request: Request) -> CollectionRegistry:
+    return request.app.state.container.registry
 
 # Функция возвращает сервис для работы с ChromaDB и Trello
-def get_service() -> ChromaService:
-    # Создаем сервис с репозиторием
-    return ChromaService(ChromaRepository())
\ No newline at end of file
+def get_service(request: Request) -> ChromaService:
+    # Сервис создается один раз в lifespan и переиспользуется всеми запросами
+    return request.app.state.container.service
+
+# Функция возвращает менеджер фоновых задач синхронизации Trello
+def get_sync_jobs(request: Request) -> SyncJobManager:
+    return request.app.state.container.sync_jobs
+
+# Функция возвращает обработчик вебхуков Trello
+def get_webhooks(request: Request) -> TrelloWebhookProcessor:
+    return request.app.state.container.webhooks
+
+# Функция возвращает Trello клиент с общим пулом соединений
+def get_trello_client(request: Request) -> TrelloClient:
+    return request.app.state.container.trello_client
+
+# Синхронизация с Trello без ключа и токена API — 503 до создания задачи
+def require_trello(request: Request):
+    request.app.state.container.require_trello()
+
+# Клиент для лимитов запросов: значение заголовка RATE_LIMIT_CLIENT_HEADER или IP-адрес
+def client_id(request: Request) -> str:
+    header = get_app_settings(request).admission.RATE_LIMIT_CLIENT_HEADER
+    if header and request.headers.get(header):
+        return request.headers[header]
+    return request.client.host if request.client else "unknown"
+
+# Лимит вопросов клиента (/ask, /ask_stream), при превышении — 429
+def limit_ask(request: Request):
+    get_admission().ask_rate.check(client_id(request))
+
+# Лимит загрузок клиента (/add_context, /ingest, /load_trello), при превышении — 429
+def limit_bulk(request: Request):
+    get_admission().bulk_rate.check(client_id(request))
@@ -0,0 +1,105 @@
+# Микробатчинг эмбеддингов: объединяем тексты из параллельных запросов в один проход модели
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+import numpy as np
+
+# Сигнал остановки рабочего потока
+_STOP = object()
+
+class EmbeddingBatcher:
+    def __init__(
+        self,
+        encode: Callable[[list[str]], np.ndarray],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+    ):
+        self._encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        # Счетчики для оценки эффективности объединения
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+        self._thread = threading.Thread(target=self._loop, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    # Блокирующий вызов из потока пула: ставим тексты в очередь и ждем свои векторы
+    def encode(self, texts: list[str]) -> list[np.ndarray]:
+        if not texts:
+            return []
+        future: Future = Future()
+        self._queue.put((texts, future))
+        return future.result()
+
+    # Собираем пакет: ждем не дольше max_wait от первого запроса или до max_batch_size текстов
+    def _collect(self, first) -> tuple[list, bool]:
+        batch = [first]
+        size = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+            size += len(item[0])
+        return batch, False
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch, stop = self._collect(first)
+            self._run(batch)
+            if stop:
+                return
+
+    def _run(self, batch: list):
+        texts = [text for request_texts, _ in batch for text in request_texts]
+        # Сортируем по длине, чтобы в одном пакете было меньше паддинга
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        try:
+            encoded = self._encode([texts[i] for i in order])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        vectors: list = [None] * len(texts)
+        for position, i in enumerate(order):
+            vectors[i] = encoded[position]
+        offset = 0
+        for request_texts, future in batch:
+            future.set_result(vectors[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+        with self._lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.texts += len(texts)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self.batches,
+                "requests": self.requests,
+                "texts": self.texts,
+                "avg_batch_texts": self.texts / self.batches if self.batches else 0.0,
+                "avg_batch_requests": self.requests / self.batches if self.batches else 0.0,
+                "pending": self._queue.qsize(),
+            }
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join(timeout=5)
@@ -0,0 +1,149 @@
+# Кэш эмбеддингов по (имя модели, хэш нормализованного текста)
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Максимум ключей в одном SQL-запросе (ограничение числа параметров SQLite)
+SQL_BATCH_SIZE = 500
+
+# Форматы хранения векторов
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+# Сжатие нормализованного вектора для хранения: float16 — половина размера, int8 — четверть
+# (симметричное квантование с масштабом вектора в первых 4 байтах)
+def quantize(vector: np.ndarray, dtype: str) -> bytes:
+    vector = np.asarray(vector, dtype=np.float32)
+    if dtype == "float16":
+        return vector.astype(np.float16).tobytes()
+    if dtype == "int8":
+        scale = float(np.abs(vector).max()) / 127 or 1.0
+        codes = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+        return np.float32(scale).tobytes() + codes.tobytes()
+    return vector.tobytes()
+
+# Обратно в float32: Chroma хранит и ищет только float32
+def dequantize(blob: bytes, dtype: str) -> np.ndarray:
+    if dtype == "float16":
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+    if dtype == "int8":
+        scale = np.frombuffer(blob, dtype=np.float32, count=1)[0]
+        return np.frombuffer(blob, dtype=np.int8, offset=4).astype(np.float32) * scale
+    return np.frombuffer(blob, dtype=np.float32)
+
+# Нормализуем текст так же, как репозиторий очищает документы
+def normalize_text(text: str) -> str:
+    return " ".join(text.strip().split())
+
+# Двухуровневый кэш: LRU в памяти процесса и SQLite на диске.
+# Оба уровня хранят векторы в формате dtype и отдают float32
+class EmbeddingCache:
+    def __init__(self, model_name: str, max_items: int = 10000, path: str = "", dtype: str = "float32"):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown embedding storage dtype '{dtype}', expected one of {', '.join(STORAGE_DTYPES)}")
+        self.model_name = model_name
+        self.max_items = max_items
+        self.dtype = dtype
+        # Векторы разных форматов не смешиваются в общем файле кэша
+        self._namespace = model_name if dtype == "float32" else f"{model_name}:{dtype}"
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            # Соединение используется из разных потоков пула, доступ защищен блокировкой
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+        # Счетчики попаданий и промахов
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # Суммарное время модели и число закодированных текстов, чтобы оценить сэкономленное время
+        self.encode_seconds = 0.0
+        self.encoded_texts = 0
+
+    def key(self, text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{self._namespace}:{digest}"
+
+    def _remember(self, key: str, blob: bytes):
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = blob
+        self._memory_bytes += len(blob)
+        while len(self._memory) > self.max_items:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    # Возвращает векторы по ключам; None для отсутствующих в обоих уровнях
+    def get_many(self, keys: list[str]) -> list[np.ndarray | None]:
+        found: list[np.ndarray | None] = [None] * len(keys)
+        with self._lock:
+            disk_lookup = []
+            for i, key in enumerate(keys):
+                blob = self._memory.get(key)
+                if blob is not None:
+                    self._memory.move_to_end(key)
+                    found[i] = dequantize(blob, self.dtype)
+                    self.memory_hits += 1
+                else:
+                    disk_lookup.append(i)
+            if disk_lookup and self._db is not None:
+                lookup_keys = list({keys[i] for i in disk_lookup})
+                rows = {}
+                for start in range(0, len(lookup_keys), SQL_BATCH_SIZE):
+                    batch = lookup_keys[start:start + SQL_BATCH_SIZE]
+                    placeholders = ",".join("?" * len(batch))
+                    rows.update(self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                    ).fetchall())
+                for i in disk_lookup:
+                    blob = rows.get(keys[i])
+                    if blob is not None:
+                        self._remember(keys[i], blob)
+                        found[i] = dequantize(blob, self.dtype)
+                        self.disk_hits += 1
+            self.misses += sum(1 for vector in found if vector is None)
+        return found
+
+    def put_many(self, keys: list[str], vectors: list[np.ndarray]):
+        blobs = [quantize(vector, self.dtype) for vector in vectors]
+        with self._lock:
+            for key, blob in zip(keys, blobs):
+                self._remember(key, blob)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", list(zip(keys, blobs))
+                )
+                self._db.commit()
+
+    def record_encode(self, texts: int, seconds: float):
+        with self._lock:
+            self.encoded_texts += texts
+            self.encode_seconds += seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            per_text = self.encode_seconds / self.encoded_texts if self.encoded_texts else 0.0
+            return {
+                "model": self.model_name,
+                "dtype": self.dtype,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "max_items": self.max_items,
+                "disk_enabled": self._db is not None,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "encode_seconds": self.encode_seconds,
+                "estimated_saved_seconds": hits * per_text,
+            }
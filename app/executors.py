@@ -0,0 +1,118 @@
+# Пулы потоков для блокирующей работы вне event loop
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+# Размеры пулов читаются из настроек при первом обращении, а не при импорте модуля
+from config import ExecutorSettings, get_settings
+# Бюджет эмбеддингов с очередью по приоритету
+from admission import get_admission
+
+# Ограниченный пул потоков с метриками очереди
+class BoundedExecutor:
+    def __init__(self, name: str, max_workers: int, max_pending: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        # Семафор ограничивает число задач в пуле, лишние вызовы ждут в event loop
+        self._slots = asyncio.Semaphore(max_pending)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._max_queue_depth = 0
+
+    # Снимаем задачу с учета очереди ровно один раз: при старте или при отмене до старта
+    def _dequeue(self, state: dict):
+        if not state["dequeued"]:
+            state["dequeued"] = True
+            self._queued -= 1
+
+    def _run(self, fn: Callable, args: tuple, kwargs: dict, state: dict) -> Any:
+        with self._lock:
+            self._dequeue(state)
+            self._active += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._completed += 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        state = {"dequeued": False}
+        try:
+            with self._lock:
+                self._queued += 1
+                self._max_queue_depth = max(self._max_queue_depth, self._queued + self._waiting)
+            return await loop.run_in_executor(self._pool, functools.partial(self._run, fn, args, kwargs, state))
+        finally:
+            with self._lock:
+                self._dequeue(state)
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "active": self._active,
+                "queued": self._queued,
+                "waiting": self._waiting,
+                "completed": self._completed,
+                "max_queue_depth": self._max_queue_depth,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+_pools: dict[str, BoundedExecutor] = {}
+_pools_lock = threading.Lock()
+
+# Пулы создаются из настроек контейнера в lifespan или при первой задаче (бенчмарки без приложения):
+# "embedding" — CPU-задачи, инференс SentenceTransformer (add/upsert/query в ChromaDB с текстами);
+# "io" — блокирующий I/O, запросы к Trello и операции ChromaDB без эмбеддингов
+def configure_executors(config: ExecutorSettings | None = None) -> dict[str, BoundedExecutor]:
+    with _pools_lock:
+        if not _pools:
+            config = config or get_settings().executors
+            _pools["embedding"] = BoundedExecutor("embedding", config.EMBEDDING_WORKERS, config.EMBEDDING_MAX_PENDING)
+            _pools["io"] = BoundedExecutor("io", config.IO_WORKERS, config.IO_MAX_PENDING)
+        return _pools
+
+def get_executor(name: str) -> BoundedExecutor:
+    pool = _pools.get(name)
+    return pool if pool is not None else configure_executors()[name]
+
+# Останавливает пулы при завершении приложения; следующий lifespan создаст новые
+def shutdown_executors():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown()
+        _pools.clear()
+
+# Выполняет функцию в пуле эмбеддингов. Место в пуле выдается по приоритету запроса:
+# эмбеддинг вопроса /ask не ждет за очередью пакетов загрузки
+async def run_embedding(fn: Callable, *args, **kwargs) -> Any:
+    async with get_admission().embedding.slot():
+        return await get_executor("embedding").run(fn, *args, **kwargs)
+
+# Выполняет функцию в пуле I/O
+async def run_io(fn: Callable, *args, **kwargs) -> Any:
+    return await get_executor("io").run(fn, *args, **kwargs)
+
+# Метрики всех пулов
+def executor_stats() -> list[dict]:
+    return [get_executor("embedding").stats(), get_executor("io").stats()]
@@ -1,21 +1,50 @@
 import streamlit as st
 import httpx
-import asyncio
 import json
+import time
 
-# Функция для отправки запроса к ассистенту
-async def ask_assistant(query: str, context: str):
+# Интервал опроса статуса фоновой синхронизации Trello, секунды
+SYNC_POLL_INTERVAL = 1.0
+
+# Общий HTTP-клиент с пулом соединений: создается один раз и переживает перезапуски скрипта Streamlit
+@st.cache_resource
+def get_http_client() -> httpx.Client:
+    return httpx.Client(
+        base_url="http://127.0.0.1:8000",
+        timeout=httpx.Timeout(120.0, connect=10.0),
+        limits=httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=30.0),
+        headers={"Content-Type": "application/json"},
+    )
+
+# Функция для отправки запроса к ассистенту с потоковым выводом ответа
+def ask_assistant(query: str, context: str, sources_placeholder, answer_placeholder) -> str:
+    answer = ""
     try:
-        async with httpx.AsyncClient(timeout=120.0) as client:  # Увеличиваем таймаут до 120 секунд
-            response = await client.post(
-                "http://127.0.0.1:8000/assistant/ask",
-                json={"query": query, "context": context},
-                headers={"Content-Type": "application/json"}
-            )
+        with get_http_client().stream(
+            "POST",
+            "/assistant/ask_stream",
+            json={"query": query, "context": context},
+        ) as response:
             response.raise_for_status()
-            st.write(f"HTTP-статус: {response.status_code}")
-            st.write(f"Содержимое ответа: {response.text}")
-            return response
+            # Каждая строка ответа — отдельное JSON-событие
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["event"] == "sources":
+                    with sources_placeholder.container():
+                        if event.get("cached"):
+                            st.caption("Ответ из кэша")
+                        with st.expander(f"Источники ({len(event['sources'])})"):
+                            for source in event["sources"]:
+                                st.text(source["text"])
+                elif event["event"] == "token":
+                    answer += event["text"]
+                    answer_placeholder.markdown(answer + "▌")
+                elif event["event"] == "error":
+                    st.error(event["detail"])
+        answer_placeholder.markdown(answer)
+        return answer
     except httpx.ReadTimeout as e:
         st.error(f"Ошибка таймаута при запросе к ассистенту: {str(e)}")
         raise
@@ -27,18 +56,13 @@ async def ask_assistant(query: str, context: str):
         raise
 
 # Функция для добавления контекста
-async def add_context(text: str):
+def add_context(text: str):
     try:
-        async with httpx.AsyncClient(timeout=120.0) as client:  # Увеличиваем таймаут
-            response = await client.post(
-                "http://127.0.0.1:8000/assistant/add_context",
-                json={"text": text},
-                headers={"Content-Type": "application/json"}
-            )
-            response.raise_for_status()
-            st.write(f"HTTP-статус: {response.status_code}")
-            st.write(f"Содержимое ответа: {response.text}")
-            return response
+        response = get_http_client().post("/assistant/add_context", json={"text": text})
+        response.raise_for_status()
+        st.write(f"HTTP-статус: {response.status_code}")
+        st.write(f"Содержимое ответа: {response.text}")
+        return response
     except httpx.ReadTimeout as e:
         st.error(f"Ошибка таймаута при добавлении контекста: {str(e)}")
         raise
@@ -49,15 +73,37 @@ async def add_context(text: str):
         st.error(f"Неизвестная ошибка при добавлении контекста: {str(e)}")
         raise
 
-# Функция для загрузки данных Trello
-async def load_trello():
+# Текст о ходе синхронизации: этап, счетчики, скорость и оставшееся время
+def describe_sync_job(job: dict) -> str:
+    text = (
+        f"Этап: {job['stage']}. Карточек получено: {job['cards_fetched']}, изменилось: {job['cards_changed']}, "
+        f"обработано: {job['cards_chunked']}. Фрагментов записано: {job['chunks_upserted']} из {job['chunks_total']}"
+    )
+    if job.get("rate"):
+        text += f". Скорость: {job['rate']:.1f} фрагм./с"
+    if job.get("eta_seconds") is not None and job["status"] == "running":
+        text += f", осталось ~{job['eta_seconds']:.0f} с"
+    return text
+
+# Функция для загрузки данных Trello: запускает фоновую задачу и опрашивает ее статус
+def load_trello() -> dict:
     try:
-        async with httpx.AsyncClient(timeout=120.0) as client:  # Увеличиваем таймаут
-            response = await client.post("http://127.0.0.1:8000/assistant/load_trello")
+        response = get_http_client().post("/assistant/load_trello")
+        response.raise_for_status()
+        job = response.json()
+        status_placeholder = st.empty()
+        progress_bar = st.progress(0.0)
+        while job["status"] in ("queued", "running"):
+            status_placeholder.info(describe_sync_job(job))
+            if job["chunks_total"]:
+                progress_bar.progress(min(1.0, job["chunks_upserted"] / job["chunks_total"]))
+            time.sleep(SYNC_POLL_INTERVAL)
+            response = get_http_client().get(f"/assistant/sync_jobs/{job['job_id']}")
             response.raise_for_status()
-            st.write(f"HTTP-статус: {response.status_code}")
-            st.write(f"Содержимое ответа: {response.text}")
-            return response
+            job = response.json()
+        progress_bar.progress(1.0)
+        status_placeholder.info(describe_sync_job(job))
+        return job
     except httpx.ReadTimeout as e:
         st.error(f"Ошибка таймаута при загрузке Trello: {str(e)}")
         raise
@@ -81,12 +127,12 @@ context = st.text_area("Введите контекст (опционально)
 if st.button("Отправить запрос"):
     if query:
         try:
-            response = asyncio.run(ask_assistant(query, context))
-            if response.status_code == 200:
+            # Места для источников и ответа, который дописывается по мере генерации
+            sources_placeholder = st.empty()
+            answer_placeholder = st.empty()
+            answer = ask_assistant(query, context or None, sources_placeholder, answer_placeholder)
+            if answer:
                 st.success("Запрос успешно обработан!")
-                st.write(response.json().get("answer"))
-            else:
-                st.error("Ошибка при обработке запроса")
         except Exception as e:
             st.error(f"Ошибка при отправке запроса: {str(e)}")
     else:
@@ -96,7 +142,7 @@ if st.button("Отправить запрос"):
 if st.button("Добавить контекст"):
     if context:
         try:
-            response = asyncio.run(add_context(context))
+            response = add_context(context)
             if response.status_code == 200:
                 st.success("Контекст успешно добавлен!")
             else:
@@ -109,10 +155,14 @@ if st.button("Добавить контекст"):
 # Кнопка для загрузки данных Trello
 if st.button("Загрузить данные Trello"):
     try:
-        response = asyncio.run(load_trello())
-        if response.status_code == 200:
-            st.success("Данные Trello успешно загружены!")
+        job = load_trello()
+        if job["status"] == "completed":
+            report = job["report"]
+            st.success(
+                f"Данные Trello загружены: добавлено {report['added']}, обновлено {report['updated']}, "
+                f"без изменений {report['unchanged']}, удалено {report['removed']}"
+            )
         else:
-            st.error("Ошибка при загрузке Trello")
+            st.error(f"Ошибка при загрузке Trello: {job.get('error')}")
     except Exception as e:
         st.error(f"Ошибка при загрузке Trello: {str(e)}")
\ No newline at end of file
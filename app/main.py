@@ -8,11 +8,22 @@ from fastapi.staticfiles import StaticFiles
 from routes.assistant import router as assistant_router
 # Функция создания приложения
 from start_app import start_app
-# Для возврата HTML-ответа
-from fastapi.responses import HTMLResponse
+# Lifespan с контейнером сервисов и пулов соединений
+from container import lifespan
+# Для возврата HTML-ответа, текста метрик и статуса готовности
+from fastapi import Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+# Метрики Prometheus
+from metrics import render_metrics
+# Отказы при перегрузке и превышении лимита клиента
+from admission import Overloaded, RateLimited
+# Доска, которая не настроена и не загружалась
+from db.collection_registry import UnknownBoard
+# Нет ключа и токена Trello API
+from services.trello_loader import TrelloNotConfigured
 
 # Создаем приложение с кастомными маршрутами документации
-app = start_app(create_custom_static_urls=True)
+app = start_app(create_custom_static_urls=True, lifespan=lifespan)
 # Монтируем папку static для файлов Swagger UI и ReDoc
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -25,6 +36,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Перегрузка LLM или эмбеддингов: быстрый 503 вместо ожидания, Retry-After — оценка времени до свободного места
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": str(exc.retry_after)})
+
+# Превышен лимит запросов клиента
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request: Request, exc: RateLimited):
+    return JSONResponse({"detail": str(exc)}, status_code=429, headers={"Retry-After": str(exc.retry_after)})
+
+# Ключ и токен Trello API не заданы: синхронизация и вебхуки недоступны
+@app.exception_handler(TrelloNotConfigured)
+async def trello_not_configured_handler(request: Request, exc: TrelloNotConfigured):
+    return JSONResponse({"detail": str(exc)}, status_code=503)
+
+# Запрос к доске, которой нет в ассистенте: коллекции создаются только синхронизацией /load_trello
+@app.exception_handler(UnknownBoard)
+async def unknown_board_handler(request: Request, exc: UnknownBoard):
+    return JSONResponse({"detail": str(exc)}, status_code=404)
+
 # Добавляем корневой маршрут
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
@@ -38,6 +69,19 @@ async def read_root():
     </html>
     """
 
+# Метрики в формате Prometheus: гистограммы этапов запроса, вызовов Trello, счетчики токенов и документов
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+# Готовность к запросам: 200, когда модель эмбеддингов и индекс доски по умолчанию прогреты, иначе 503.
+# Сервер отвечает и до готовности (/, /docs, /metrics), первые запросы просто загружают ресурсы сами
+@app.get("/ready")
+async def ready(request: Request):
+    readiness = request.app.state.container.readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
 # Подключаем маршруты ассистента
 app.include_router(assistant_router)
 
@@ -0,0 +1,75 @@
+# Метрики Prometheus и замеры этапов обработки запроса
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+# Границы корзин в секундах: от миллисекунд (поиск) до минут (генерация на CPU)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Этапы /ask: embed, plan, vector_search, lexical_search, rerank, prompt, llm_first_token, llm_total, query
+STAGE_SECONDS = Histogram(
+    "assistant_stage_seconds", "Duration of query processing stages", ["stage"], buckets=LATENCY_BUCKETS
+)
+# Каждый вызов Trello API по ресурсу доски (lists, members, cards, actions)
+TRELLO_REQUEST_SECONDS = Histogram(
+    "assistant_trello_request_seconds", "Duration of Trello API calls", ["resource"], buckets=LATENCY_BUCKETS
+)
+# Токены промпта и ответа по счетчикам Ollama
+LLM_TOKENS = Counter("assistant_llm_tokens_total", "Tokens processed by the LLM", ["kind"])
+# Фрагменты: записанные в коллекцию (embedded), удаленные (removed), документы, уже записанные с тем же
+# содержимым (unchanged), найденные фрагменты (retrieved),
+# вошедшие в промпт (prompt), отброшенные как почти одинаковые (deduplicated) и не поместившиеся в бюджет (over_budget)
+DOCUMENTS = Counter("assistant_documents_total", "Document chunks processed", ["operation"])
+# Размер промпта в токенах (по токенизатору модели эмбеддингов)
+PROMPT_TOKENS = Histogram(
+    "assistant_prompt_tokens", "Prompt size in tokens", buckets=(64, 128, 256, 512, 1024, 1536, 2048, 3072, 4096, 8192)
+)
+# События вебхуков Trello: приняты (accepted), без карточек и колонок (ignored), с неверной подписью (rejected),
+# слиты с уже ожидающим обновлением той же карточки (coalesced)
+WEBHOOK_EVENTS = Counter("assistant_trello_webhook_events_total", "Trello webhook events", ["result"])
+# Задержка от первого события карточки до записи ее документа в коллекцию
+WEBHOOK_LAG_SECONDS = Histogram(
+    "assistant_trello_webhook_lag_seconds", "Delay from a Trello webhook event to the index update",
+    buckets=LATENCY_BUCKETS,
+)
+# Ожидание места в бюджете LLM или эмбеддингов по приоритету (interactive, bulk)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "assistant_admission_wait_seconds", "Time spent waiting for an LLM or embedding slot", ["resource", "priority"],
+    buckets=LATENCY_BUCKETS,
+)
+# Отказы: полная очередь (queue_full), не дождались места (timeout), превышен лимит клиента (rate_limited)
+ADMISSION_REJECTED = Counter("assistant_admission_rejected_total", "Rejected requests", ["resource", "reason"])
+# Ответы по пути (ask, stream) и источнику (llm, cache)
+QUERIES = Counter("assistant_queries_total", "Answered queries", ["endpoint", "source"])
+
+# Разбивка по этапам текущего запроса в миллисекундах. Задачи asyncio.gather наследуют контекст
+# и пишут в тот же словарь; в пулах потоков контекста нет, там замеры попадают только в гистограммы
+_request_timings: ContextVar[dict[str, float] | None] = ContextVar("request_timings", default=None)
+
+
+def start_request_timings() -> dict[str, float]:
+    timings: dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def record_stage(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds * 1000
+
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+# Текст для /metrics в формате Prometheus
+def render_metrics() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
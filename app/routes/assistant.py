@@ -1,69 +1,208 @@
 # Импортируем FastAPI роутер
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from starlette.datastructures import UploadFile
+# Потоковый ответ для /ask_stream
+from fastapi.responses import StreamingResponse
+import orjson
 # Импортируем модели
-from schemas import UserQuery, AssistantResponse, TextContext
+from schemas import UserQuery, AssistantResponse, IngestReport, TextContext, SyncJobStatus
 # Импортируем зависимости
-from dependencies import get_collection, get_service
+from dependencies import get_app_settings, get_registry, get_service, get_sync_jobs, get_webhooks, limit_ask, limit_bulk, require_trello
 from services.chroma_service import ChromaService
-# Импортируем Trello клиент
-from trello import TrelloClient
-# Импортируем исключения Trello
-from trello.exceptions import ResourceUnavailable
+from services.sync_jobs import SyncJobManager
+from services.trello_webhooks import TrelloWebhookProcessor
+from db.collection_registry import CollectionRegistry
+from services.ingest import CountingStream, parse_files, parse_ndjson
 # Импортируем типы
-from chromadb import Collection
 from typing import Annotated
 # Импортируем настройки
-from config import settings
+from config import Settings
+# Метрики пулов потоков
+from executors import executor_stats
+# Приоритет вопросов перед загрузками и бюджеты LLM и эмбеддингов
+from admission import INTERACTIVE, admission_stats, priority
 
 # Создаем роутер с префиксом и тегом
 router = APIRouter(prefix="/assistant", tags=["assistant"])
 
-# Зависимость для создания Trello клиента
-def get_trello_client() -> TrelloClient:
-    return TrelloClient(
-        api_key=settings.keys.TRELLO_API_KEY,
-        token=settings.keys.TRELLO_TOKEN
-    )
+# ID доски из запроса или доска по умолчанию; без доски по умолчанию или с ID не в формате Trello — 400
+def resolve_board(registry: CollectionRegistry, board_id: str | None) -> str:
+    try:
+        return registry.resolve_board(board_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # Эндпоинт для добавления текста в ChromaDB
-@router.post("/add_context", response_model=AssistantResponse)
+@router.post("/add_context", response_model=AssistantResponse, dependencies=[Depends(limit_bulk)])
 async def add_context(
     context: TextContext,
     service: Annotated[ChromaService, Depends(get_service)],
-    collection: Annotated[Collection, Depends(get_collection)]
+    registry: Annotated[CollectionRegistry, Depends(get_registry)]
 ):
-    # Добавляем текст в ChromaDB через сервис
-    text = await service.add_document(collection, context.text)
+    # Добавляем текст в коллекцию доски через сервис
+    async with registry.use(resolve_board(registry, context.board_id)) as index:
+        text = await service.add_document(index, context.text)
     return AssistantResponse(answer=f"Добавлен текст: {text}")
 
-# Эндпоинт для запроса к ассистенту
-@router.post("/ask", response_model=AssistantResponse)
+# Массовая загрузка документов в коллекцию доски. Тело — NDJSON (application/x-ndjson, по документу
+# на строку) или multipart/form-data с файлами .md, .txt, экспортом доски Trello (.json) и .ndjson.
+# Тело разбирается потоком и пишется пакетами, ID документов выводятся из содержимого (у карточек — из ID
+# карточки), поэтому повторная загрузка ничего не дублирует. Ошибки отдельных элементов — в отчете
+@router.post("/ingest", response_model=IngestReport, dependencies=[Depends(limit_bulk)])
+async def ingest(
+    request: Request,
+    service: Annotated[ChromaService, Depends(get_service)],
+    registry: Annotated[CollectionRegistry, Depends(get_registry)],
+    settings: Annotated[Settings, Depends(get_app_settings)],
+    board_id: str | None = None,
+):
+    board_id = resolve_board(registry, board_id)
+    limits = settings.ingest
+    content_type = request.headers.get("content-type", "")
+    multipart = content_type.startswith("multipart/form-data")
+    if not multipart and not content_type.startswith(("application/x-ndjson", "application/jsonl", "application/json")):
+        raise HTTPException(status_code=415, detail="Expected application/x-ndjson or multipart/form-data")
+    async with registry.use(board_id) as index:
+        if multipart:
+            # Starlette сбрасывает большие файлы на диск, в памяти остается не больше мегабайта на файл
+            async with request.form() as form:
+                files = [value for _, value in form.multi_items() if isinstance(value, UploadFile)]
+                if not files:
+                    raise HTTPException(status_code=400, detail="No files in the multipart request")
+                documents = parse_files(
+                    files, board_id, limits.INGEST_MAX_SECTION_CHARS, limits.INGEST_MAX_LINE_BYTES,
+                    limits.INGEST_MAX_JSON_BYTES,
+                )
+                return await service.ingest(
+                    index, documents, lambda: sum(file.size or 0 for file in files),
+                    batch_size=limits.INGEST_BATCH_SIZE, max_errors=limits.INGEST_MAX_ERRORS,
+                )
+        body = CountingStream(request.stream())
+        documents = parse_ndjson(body, board_id, limits.INGEST_MAX_SECTION_CHARS, limits.INGEST_MAX_LINE_BYTES)
+        return await service.ingest(
+            index, documents, lambda: body.received,
+            batch_size=limits.INGEST_BATCH_SIZE, max_errors=limits.INGEST_MAX_ERRORS,
+        )
+
+# Эндпоинт для запроса к ассистенту: поиск идет только по индексу доски из запроса.
+# Вопросы получают место в пуле эмбеддингов и в очереди к LLM раньше загрузок; при перегрузке — 503
+@router.post("/ask", response_model=AssistantResponse, dependencies=[Depends(limit_ask)])
 async def ask_assistant(
     user_query: UserQuery,
     service: Annotated[ChromaService, Depends(get_service)],
-    collection: Annotated[Collection, Depends(get_collection)]
+    registry: Annotated[CollectionRegistry, Depends(get_registry)]
 ):
-    # Добавляем контекст в ChromaDB, только если он предоставлен
-    if user_query.context is not None:
-        await service.add_document(collection, user_query.context)
-    # Выполняем запрос (поиск + LLM)
-    answer = await service.query(user_query.query, collection)
-    return AssistantResponse(answer=answer)
-
-# Эндпоинт для загрузки данных из Trello
-@router.post("/load_trello", response_model=AssistantResponse)
-async def load_trello(
+    with priority(INTERACTIVE):
+        async with registry.use(resolve_board(registry, user_query.board_id)) as index:
+            # Добавляем контекст в ChromaDB, только если он предоставлен
+            if user_query.context is not None:
+                await service.add_document(index, user_query.context)
+            # Выполняем запрос (поиск + LLM или кэш ответов)
+            return await service.query(
+                user_query.query, index, user_query.retrieval, include_timings=user_query.include_timings
+            )
+
+# Потоковый эндпоинт запроса: NDJSON, первым событием идут источники, затем токены LLM
+@router.post("/ask_stream", dependencies=[Depends(limit_ask)])
+async def ask_assistant_stream(
+    user_query: UserQuery,
     service: Annotated[ChromaService, Depends(get_service)],
-    collection: Annotated[Collection, Depends(get_collection)],
-    trello_client: Annotated[TrelloClient, Depends(get_trello_client)]
+    registry: Annotated[CollectionRegistry, Depends(get_registry)]
 ):
+    board_id = resolve_board(registry, user_query.board_id)
+    with priority(INTERACTIVE):
+        async with registry.use(board_id) as index:
+            if user_query.context is not None:
+                await service.add_document(index, user_query.context)
+
+    async def events():
+        async with registry.use(board_id) as index:
+            async for event in service.query_stream(
+                user_query.query, index, user_query.retrieval, include_timings=user_query.include_timings
+            ):
+                yield orjson.dumps(event) + b"\n"
+
+    # Первое событие (источники) готовим до ответа: поиск идет с приоритетом вопроса, место в бюджете LLM
+    # берется до этого события, поэтому неизвестная доска и перегрузка возвращаются обычным HTTP-статусом
+    stream = events()
+    with priority(INTERACTIVE):
+        first = await anext(stream)
+
+    async def body():
+        yield first
+        async for line in stream:
+            yield line
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+# Эндпоинт для загрузки данных из Trello: синхронизация запускается в фоне, ответ — задача с ее ID.
+# Если доска уже синхронизируется, возвращается текущая задача; разные доски синхронизируются параллельно
+@router.post(
+    "/load_trello", response_model=SyncJobStatus, status_code=202, dependencies=[Depends(limit_bulk), Depends(require_trello)]
+)
+async def load_trello(
+    sync_jobs: Annotated[SyncJobManager, Depends(get_sync_jobs)],
+    registry: Annotated[CollectionRegistry, Depends(get_registry)],
+    board_id: str | None = None,
+):
+    return sync_jobs.submit(resolve_board(registry, board_id))
+
+# Список задач синхронизации (всех или одной доски), от новых к старым
+@router.get("/sync_jobs", response_model=list[SyncJobStatus])
+async def list_sync_jobs(sync_jobs: Annotated[SyncJobManager, Depends(get_sync_jobs)], board_id: str | None = None):
+    return [job for job in sync_jobs.jobs() if board_id is None or job.board_id == board_id]
+
+# Ход задачи синхронизации: этап, счетчики карточек и фрагментов, скорость и оценка оставшегося времени
+@router.get("/sync_jobs/{job_id}", response_model=SyncJobStatus)
+async def get_sync_job(job_id: str, sync_jobs: Annotated[SyncJobManager, Depends(get_sync_jobs)]):
+    job = sync_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Sync job {job_id} not found")
+    return job
+
+# Trello проверяет адрес вебхука запросом HEAD при регистрации и ждет 200
+@router.head("/trello_webhook")
+async def trello_webhook_check(webhooks: Annotated[TrelloWebhookProcessor, Depends(get_webhooks)]):
+    if not webhooks.enabled:
+        raise HTTPException(status_code=503, detail=f"Trello webhooks are disabled: {webhooks.disabled_reason}")
+    return Response()
+
+# Прием событий доски (карточки, колонки, участники, метки, комментарии) вместо полной перезагрузки.
+# Подпись X-Trello-Webhook проверяется по сырому телу; событие только ставится в очередь,
+# карточки обновляются в фоне после паузы, поэтому Trello получает ответ сразу
+@router.post("/trello_webhook")
+async def trello_webhook(request: Request, webhooks: Annotated[TrelloWebhookProcessor, Depends(get_webhooks)]):
+    if not webhooks.enabled:
+        raise HTTPException(status_code=503, detail=f"Trello webhooks are disabled: {webhooks.disabled_reason}")
+    body = await request.body()
+    signature = request.headers.get("x-trello-webhook", "")
+    callback_url = str(request.url)
+    if not webhooks.verify(body, callback_url, signature):
+        raise HTTPException(status_code=401, detail="Invalid Trello webhook signature")
     try:
-        # Загружаем карточки Trello в ChromaDB
-        count = await service.add_trello_cards(collection, settings.trello_board_id, trello_client)
-        return AssistantResponse(answer=f"Загружено {count} карточек из Trello")
-    except ResourceUnavailable as e:
-        # Обрабатываем ошибки Trello API
-        raise HTTPException(status_code=400, detail=f"Trello API error: {str(e)}")
-    except Exception as e:
-        # Обрабатываем остальные ошибки
-        raise HTTPException(status_code=500, detail=f"Failed to load Trello data: {str(e)}")
\ No newline at end of file
+        payload = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Webhook body is not valid JSON")
+    await webhooks.record(body, signature, callback_url)
+    return {"accepted": webhooks.receive(payload)}
+
+# Эндпоинт с метриками: пулы потоков (глубина очереди), кэш эмбеддингов (попадания/промахи),
+# микробатчер (средний размер пакета), открытые доски, очередь вебхуков Trello и допуск запросов
+# (занятые места, очереди и ожидание по приоритетам, отказы, лимиты клиентов)
+@router.get("/stats")
+async def get_stats(
+    service: Annotated[ChromaService, Depends(get_service)],
+    registry: Annotated[CollectionRegistry, Depends(get_registry)],
+    webhooks: Annotated[TrelloWebhookProcessor, Depends(get_webhooks)],
+    settings: Annotated[Settings, Depends(get_app_settings)],
+):
+    embedding_function = settings.chroma_db.embedding_function
+    return {
+        "executors": executor_stats(),
+        "embedding_cache": embedding_function.cache.stats() if embedding_function.cache else None,
+        "embedding_batcher": embedding_function.batcher.stats() if embedding_function.batcher else None,
+        "answer_cache": service.answer_cache.stats() if service.answer_cache else None,
+        "boards": registry.stats(),
+        "trello_webhooks": webhooks.stats(),
+        "admission": admission_stats(),
+    }
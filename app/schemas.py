@@ -3,24 +3,136 @@ from pydantic import BaseModel, Field
 # Импортируем тип для списка векторов
 from typing import List
 
+# Модель параметров поиска (все поля необязательные, по умолчанию берутся из настроек)
+class RetrievalOptions(BaseModel):
+    # Сколько документов передать в промпт
+    n_results: int | None = Field(None, ge=1, le=20)
+    # Вес векторного поиска в reciprocal rank fusion (0 — выключить)
+    vector_weight: float | None = Field(None, ge=0)
+    # Вес BM25 в reciprocal rank fusion (0 — выключить)
+    lexical_weight: float | None = Field(None, ge=0)
+    # Переранжировать кандидатов кросс-энкодером (если модель настроена)
+    rerank: bool | None = None
+
 # Модель для запроса пользователя к ассистенту
 class UserQuery(BaseModel):
     # Запрос (вопрос, например, "Какие задачи в процессе?")
     query: str = Field(..., min_length=1, max_length=500)
     # Контекст (например, данные Trello или дополнительная информация)
     context: str | None = None  # Делаем context опциональным
+    # Доска Trello, по индексу которой искать (по умолчанию — TRELLO_BOARD_ID)
+    board_id: str | None = None
+    # Параметры поиска для этого запроса
+    retrieval: RetrievalOptions | None = None
+    # Вернуть разбивку времени по этапам (эмбеддинг, поиск, промпт, LLM)
+    include_timings: bool = False
 
 # Модель для добавления текста в ChromaDB
 class TextContext(BaseModel):
     # Текст для векторизации и хранения
     text: str = Field(..., min_length=1, max_length=10000)
+    # Доска Trello, в индекс которой добавить текст (по умолчанию — TRELLO_BOARD_ID)
+    board_id: str | None = None
 
 # Модель для ответа ассистента
 class AssistantResponse(BaseModel):
     # Ответ, сгенерированный LLM
     answer: str
+    # True, если ответ взят из кэша ответов (только для /ask)
+    cached: bool | None = None
+    # Время этапов обработки в миллисекундах (если запрошено include_timings)
+    timings: dict[str, float] | None = None
+    # Размер промпта в токенах (None, если ответ из кэша)
+    prompt_tokens: int | None = None
+
+# Модель найденного документа (источника ответа)
+class SourceDocument(BaseModel):
+    # ID документа в ChromaDB
+    id: str
+    # Текст документа
+    text: str
+    # Оценка релевантности (RRF или кросс-энкодер)
+    score: float | None = None
+    # Поле карточки, с которого начинается текст фрагмента после заголовка (для сжатия промпта, в ответ не входит)
+    field: str | None = Field(None, exclude=True)
 
 # Модель для отладки векторов (необязательная)
 class VectorResponse(BaseModel):
     # Список чисел, представляющих эмбеддинг
-    vectors: List[float]
\ No newline at end of file
+    vectors: List[float]
+
+# Модель отчета о синхронизации доски Trello
+class TrelloSyncReport(BaseModel):
+    # ID синхронизированной доски
+    board_id: str
+    # Новые карточки
+    added: int = 0
+    # Карточки с измененным содержимым
+    updated: int = 0
+    # Карточки без изменений (эмбеддинг не пересчитывался)
+    unchanged: int = 0
+    # Удаленные или архивные карточки
+    removed: int = 0
+
+# Модель состояния фоновой синхронизации доски Trello
+class SyncJobStatus(BaseModel):
+    # ID задачи для запроса статуса
+    job_id: str
+    # ID синхронизируемой доски
+    board_id: str
+    # queued, running, completed, failed
+    status: str = "queued"
+    # Этап: fetching, comments, chunking, upserting, done
+    stage: str = "pending"
+    # Время создания, начала и завершения (unix-время)
+    created_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+    # Сколько раз задача запускалась (больше 1 — продолжена после перезапуска)
+    attempts: int = 0
+    # Карточки: получены из Trello, изменились с прошлой синхронизации, нарезаны на фрагменты
+    cards_fetched: int = 0
+    cards_changed: int = 0
+    cards_chunked: int = 0
+    # Фрагменты к записи и уже записанные (эмбеддинг + upsert)
+    chunks_total: int = 0
+    chunks_upserted: int = 0
+    # Скорость записи, фрагментов в секунду, и оценка оставшегося времени, секунды
+    rate: float | None = None
+    eta_seconds: float | None = None
+    # Текст ошибки для status=failed
+    error: str | None = None
+    # Итоговые счетчики для status=completed
+    report: TrelloSyncReport | None = None
+
+# Ошибка одного элемента массовой загрузки (строки NDJSON, файла или раздела)
+class IngestError(BaseModel):
+    # Элемент: "line 12", "notes.md" или "export.ndjson: line 3"
+    item: str
+    # Текст ошибки
+    error: str
+
+# Модель отчета о массовой загрузке документов
+class IngestReport(BaseModel):
+    # Доска, в коллекцию которой загружены документы
+    board_id: str
+    # Элементы загрузки (строки NDJSON, файлы) и сколько из них завершились ошибкой
+    items: int = 0
+    failed_items: int = 0
+    # Записанные документы (разделы текста, карточки), из них карточки Trello, и их фрагменты
+    documents: int = 0
+    cards: int = 0
+    chunks: int = 0
+    # Документы, уже записанные с тем же содержимым (эмбеддинги не пересчитывались)
+    unchanged: int = 0
+    # Повторы документа внутри пакета, записанные один раз
+    duplicates: int = 0
+    # Принятый объем, байты, и время загрузки, секунды
+    bytes: int = 0
+    seconds: float = 0.0
+    # Скорость: документы и фрагменты в секунду
+    documents_per_s: float | None = None
+    chunks_per_s: float | None = None
+    # Все ошибки и первые из них с подробностями (список ограничен INGEST_MAX_ERRORS)
+    errors_total: int = 0
+    errors: list[IngestError] = []
@@ -0,0 +1,130 @@
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+# Сколько последних изменений документов помнить для проверки ответов, генерация которых еще идет
+CHANGE_HISTORY = 10000
+
+
+# Запись кэша: вектор вопроса, ID найденных документов и ответ LLM
+class CachedAnswer:
+    def __init__(self, embedding: np.ndarray, doc_ids: list[str], answer: str):
+        self.embedding = embedding
+        self.doc_ids = frozenset(doc_ids)
+        self.answer = answer
+        self.created_at = time.monotonic()
+
+
+# Семантический кэш ответов: близкий по смыслу вопрос с тем же набором найденных документов
+# получает сохраненный ответ без генерации в Ollama
+class AnswerCache:
+    def __init__(self, max_items: int = 256, ttl_seconds: float = 3600.0, similarity_threshold: float = 0.95):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: OrderedDict[int, CachedAnswer] = OrderedDict()
+        self._next_key = 0
+        # Номер изменения: растет при каждой инвалидации. Снимок номера берется до поиска документов,
+        # и ответ не сохраняется, если его документы менялись после снимка (пока шла генерация)
+        self._generation = 0
+        # Последние изменения: ID документа -> номер изменения; старые вытесняются сверх CHANGE_HISTORY,
+        # для вытесненных считаем, что документ мог меняться вплоть до _forgotten_generation
+        self._changes: OrderedDict[str, int] = OrderedDict()
+        self._forgotten_generation = 0
+        # Обратный индекс: ID документа -> ключи записей, которые на него опираются
+        self._by_document: dict[str, set[int]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_skips = 0
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, key: int):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for doc_id in entry.doc_ids:
+            keys = self._by_document.get(doc_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_document[doc_id]
+
+    def _expired(self, entry: CachedAnswer, now: float) -> bool:
+        return now - entry.created_at > self.ttl_seconds
+
+    def lookup(self, embedding, doc_ids: list[str]) -> str | None:
+        vector = self._normalize(embedding)
+        wanted = frozenset(doc_ids)
+        now = time.monotonic()
+        best_key, best_score = None, self.similarity_threshold
+        for key, entry in list(self._entries.items()):
+            if self._expired(entry, now):
+                self._remove(key)
+                continue
+            if entry.doc_ids != wanted:
+                continue
+            score = float(np.dot(vector, entry.embedding))
+            if score >= best_score:
+                best_key, best_score = key, score
+        if best_key is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key].answer
+
+    # Снимок для store: берется до поиска документов, на которых будет построен ответ
+    def snapshot(self) -> int:
+        return self._generation
+
+    def _changed_since(self, doc_ids: list[str], generation: int) -> bool:
+        return any(self._changes.get(doc_id, self._forgotten_generation) > generation for doc_id in doc_ids)
+
+    def store(self, embedding, doc_ids: list[str], answer: str, generation: int):
+        if self.max_items <= 0:
+            return
+        # Документ изменился, пока генерировался ответ: ответ мог опираться на старый текст
+        if self._changed_since(doc_ids, generation):
+            self.stale_skips += 1
+            return
+        key = self._next_key
+        self._next_key += 1
+        self._entries[key] = CachedAnswer(self._normalize(embedding), doc_ids, answer)
+        for doc_id in doc_ids:
+            self._by_document.setdefault(doc_id, set()).add(key)
+        while len(self._entries) > self.max_items:
+            self._remove(next(iter(self._entries)))
+
+    # Документы изменились или удалены: запоминаем номер изменения и выбрасываем зависящие ответы
+    def invalidate(self, doc_ids: list[str]):
+        self._generation += 1
+        for doc_id in doc_ids:
+            self._changes.pop(doc_id, None)
+            self._changes[doc_id] = self._generation
+            for key in list(self._by_document.get(doc_id, ())):
+                self._remove(key)
+                self.invalidations += 1
+        while len(self._changes) > CHANGE_HISTORY:
+            _, generation = self._changes.popitem(last=False)
+            self._forgotten_generation = max(self._forgotten_generation, generation)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._entries),
+            "max_items": self.max_items,
+            "ttl_seconds": self.ttl_seconds,
+            "similarity_threshold": self.similarity_threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "stale_skips": self.stale_skips,
+        }
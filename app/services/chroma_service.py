@@ -1,124 +1,251 @@
 import logging
-from chromadb import Collection
 from trello import TrelloClient
-from db.chroma_repository import AbstractRepository
-from langchain_community.llms import Ollama
+from chromadb.api.types import EmbeddingFunction
+from db.chroma_repository import AbstractRepository, document_id
+from db.collection_registry import BoardIndex
+from schemas import AssistantResponse, IngestReport, RetrievalOptions, SourceDocument, TrelloSyncReport
+from services.answer_cache import AnswerCache
+from services.chunker import TextChunker
+from services.ingest import IngestPipeline, ItemError, ParsedDocument
+from services.prompt_builder import Prompt, PromptBuilder
+from services.retriever import HybridRetriever
+from services.trello_sync import SyncProgress, TrelloSyncEngine
+from executors import run_embedding, run_io
+from admission import Overloaded, get_admission
+from metrics import DOCUMENTS, QUERIES, record_stage, start_request_timings, timed
+from services.ollama_client import OllamaClient
 import os
+import numpy as np
+import time
+from typing import AsyncIterator, Callable
 
-logging.basicConfig(level=logging.INFO)
+# Уровень логов из окружения; подробности запросов пишутся на DEBUG и при INFO почти ничего не стоят
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
+
 class ChromaService:
-    def __init__(self, repo: AbstractRepository):
+    def __init__(
+        self,
+        repo: AbstractRepository,
+        llm: OllamaClient,
+        embedding_function: EmbeddingFunction,
+        answer_cache: AnswerCache | None = None,
+        chunker: TextChunker | None = None,
+        retriever: HybridRetriever | None = None,
+        prompt_builder: PromptBuilder | None = None,
+    ):
         self.repo = repo
-        self.llm = Ollama(model="llama3.2", base_url="http://localhost:11434")
+        self.chunker = chunker
+        self.retriever = retriever or HybridRetriever()
+        self.prompt_builder = prompt_builder or PromptBuilder()
+        self.llm = llm
+        self.embedding_function = embedding_function
+        self.answer_cache = answer_cache
+
+    # Сбрасываем кэшированные ответы, опиравшиеся на измененные документы
+    def invalidate_documents(self, doc_ids: list[str]):
+        if self.answer_cache is not None and doc_ids:
+            self.answer_cache.invalidate(doc_ids)
 
-    async def add_document(self, collection: Collection, document: str) -> str:
-        logger.info(f"Adding document to Chroma: {document[:50]}...")
+    async def add_document(self, index: BoardIndex, document: str) -> str:
+        logger.debug("Adding document to Chroma: %.50s...", document)
         try:
-            result = await self.repo.add_document(document, collection)
-            logger.info(f"Successfully added document to Chroma")
+            result, added = await self.repo.add_document(document, index)
+            if added:
+                self.invalidate_documents([document_id(result)])
+                logger.debug("Successfully added document to Chroma")
+            else:
+                # Документ с тем же текстом уже был: ответы на его основе остаются верными, кэш не сбрасываем
+                logger.debug("Document already in Chroma, skipped embedding")
             return result
+        except Overloaded:
+            raise
         except Exception as e:
-            logger.error(f"Failed to add document to Chroma: {str(e)}")
+            logger.error("Failed to add document to Chroma: %s", e)
             raise Exception(f"Failed to add document: {str(e)}")
 
-    async def query(self, query: str, collection: Collection) -> str:
-        logger.info(f"Received query: {query}")
-        try:
-            # Поиск релевантных карточек в Chroma
-            results = collection.query(query_texts=[query], n_results=3)
-            trello_context = "\n".join(results["documents"][0]) if results["documents"] else "Нет данных Trello"
-            logger.info(f"Retrieved Trello context: {trello_context[:100]}...")
-
-            # Формируем промпт с найденными данными
-            prompt = (
-                "Ты ассистент, который помогает с задачами на Trello-доске. "
-                "Вот релевантные данные с Trello-доски:\n\n"
-                f"{trello_context}\n\n"
-                f"Ответь на вопрос: {query}\n"
-                "Форматируй ответ как список задач, указывая название, колонку и дедлайн. "
-                "Если данные нерелевантны, напиши: 'Нет подходящих задач'."
-            )
+    # Эмбеддинг запроса считается вне event loop (и попадает в кэш эмбеддингов)
+    async def embed_query(self, query: str) -> np.ndarray:
+        with timed("embed"):
+            embeddings = await run_embedding(self.embedding_function, [query])
+        return embeddings[0]
+
+    # Фильтры из вопроса (колонка, участник, метка, дедлайн) в виде where-условия Chroma
+    async def plan_filters(self, query: str, index: BoardIndex) -> dict | None:
+        with timed("plan"):
+            if not index.vocabulary.loaded:
+                await run_io(index.vocabulary.load, index.collection)
+            where = index.planner.plan(query)
+        if where is not None:
+            logger.debug("Query filters: %s", where)
+        return where
+
+    # Источники ответа: фильтры из вопроса, затем гибридный поиск
+    async def retrieve(
+        self, query: str, query_embedding: np.ndarray, index: BoardIndex, options: RetrievalOptions | None
+    ) -> list[SourceDocument]:
+        where = await self.plan_filters(query, index)
+        sources = await self.retriever.retrieve(query, query_embedding, index, where, options)
+        DOCUMENTS.labels("retrieved").inc(len(sources))
+        return sources
+
+    # Формируем промпт с найденными данными в пределах бюджета токенов
+    @timed("prompt")
+    def build_prompt(self, query: str, sources: list[SourceDocument]) -> Prompt:
+        prompt = self.prompt_builder.build(query, sources)
+        logger.debug(
+            "Prompt: %d tokens, %d of %d sources (%d duplicates, %d over budget)",
+            prompt.tokens, len(prompt.context.sources), len(sources),
+            prompt.context.deduplicated, prompt.context.over_budget,
+        )
+        return prompt
 
-            # Отправляем запрос в Ollama
-            response = await self.llm.ainvoke(prompt)
-            logger.info(f"LLM response: {response}")
-            return response
+    # Ищем сохраненный ответ для близкого вопроса с тем же набором документов
+    def cached_answer(self, query_embedding: np.ndarray, sources: list[SourceDocument]) -> str | None:
+        if self.answer_cache is None:
+            return None
+        return self.answer_cache.lookup(query_embedding, [source.id for source in sources])
+
+    # Снимок кэша ответов до поиска: ответ не сохранится, если документы изменятся во время генерации
+    def answer_snapshot(self) -> int:
+        return self.answer_cache.snapshot() if self.answer_cache is not None else 0
+
+    def remember_answer(self, query_embedding: np.ndarray, sources: list[SourceDocument], answer: str, snapshot: int):
+        if self.answer_cache is not None:
+            self.answer_cache.store(query_embedding, [source.id for source in sources], answer, snapshot)
+
+    # include_timings=True добавляет в ответ разбивку времени по этапам (мс)
+    async def query(
+        self,
+        query: str,
+        index: BoardIndex,
+        options: RetrievalOptions | None = None,
+        include_timings: bool = False,
+    ) -> AssistantResponse:
+        logger.debug("Received query: %s", query)
+        timings = start_request_timings()
+        started = time.perf_counter()
+        try:
+            query_embedding = await self.embed_query(query)
+            snapshot = self.answer_snapshot()
+            sources = await self.retrieve(query, query_embedding, index, options)
+            cached = self.cached_answer(query_embedding, sources)
+            if cached is not None:
+                logger.debug("Answer served from cache")
+                response, source = AssistantResponse(answer=cached, cached=True), "cache"
+            else:
+                prompt = self.build_prompt(query, sources)
+                # Отправляем запрос в Ollama, когда освободится место в бюджете генераций
+                async with get_admission().llm.slot():
+                    answer = await self.llm.ainvoke(prompt.text)
+                logger.debug("LLM answered with %d characters", len(answer))
+                self.remember_answer(query_embedding, sources, answer, snapshot)
+                response = AssistantResponse(answer=answer, cached=False, prompt_tokens=prompt.tokens)
+                source = "llm"
+        except Overloaded:
+            # Перегрузка — не ошибка запроса: клиент получит 503 с Retry-After
+            raise
         except Exception as e:
-            logger.error(f"Error processing query with LLM: {str(e)}")
+            logger.error("Error processing query with LLM: %s", e)
             raise Exception(f"Query failed: {str(e)}")
+        record_stage("query", time.perf_counter() - started)
+        QUERIES.labels("ask", source).inc()
+        if include_timings:
+            response.timings = timings
+        return response
 
-    async def add_trello_cards(self, collection: Collection, board_id: str, trello_client: TrelloClient) -> int:
-        logger.info(f"Attempting to fetch board {board_id}")
+    # Потоковый вариант query: сначала найденные источники, затем токены по мере генерации
+    async def query_stream(
+        self,
+        query: str,
+        index: BoardIndex,
+        options: RetrievalOptions | None = None,
+        include_timings: bool = False,
+    ) -> AsyncIterator[dict]:
+        logger.debug("Received streaming query: %s", query)
+        timings = start_request_timings()
+        started = time.perf_counter()
         try:
-            board = trello_client.get_board(board_id)
-            logger.info(f"Successfully fetched board {board_id}")
+            query_embedding = await self.embed_query(query)
+            snapshot = self.answer_snapshot()
+            sources = await self.retrieve(query, query_embedding, index, options)
+            cached = self.cached_answer(query_embedding, sources)
+            sources_event = {
+                "event": "sources",
+                "sources": [source.model_dump() for source in sources],
+                "cached": cached is not None,
+            }
+            prompt_tokens = None
+            if cached is not None:
+                # Сохраненный ответ отдаем одним событием
+                yield sources_event
+                yield {"event": "token", "text": cached}
+            else:
+                prompt = self.build_prompt(query, sources)
+                prompt_tokens = prompt.tokens
+                chunks = []
+                # Место в бюджете генераций берем до первого события (перегрузка — 503 до начала потока)
+                # и держим, пока идет поток
+                async with get_admission().llm.slot():
+                    yield sources_event
+                    async for chunk in self.llm.astream(prompt.text):
+                        chunks.append(chunk)
+                        yield {"event": "token", "text": chunk}
+                self.remember_answer(query_embedding, sources, "".join(chunks), snapshot)
+            record_stage("query", time.perf_counter() - started)
+            QUERIES.labels("stream", "cache" if cached is not None else "llm").inc()
+            done = {"event": "done", "prompt_tokens": prompt_tokens}
+            if include_timings:
+                done["timings"] = timings
+            yield done
+        except Overloaded:
+            raise
         except Exception as e:
-            logger.error(f"Failed to fetch board {board_id}: {str(e)}")
-            raise Exception(f"Failed to fetch board: {str(e)}")
+            # Ответ уже начал передаваться, поэтому ошибку отправляем последним событием
+            logger.error("Error streaming query with LLM: %s", e)
+            yield {"event": "error", "detail": f"Query failed: {str(e)}"}
 
-        logger.info("Fetching all cards from board")
+    # Синхронизация доски index.board_id с ее коллекцией
+    async def add_trello_cards(
+        self,
+        index: BoardIndex,
+        trello_client: TrelloClient,
+        progress: SyncProgress | None = None,
+    ) -> TrelloSyncReport:
+        board_id = index.board_id
+        logger.info("Syncing board %s", board_id)
         try:
-            cards = board.all_cards()
-            logger.info(f"Successfully fetched {len(cards)} cards")
+            engine = TrelloSyncEngine(
+                index.collection,
+                trello_client,
+                chunker=self.chunker,
+                lexical_index=index.lexical_index,
+                on_change=self.invalidate_documents,
+                progress=progress,
+            )
+            report = await engine.sync(board_id)
+            # Колонки, участники и метки могли измениться — словарь перечитаем при следующем запросе
+            index.vocabulary.mark_stale()
+            return report
         except Exception as e:
-            logger.error(f"Failed to fetch cards: {str(e)}")
-            raise Exception(f"Failed to fetch cards: {str(e)}")
-
-        count = 0
-        documents = []
-        ids = []
-        with open("trello_cards.txt", "w", encoding="utf-8") as f:
-            for card in cards:
-                logger.info(f"Processing card: {card.name}")
-                try:
-                    list_name = card.get_list().name
-                except Exception as e:
-                    logger.error(f"Failed to fetch list for card {card.name}: {str(e)}")
-                    list_name = "Неизвестно"
-
-                try:
-                    members = []
-                    for member_id in card.member_ids:
-                        logger.info(f"Fetching member {member_id}")
-                        try:
-                            member = trello_client.get_member(member_id)
-                            members.append(member.fullName)
-                        except Exception as e:
-                            logger.error(f"Failed to fetch member {member_id}: {str(e)}")
-                            members.append(f"Ошибка: {str(e)}")
-                    members_str = ", ".join(members) if members else "Нет"
-                except Exception as e:
-                    logger.error(f"Failed to process members for card {card.name}: {str(e)}")
-                    members_str = "Ошибка при получении участников"
-
-                try:
-                    due = card.due_date.strftime("%Y-%m-%d") if card.due_date else "Нет"
-                except Exception as e:
-                    logger.error(f"Failed to process due date for card {card.name}: {str(e)}")
-                    due = "Неизвестно"
-
-                try:
-                    comments = "\n".join([c["data"]["text"] for c in card.comments]) if card.comments else "Нет"
-                except Exception as e:
-                    logger.error(f"Failed to process comments for card {card.name}: {str(e)}")
-                    comments = "Неизвестно"
-
-                text = f"Задача: {card.name}\nКолонка: {list_name}\nОтветственный: {members_str}\nДедлайн: {due}\nОписание: {card.description or 'Нет'}\nКомментарии: {comments}\n---\n"
-                f.write(text)
-                documents.append(text)
-                ids.append(f"card_{count}")
-                count += 1
-
-        # Добавляем карточки в Chroma
-        if documents:
-            try:
-                collection.add(documents=documents, ids=ids)
-                logger.info(f"Added {len(documents)} cards to Chroma collection")
-            except Exception as e:
-                logger.error(f"Failed to add cards to Chroma: {str(e)}")
-                raise Exception(f"Failed to add cards to Chroma: {str(e)}")
-
-        logger.info(f"Logged {count} cards from board {board_id}")
-        return count
\ No newline at end of file
+            logger.error("Failed to sync board %s: %s", board_id, e)
+            raise
+
+    # Массовая загрузка разобранных документов в коллекцию доски; received — сколько байт принято
+    async def ingest(
+        self,
+        index: BoardIndex,
+        documents: AsyncIterator[ParsedDocument | ItemError],
+        received: Callable[[], int],
+        batch_size: int = 64,
+        max_errors: int = 100,
+    ) -> IngestReport:
+        pipeline = IngestPipeline(
+            index,
+            chunker=self.chunker,
+            batch_size=batch_size,
+            max_errors=max_errors,
+            on_change=self.invalidate_documents,
+        )
+        return await pipeline.run(documents, received)
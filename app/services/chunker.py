@@ -0,0 +1,114 @@
+import re
+from functools import cached_property
+from typing import Callable
+
+# Границы предложений: после . ! ? … и перед пробелом
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…])\s+")
+
+
+# Фрагмент документа с позицией внутри родителя; line — строка body, с которой начинается фрагмент
+class Chunk:
+    def __init__(self, text: str, index: int, count: int, line: int = 0):
+        self.text = text
+        self.index = index
+        self.count = count
+        self.line = line
+
+
+# Делит длинные тексты на фрагменты по токенам модели эмбеддингов
+# с перекрытием и разрывами по строкам (полям карточек Trello) и предложениям
+class TextChunker:
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int],
+        max_tokens: int = 200,
+        overlap_tokens: int = 30,
+        model_max_tokens: Callable[[], int] | None = None,
+    ):
+        self.count_tokens = count_tokens
+        self._max_tokens = max_tokens
+        self._overlap_tokens = overlap_tokens
+        # Окно модели известно только после ее загрузки, поэтому ограничиваем им размер при первой нарезке
+        self.model_max_tokens = model_max_tokens
+
+    # Размер фрагмента не больше окна модели (минус служебные токены)
+    @cached_property
+    def max_tokens(self) -> int:
+        if self.model_max_tokens is None:
+            return self._max_tokens
+        return min(self._max_tokens, self.model_max_tokens() - 2)
+
+    @cached_property
+    def overlap_tokens(self) -> int:
+        return min(self._overlap_tokens, self.max_tokens // 2)
+
+    # Сегменты (текст, токены, разделитель перед ним, номер строки): строки, затем предложения внутри строк,
+    # слишком длинные предложения — по словам
+    def segments(self, text: str, budget: int) -> list[tuple[str, int, str, int]]:
+        result = []
+        for line_number, line in enumerate(text.split("\n")):
+            line = line.strip()
+            if not line:
+                continue
+            separator = "\n"
+            for sentence in SENTENCE_BOUNDARY.split(line):
+                tokens = self.count_tokens(sentence)
+                pieces = [(sentence, tokens)] if tokens <= budget else self.split_words(sentence, budget)
+                for piece, piece_tokens in pieces:
+                    result.append((piece, piece_tokens, separator, line_number))
+                    separator = " "
+        return result
+
+    def split_words(self, sentence: str, budget: int) -> list[tuple[str, int]]:
+        pieces, current = [], []
+        for word in sentence.split():
+            candidate = " ".join(current + [word])
+            if current and self.count_tokens(candidate) > budget:
+                piece = " ".join(current)
+                pieces.append((piece, self.count_tokens(piece)))
+                current = [word]
+            else:
+                current.append(word)
+        if current:
+            piece = " ".join(current)
+            pieces.append((piece, self.count_tokens(piece)))
+        return pieces
+
+    # header повторяется в начале каждого фрагмента (например, название, колонка и дедлайн карточки)
+    def chunk(self, body: str, header: str = "") -> list[Chunk]:
+        full_text = f"{header}{body}"
+        if self.count_tokens(full_text) <= self.max_tokens:
+            return [Chunk(full_text, 0, 1)]
+
+        budget = max(self.max_tokens - self.count_tokens(header), self.max_tokens // 4)
+        groups: list[list[tuple[str, int, str, int]]] = []
+        current: list[tuple[str, int, str, int]] = []
+        current_tokens = 0
+        for segment in self.segments(body, budget):
+            if current and current_tokens + segment[1] > budget:
+                groups.append(current)
+                # Перекрытие: переносим хвостовые сегменты предыдущего фрагмента
+                overlap, overlap_tokens = [], 0
+                for previous in reversed(current):
+                    if overlap_tokens + previous[1] > self.overlap_tokens:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_tokens += previous[1]
+                if overlap_tokens + segment[1] > budget:
+                    overlap, overlap_tokens = [], 0
+                current, current_tokens = overlap, overlap_tokens
+            current.append(segment)
+            current_tokens += segment[1]
+        if current:
+            groups.append(current)
+
+        texts = [
+            header + "".join(separator + text if i else text for i, (text, _, separator, _) in enumerate(group))
+            for group in groups
+        ]
+        return [Chunk(text, index, len(texts), group[0][3]) for index, (text, group) in enumerate(zip(texts, groups))]
+
+
+# ID фрагмента по ID родительского документа
+def chunk_id(parent_id: str, index: int) -> str:
+    return f"{parent_id}#{index}"
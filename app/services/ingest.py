@@ -0,0 +1,416 @@
+import json
+import logging
+import time
+from typing import AsyncIterator, Callable
+from starlette.datastructures import UploadFile
+from db.chroma_repository import document_id
+from db.collection_registry import BoardIndex
+from executors import run_embedding, run_io
+from metrics import DOCUMENTS
+from schemas import IngestError, IngestReport
+from services.chunker import Chunk, TextChunker, chunk_id
+from services.trello_loader import BoardSnapshot
+from services.trello_sync import (
+    TRELLO_SOURCE, build_card_body, build_card_header, card_document_id, card_metadata, chunk_metadata, content_hash,
+)
+
+logger = logging.getLogger(__name__)
+
+# Метка источника в метаданных Chroma для загруженных документов и файлов
+UPLOAD_SOURCE = "upload"
+# Форматы: Markdown, простой текст и экспорт доски Trello (JSON)
+FORMATS = ("markdown", "text", "trello")
+# Формат файла по расширению; .ndjson/.jsonl — несколько документов построчно, как тело NDJSON-запроса
+EXTENSIONS = {
+    ".md": "markdown",
+    ".markdown": "markdown",
+    ".txt": "text",
+    ".json": "trello",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+}
+
+
+def file_format(filename: str) -> str | None:
+    dot = filename.rfind(".")
+    return EXTENSIONS.get(filename[dot:].lower()) if dot >= 0 else None
+
+
+# Документ, готовый к нарезке: header повторяется в каждом фрагменте
+class ParsedDocument:
+    def __init__(self, item: str, doc_id: str, header: str, body: str, metadata: dict):
+        self.item = item
+        self.doc_id = doc_id
+        self.header = header
+        self.body = body
+        self.metadata = metadata
+
+
+# Ошибка разбора одного элемента загрузки: пайплайн записывает ее в отчет и продолжает со следующего
+class ItemError:
+    def __init__(self, item: str, error: str):
+        self.item = item
+        self.error = error
+
+
+# Разделы текста не длиннее max_chars: у Markdown граница — заголовок, у текста — пустая строка.
+# Строки приходят потоком, поэтому в памяти только текущий раздел
+async def iter_sections(
+    lines: AsyncIterator[str], markdown: bool, max_chars: int
+) -> AsyncIterator[tuple[str, str]]:
+    heading, buffer, size = "", [], 0
+    async for line in lines:
+        line = line.rstrip("\r\n")
+        boundary = line.startswith("#") if markdown else not line.strip()
+        if (boundary and buffer) or size + len(line) > max_chars:
+            text = "\n".join(buffer).strip()
+            if text:
+                yield heading, text
+            buffer, size = [], 0
+        if markdown and line.startswith("#"):
+            heading = line.lstrip("#").strip()
+        if line.strip() or buffer:
+            # Строка длиннее раздела режется на куски
+            while len(line) > max_chars:
+                yield heading, line[:max_chars]
+                line = line[max_chars:]
+            buffer.append(line)
+            size += len(line) + 1
+    text = "\n".join(buffer).strip()
+    if text:
+        yield heading, text
+
+
+async def iter_text_lines(text: str) -> AsyncIterator[str]:
+    for line in text.split("\n"):
+        yield line
+
+
+# Документы из Markdown или текста: каждый раздел — отдельный документ с ID по содержимому
+async def parse_text(
+    item: str, name: str, lines: AsyncIterator[str], markdown: bool, max_chars: int, extra: dict | None = None
+) -> AsyncIterator[ParsedDocument]:
+    text_format = "markdown" if markdown else "text"
+    async for heading, text in iter_sections(lines, markdown, max_chars):
+        title = f"{name} — {heading}" if heading and name else heading or name
+        header = f"Документ: {title}\n" if title else ""
+        metadata = {
+            **(extra or {}),
+            "source": UPLOAD_SOURCE,
+            "name": name,
+            "format": text_format,
+            "content_hash": content_hash(header + text),
+        }
+        # ID по содержимому: повторная загрузка того же текста попадает в те же записи
+        yield ParsedDocument(item, document_id(header + text), header, text, metadata)
+
+
+# Карточки из экспорта доски Trello (JSON меню «Печать и экспорт»): те же документы и метаданные,
+# что и при синхронизации через API, поэтому последующая синхронизация их не дублирует
+def parse_trello_export(item: str, data: dict, board_id: str) -> list[ParsedDocument]:
+    if not isinstance(data, dict) or not isinstance(data.get("cards"), list):
+        raise ValueError("not a Trello board export: 'cards' list is missing")
+    cards = [card for card in data["cards"] if not card.get("closed")]
+    snapshot = BoardSnapshot(board_id, data.get("lists", []), data.get("members", []), cards)
+    for action in data.get("actions", []):
+        if action.get("type", "commentCard") != "commentCard":
+            continue
+        action_data = action.get("data", {})
+        card_id = action_data.get("card", {}).get("id")
+        if card_id and "text" in action_data:
+            snapshot.comments.setdefault(card_id, []).append(action_data["text"])
+    documents = []
+    for card in cards:
+        header = build_card_header(card, snapshot)
+        body = build_card_body(card, snapshot)
+        metadata = {
+            "source": TRELLO_SOURCE,
+            "card_id": card["id"],
+            "content_hash": content_hash(header + body),
+            "date_last_activity": card.get("dateLastActivity") or "",
+            **card_metadata(card, snapshot),
+        }
+        documents.append(ParsedDocument(item, card_document_id(card["id"]), header, body, metadata))
+    return documents
+
+
+# Элемент NDJSON: {"text": ..., "name": ..., "format": "markdown" | "text", "metadata": {...}}
+# или {"format": "trello", "board": <экспорт доски>}
+async def parse_ndjson_item(
+    item: str, record: dict, board_id: str, max_chars: int
+) -> AsyncIterator[ParsedDocument]:
+    if not isinstance(record, dict):
+        raise ValueError("expected a JSON object")
+    item_format = record.get("format", "text")
+    if item_format not in FORMATS:
+        raise ValueError(f"unknown format {item_format!r}, expected one of {', '.join(FORMATS)}")
+    if item_format == "trello":
+        for document in parse_trello_export(item, record.get("board"), board_id):
+            yield document
+        return
+    text = record.get("text")
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError("'text' must be a non-empty string")
+    # Chroma хранит в метаданных только скалярные значения
+    extra = {
+        key: value for key, value in (record.get("metadata") or {}).items()
+        if isinstance(value, (str, int, float, bool))
+    }
+    lines = iter_text_lines(text)
+    async for document in parse_text(item, record.get("name", ""), lines, item_format == "markdown", max_chars, extra):
+        yield document
+
+
+# Строки потока байтов. Начало незавершенной строки копится списком кусков и склеивается один раз,
+# когда приходит конец строки. Строка длиннее max_line_bytes не копится в памяти: при split_long
+# отдается кусками, иначе пропускается до конца строки с ошибкой (обрезанный NDJSON — все равно
+# невалидный JSON)
+async def iter_lines(
+    chunks: AsyncIterator[bytes], max_line_bytes: int, split_long: bool = False
+) -> AsyncIterator[bytes | ItemError]:
+    pending: list[bytes] = []
+    pending_bytes, overflow, number = 0, False, 0
+    async for chunk in chunks:
+        start = 0
+        while (end := chunk.find(b"\n", start)) >= 0:
+            number += 1
+            if overflow or pending_bytes + end - start > max_line_bytes and not split_long:
+                overflow = False
+                yield ItemError(f"line {number}", f"line is longer than {max_line_bytes} bytes")
+            else:
+                yield b"".join(pending) + chunk[start:end] if pending else chunk[start:end]
+            pending, pending_bytes, start = [], 0, end + 1
+        if overflow or start == len(chunk):
+            continue
+        pending.append(chunk[start:] if start else chunk)
+        pending_bytes += len(chunk) - start
+        if pending_bytes > max_line_bytes:
+            if split_long:
+                yield b"".join(pending)
+            else:
+                overflow = True
+            pending, pending_bytes = [], 0
+    if overflow:
+        yield ItemError(f"line {number + 1}", f"line is longer than {max_line_bytes} bytes")
+    elif pending:
+        yield b"".join(pending)
+
+
+# Документы из тела NDJSON: одна строка — один элемент, ошибки разбора не прерывают загрузку
+async def parse_ndjson(
+    chunks: AsyncIterator[bytes], board_id: str, max_chars: int, max_line_bytes: int, prefix: str = ""
+) -> AsyncIterator[ParsedDocument | ItemError]:
+    number = 0
+    async for line in iter_lines(chunks, max_line_bytes):
+        number += 1
+        if isinstance(line, ItemError):
+            yield ItemError(f"{prefix}{line.item}", line.error)
+            continue
+        if not line.strip():
+            continue
+        item = f"{prefix}line {number}"
+        try:
+            async for document in parse_ndjson_item(item, json.loads(line), board_id, max_chars):
+                yield document
+        except (ValueError, KeyError, TypeError) as e:
+            yield ItemError(item, str(e))
+
+
+async def iter_file(file: UploadFile, chunk_size: int = 65536) -> AsyncIterator[bytes]:
+    while data := await file.read(chunk_size):
+        yield data
+
+
+async def iter_decoded(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[str]:
+    async for line in iter_lines(chunks, max_line_bytes, split_long=True):
+        yield line.decode("utf-8", errors="replace")
+
+
+# Документы из загруженного файла; формат определяется по расширению
+async def parse_file(
+    file: UploadFile, board_id: str, max_chars: int, max_line_bytes: int, max_json_bytes: int
+) -> AsyncIterator[ParsedDocument | ItemError]:
+    item = file.filename or "file"
+    upload_format = file_format(item)
+    if upload_format is None:
+        yield ItemError(item, f"unsupported file type, expected one of {', '.join(EXTENSIONS)}")
+        return
+    if upload_format == "ndjson":
+        async for document in parse_ndjson(iter_file(file), board_id, max_chars, max_line_bytes, prefix=f"{item}: "):
+            yield document
+        return
+    if upload_format == "trello":
+        # Экспорт доски — один JSON-документ, его приходится читать целиком, поэтому размер ограничен
+        if file.size is not None and file.size > max_json_bytes:
+            yield ItemError(item, f"Trello export is larger than {max_json_bytes} bytes")
+            return
+        try:
+            documents = parse_trello_export(item, json.loads(await file.read()), board_id)
+        except (ValueError, KeyError, TypeError) as e:
+            yield ItemError(item, str(e))
+            return
+        for document in documents:
+            yield document
+        return
+    lines = iter_decoded(iter_file(file), max(max_line_bytes, max_chars))
+    async for document in parse_text(item, item, lines, upload_format == "markdown", max_chars):
+        yield document
+
+
+# Документы из всех файлов multipart-запроса по очереди
+async def parse_files(
+    files: list[UploadFile], board_id: str, max_chars: int, max_line_bytes: int, max_json_bytes: int
+) -> AsyncIterator[ParsedDocument | ItemError]:
+    for file in files:
+        async for document in parse_file(file, board_id, max_chars, max_line_bytes, max_json_bytes):
+            yield document
+
+
+# Поток байтов тела запроса со счетчиком для отчета о скорости
+class CountingStream:
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self.chunks = chunks
+        self.received = 0
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.chunks:
+            self.received += len(chunk)
+            yield chunk
+
+
+# Загрузка документов в коллекцию доски пакетами: разбор, нарезка, эмбеддинги и upsert идут потоком,
+# в памяти не больше одного пакета фрагментов и текущего раздела
+class IngestPipeline:
+    def __init__(
+        self,
+        index: BoardIndex,
+        chunker: TextChunker | None = None,
+        batch_size: int = 64,
+        max_errors: int = 100,
+        on_change: Callable[[list[str]], None] | None = None,
+    ):
+        self.index = index
+        self.chunker = chunker
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.on_change = on_change
+        self.report = IngestReport(board_id=index.board_id)
+        self._items: set[str] = set()
+        self._failed: set[str] = set()
+        self._ids, self._documents, self._metadatas = [], [], []
+        # ID документа -> (элемент загрузки, ID его фрагментов, хэш содержимого) в текущем пакете
+        self._parents: dict[str, tuple[str, list[str], str]] = {}
+
+    def error(self, item: str, error: str):
+        self._failed.add(item)
+        self.report.errors_total += 1
+        if len(self.report.errors) < self.max_errors:
+            self.report.errors.append(IngestError(item=item, error=error))
+
+    def chunk(self, document: ParsedDocument) -> tuple[list, list, list]:
+        if self.chunker:
+            chunks = self.chunker.chunk(document.body, header=document.header)
+        else:
+            chunks = [Chunk(document.header + document.body, 0, 1)]
+        metadata = {**document.metadata, "board_id": self.index.board_id, "parent_id": document.doc_id}
+        ids = [chunk_id(document.doc_id, chunk.index) for chunk in chunks]
+        documents = [chunk.text for chunk in chunks]
+        metadatas = [chunk_metadata(metadata, document.body, chunk) for chunk in chunks]
+        return ids, documents, metadatas
+
+    # Сохраненные фрагменты документов пакета: ID документа -> (хэш содержимого, ID фрагментов)
+    def stored_chunks(self, parent_ids: list[str]) -> dict[str, tuple[str | None, set[str]]]:
+        stored = self.index.collection.get(where={"parent_id": {"$in": parent_ids}}, include=["metadatas"])
+        result: dict[str, tuple[str | None, set[str]]] = {}
+        for stored_id, metadata in zip(stored["ids"], stored["metadatas"]):
+            metadata = metadata or {}
+            entry = result.setdefault(metadata.get("parent_id", stored_id), (metadata.get("content_hash"), set()))
+            entry[1].add(stored_id)
+        return result
+
+    async def flush(self):
+        if not self._ids:
+            return
+        ids, documents, metadatas = self._ids, self._documents, self._metadatas
+        parents = self._parents
+        self._ids, self._documents, self._metadatas, self._parents = [], [], [], {}
+        try:
+            stored = await run_io(self.stored_chunks, list(parents))
+            # Документ уже записан с тем же содержимым и теми же фрагментами — эмбеддинги не пересчитываем
+            unchanged = {
+                doc_id for doc_id, (_, chunk_ids, text_hash) in parents.items()
+                if doc_id in stored and stored[doc_id] == (text_hash, set(chunk_ids))
+            }
+            if unchanged:
+                keep = [i for i, metadata in enumerate(metadatas) if metadata["parent_id"] not in unchanged]
+                ids = [ids[i] for i in keep]
+                documents = [documents[i] for i in keep]
+                metadatas = [metadatas[i] for i in keep]
+            # Фрагменты прежних версий, которых нет среди новых (например, карточка стала короче)
+            current = set(ids)
+            stale = [
+                stored_id for doc_id, (_, stored_ids) in stored.items() if doc_id not in unchanged
+                for stored_id in stored_ids if stored_id not in current
+            ]
+            if stale:
+                await run_io(self.index.collection.delete, ids=stale)
+                await run_io(self.index.lexical_index.delete, stale)
+                DOCUMENTS.labels("removed").inc(len(stale))
+            if ids:
+                # upsert считает эмбеддинги всего пакета одним вызовом модели
+                await run_embedding(self.index.collection.upsert, ids=ids, documents=documents, metadatas=metadatas)
+                await run_io(self.index.lexical_index.upsert, ids, documents, metadatas)
+        except Exception as e:
+            logger.error("Failed to upsert %d chunks into board %s: %s", len(ids), self.index.board_id, e)
+            for item in {item for item, _, _ in parents.values()}:
+                self.error(item, f"upsert failed: {e}")
+            return
+        DOCUMENTS.labels("embedded").inc(len(ids))
+        DOCUMENTS.labels("unchanged").inc(len(unchanged))
+        self.report.unchanged += len(unchanged)
+        self.report.documents += len(parents) - len(unchanged)
+        self.report.chunks += len(ids)
+        cards = sum(1 for metadata in metadatas if metadata["source"] == TRELLO_SOURCE and metadata["chunk_index"] == 0)
+        if cards:
+            self.report.cards += cards
+            # Колонки, участники и метки могли измениться — словарь перечитаем при следующем запросе
+            self.index.vocabulary.mark_stale()
+        if self.on_change is not None:
+            self.on_change([doc_id for doc_id in parents if doc_id not in unchanged])
+
+    async def add(self, document: ParsedDocument):
+        self._items.add(document.item)
+        if document.doc_id in self._parents:
+            # Тот же документ уже в пакете (повтор в загрузке) — второй раз не пишем
+            self.report.duplicates += 1
+            return
+        ids, documents, metadatas = await run_embedding(self.chunk, document)
+        self._parents[document.doc_id] = (document.item, ids, document.metadata["content_hash"])
+        self._ids.extend(ids)
+        self._documents.extend(documents)
+        self._metadatas.extend(metadatas)
+        if len(self._ids) >= self.batch_size:
+            await self.flush()
+
+    async def run(self, documents: AsyncIterator[ParsedDocument | ItemError], received: Callable[[], int]) -> IngestReport:
+        started = time.perf_counter()
+        async for document in documents:
+            if isinstance(document, ItemError):
+                self._items.add(document.item)
+                self.error(document.item, document.error)
+            else:
+                await self.add(document)
+        await self.flush()
+        report = self.report
+        report.items = len(self._items)
+        report.failed_items = len(self._failed)
+        report.bytes = received()
+        report.seconds = time.perf_counter() - started
+        if report.seconds > 0:
+            report.documents_per_s = report.documents / report.seconds
+            report.chunks_per_s = report.chunks / report.seconds
+        logger.info(
+            "Ingested into board %s: %d items, %d documents, %d chunks, %d errors in %.1fs",
+            report.board_id, report.items, report.documents, report.chunks, report.errors_total, report.seconds,
+        )
+        return report
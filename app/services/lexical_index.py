@@ -0,0 +1,167 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from chromadb import Collection
+
+# Слова текста (кириллица, латиница, цифры)
+WORD = re.compile(r"[\w-]+", re.UNICODE)
+# Длина префикса слова, который считается термом BM25
+TERM_PREFIX_LENGTH = 5
+# Сколько документов читаем из Chroma за один запрос при построении индекса
+LOAD_PAGE_SIZE = 1000
+
+
+# Грубая основа слова для русской морфологии: "Ивана" и "Иваном" совпадают с "Иван"
+def stem(word: str) -> str:
+    word = word.casefold()
+    if len(word) > 5:
+        return word[:-2]
+    if len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def words(text: str) -> list[str]:
+    return [word.casefold() for word in WORD.findall(text)]
+
+
+# Термы для BM25: слова в нижнем регистре, обрезанные до общего префикса, чтобы формы одного слова
+# ("релизы", "релизов") давали один терм. Номера задач и другие токены с цифрами не обрезаем
+def terms(text: str) -> list[str]:
+    return [
+        word if any(char.isdigit() for char in word) else word[:TERM_PREFIX_LENGTH]
+        for word in words(text)
+    ]
+
+
+# Проверка метаданных на where-условие Chroma (операторы, которые строит QueryPlanner)
+def matches_where(metadata: dict, where: dict | None) -> bool:
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, part) for part in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if operator == "$eq" and value != operand:
+                    return False
+                if operator == "$ne" and value == operand:
+                    return False
+                if operator == "$in" and value not in operand:
+                    return False
+                if operator == "$nin" and value in operand:
+                    return False
+                if operator in ("$lt", "$lte", "$gt", "$gte"):
+                    if value is None:
+                        return False
+                    if operator == "$lt" and not value < operand:
+                        return False
+                    if operator == "$lte" and not value <= operand:
+                        return False
+                    if operator == "$gt" and not value > operand:
+                        return False
+                    if operator == "$gte" and not value >= operand:
+                        return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+# Инвертированный индекс BM25 по тем же фрагментам, что лежат в коллекции Chroma
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._postings: dict[str, dict[str, int]] = {}
+        self._lengths: dict[str, int] = {}
+        self._documents: dict[str, str] = {}
+        self._metadatas: dict[str, dict] = {}
+        self._total_length = 0
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def _remove(self, doc_id: str):
+        if doc_id not in self._lengths:
+            return
+        for term in set(terms(self._documents[doc_id])):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id)
+        del self._documents[doc_id]
+        del self._metadatas[doc_id]
+
+    def _add(self, doc_id: str, document: str, metadata: dict | None):
+        self._remove(doc_id)
+        counts = Counter(terms(document))
+        for term, count in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = count
+        length = sum(counts.values())
+        self._lengths[doc_id] = length
+        self._total_length += length
+        self._documents[doc_id] = document
+        self._metadatas[doc_id] = metadata or {}
+
+    # Добавление или замена фрагментов (вызывается после записи в Chroma)
+    def upsert(self, ids: list[str], documents: list[str], metadatas: list[dict] | None = None):
+        metadatas = metadatas or [None] * len(ids)
+        with self._lock:
+            for doc_id, document, metadata in zip(ids, documents, metadatas):
+                self._add(doc_id, document, metadata)
+
+    def delete(self, ids: list[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    # Полное построение индекса из коллекции. Блокировка держится все время загрузки,
+    # поэтому изменения, пришедшие параллельно, применятся после нее и не потеряются
+    def load(self, collection: Collection):
+        with self._lock:
+            self._postings, self._lengths, self._documents, self._metadatas = {}, {}, {}, {}
+            self._total_length = 0
+            offset = 0
+            while True:
+                page = collection.get(include=["documents", "metadatas"], limit=LOAD_PAGE_SIZE, offset=offset)
+                for doc_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                    self._add(doc_id, document or "", metadata)
+                if len(page["ids"]) < LOAD_PAGE_SIZE:
+                    break
+                offset += LOAD_PAGE_SIZE
+            self.loaded = True
+
+    # Возвращает (ID, текст, метаданные, оценка) лучших фрагментов по BM25
+    def search(self, query: str, limit: int, where: dict | None = None) -> list[tuple[str, str, dict, float]]:
+        query_terms = set(terms(query))
+        with self._lock:
+            count = len(self._lengths)
+            if not count or not query_terms:
+                return []
+            average_length = self._total_length / count
+            scores: dict[str, float] = {}
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+            candidates = (
+                (score, doc_id) for doc_id, score in scores.items()
+                if matches_where(self._metadatas[doc_id], where)
+            )
+            best = heapq.nlargest(limit, candidates)
+            return [(doc_id, self._documents[doc_id], self._metadatas[doc_id], score) for score, doc_id in best]
@@ -0,0 +1,60 @@
+import json
+import logging
+import time
+from typing import AsyncIterator
+import httpx
+from metrics import LLM_TOKENS, record_stage
+
+logger = logging.getLogger(__name__)
+
+
+# Счетчики токенов из финального ответа Ollama
+def count_tokens(chunk: dict):
+    LLM_TOKENS.labels("prompt").inc(chunk.get("prompt_eval_count", 0))
+    LLM_TOKENS.labels("completion").inc(chunk.get("eval_count", 0))
+
+
+# Клиент Ollama поверх общего httpx.AsyncClient: соединения переиспользуются между запросами
+class OllamaClient:
+    def __init__(self, http_client: httpx.AsyncClient, model: str, base_url: str):
+        self.http_client = http_client
+        self.model = model
+        self.url = f"{base_url.rstrip('/')}/api/generate"
+
+    # Полный ответ одним вызовом
+    async def ainvoke(self, prompt: str) -> str:
+        started = time.perf_counter()
+        try:
+            response = await self.http_client.post(
+                self.url, json={"model": self.model, "prompt": prompt, "stream": False}
+            )
+            response.raise_for_status()
+            result = response.json()
+        finally:
+            record_stage("llm_total", time.perf_counter() - started)
+        count_tokens(result)
+        return result.get("response", "")
+
+    # Ответ по частям по мере генерации
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        first_token = True
+        try:
+            async with self.http_client.stream(
+                "POST", self.url, json={"model": self.model, "prompt": prompt, "stream": True}
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("response"):
+                        if first_token:
+                            record_stage("llm_first_token", time.perf_counter() - started)
+                            first_token = False
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        count_tokens(chunk)
+                        break
+        finally:
+            record_stage("llm_total", time.perf_counter() - started)
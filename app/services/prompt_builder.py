@@ -0,0 +1,202 @@
+import re
+from typing import Callable
+from metrics import DOCUMENTS, PROMPT_TOKENS
+from schemas import SourceDocument
+
+# Слова для сравнения фрагментов и поиска терминов вопроса
+WORD = re.compile(r"\w+")
+# Длина шингла (слов подряд) для поиска почти одинаковых фрагментов
+SHINGLE_SIZE = 3
+# Первые буквы слова, по которым сравниваем термины вопроса с текстом (грубая замена стемминга)
+STEM_LENGTH = 5
+
+# Поля документа карточки (см. build_card_header и build_card_body в services/trello_sync.py)
+CARD_FIELDS = ("Задача", "Колонка", "Ответственный", "Дедлайн", "Метки", "Описание", "Комментарии")
+# Поля заголовка карточки: повторяются в каждом фрагменте, каждое занимает одну строку
+HEADER_FIELDS = CARD_FIELDS[:5]
+# Поля, которые нужны всегда: ответ форматируется как список задач с колонкой и дедлайном
+REQUIRED_FIELDS = ("Задача", "Колонка", "Дедлайн")
+# Начала слов вопроса, по которым понятно, о каком поле карточки спрашивают
+FIELD_HINTS = {
+    "Колонка": ("колонк", "статус", "этап", "процесс", "готов", "сделан", "выполн"),
+    "Ответственный": ("кто", "ответствен", "исполнител", "назначен", "участник", "делает", "занимает"),
+    "Дедлайн": ("дедлайн", "срок", "когда", "просроч"),
+    "Метки": ("метк", "тег", "приоритет", "баг"),
+    "Описание": ("описан", "подробн", "суть", "зачем", "нужно"),
+    "Комментарии": ("коммент", "обсужд", "написал", "почему", "проблем", "блок"),
+}
+# Шаблон промпта для Ollama
+TEMPLATE = (
+    "Ты ассистент, который помогает с задачами на Trello-доске. "
+    "Вот релевантные данные с Trello-доски:\n\n"
+    "{context}\n\n"
+    "Ответь на вопрос: {query}\n"
+    "Форматируй ответ как список задач, указывая название, колонку и дедлайн. "
+    "Если данные нерелевантны, напиши: 'Нет подходящих задач'."
+)
+NO_CONTEXT = "Нет данных Trello"
+
+
+# Подсчет по словам — когда токенизатор модели недоступен
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def words(text: str) -> list[str]:
+    return WORD.findall(text.lower())
+
+
+def shingles(text: str) -> set[tuple[str, ...]]:
+    tokens = words(text)
+    if len(tokens) < SHINGLE_SIZE:
+        return {tuple(tokens)}
+    return {tuple(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(left: set, right: set) -> float:
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+# Разбираем документ карточки на поля; строки без метки (комментарии, разделитель) продолжают предыдущее поле.
+# Во втором и следующих фрагментах текст сразу после заголовка идет без метки: он относится к полю continued
+# (chunk_field из метаданных фрагмента), а если поле неизвестно — к полю "", которое сжатие не выбрасывает
+def card_fields(text: str, continued: str | None = None) -> list[tuple[str, list[str]]] | None:
+    lines = text.rstrip("\n").split("\n")
+    if not lines[0].startswith(f"{CARD_FIELDS[0]}: "):
+        return None
+    fields: list[tuple[str, list[str]]] = []
+    for line in lines:
+        label = line.split(": ", 1)[0]
+        if label in CARD_FIELDS:
+            fields.append((label, [line]))
+        elif fields[-1][0] in HEADER_FIELDS:
+            fields.append((continued or "", [line]))
+        else:
+            fields[-1][1].append(line)
+    return fields
+
+
+# Контекст промпта: отобранные источники, их текст и размер в токенах
+class PackedContext:
+    def __init__(self, text: str, sources: list[SourceDocument], tokens: int, deduplicated: int, over_budget: int):
+        self.text = text
+        self.sources = sources
+        self.tokens = tokens
+        self.deduplicated = deduplicated
+        self.over_budget = over_budget
+
+
+# Готовый промпт и его размер в токенах
+class Prompt:
+    def __init__(self, text: str, tokens: int, context: PackedContext):
+        self.text = text
+        self.tokens = tokens
+        self.context = context
+
+
+# Собирает промпт в пределах бюджета токенов: источники по убыванию оценки, без почти одинаковых,
+# у карточек — только поля, о которых спрашивают (плюс обязательные и содержащие термины вопроса)
+class PromptBuilder:
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int] = count_words,
+        context_tokens: int = 1200,
+        duplicate_threshold: float = 0.8,
+        filter_fields: bool = True,
+    ):
+        self.count_tokens = count_tokens
+        self.context_tokens = context_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.filter_fields = filter_fields
+
+    # Поля карточки, нужные для вопроса; пустое множество — вопрос ни о каком поле, оставляем все
+    @staticmethod
+    def requested_fields(query_words: list[str]) -> set[str]:
+        return {
+            field for field, hints in FIELD_HINTS.items()
+            if any(word.startswith(hint) for word in query_words for hint in hints)
+        }
+
+    def compress(self, text: str, query_words: list[str], field: str | None = None) -> str:
+        if not self.filter_fields:
+            return text
+        fields = card_fields(text, field)
+        requested = self.requested_fields(query_words)
+        if fields is None or not requested:
+            return text
+        keep = set(REQUIRED_FIELDS) | requested | {""}
+        terms = {word[:STEM_LENGTH] for word in query_words if len(word) >= 4}
+        lines = []
+        for label, field_lines in fields:
+            if label in keep:
+                lines.extend(field_lines)
+                continue
+            # Из остальных полей берем только строки с терминами вопроса (например, нужный комментарий)
+            matching = [line for line in field_lines if terms & {word[:STEM_LENGTH] for word in words(line)}]
+            if matching:
+                if matching[0] != field_lines[0]:
+                    matching.insert(0, f"{label}:")
+                lines.extend(matching)
+        # Разделитель карточек остается в конце
+        if fields[-1][1][-1] == "---" and lines[-1] != "---":
+            lines.append("---")
+        return "\n".join(lines)
+
+    # Обрезаем текст по строкам, а последнюю строку — по словам, пока он не уложится в budget
+    def truncate(self, text: str, budget: int) -> str:
+        lines = text.split("\n")
+        while len(lines) > 1 and self.count_tokens("\n".join(lines)) > budget:
+            lines.pop()
+        text = "\n".join(lines)
+        tokens = self.count_tokens(text)
+        while tokens > budget:
+            text_words = text.split(" ")
+            keep = min(len(text_words) - 1, len(text_words) * budget // tokens)
+            if keep <= 0:
+                return ""
+            text = " ".join(text_words[:keep])
+            tokens = self.count_tokens(text)
+        return text
+
+    # Источники приходят от поиска в порядке ранжирования (оценки RRF и кросс-энкодера несравнимы,
+    # поэтому порядок не пересчитываем); каждый следующий добавляется, если помещается в бюджет
+    # и не повторяет уже взятый
+    def pack(self, query: str, sources: list[SourceDocument]) -> PackedContext:
+        query_words = words(query)
+        packed, texts, kept_shingles = [], [], []
+        tokens = deduplicated = over_budget = 0
+        for source in sources:
+            text = self.compress(source.text, query_words, source.field)
+            source_shingles = shingles(text)
+            if any(jaccard(source_shingles, kept) >= self.duplicate_threshold for kept in kept_shingles):
+                deduplicated += 1
+                continue
+            source_tokens = self.count_tokens(text)
+            remaining = self.context_tokens - tokens
+            if source_tokens > remaining:
+                if packed:
+                    over_budget += 1
+                    continue
+                # Лучший источник не помещается целиком — берем его начало
+                text = self.truncate(text, remaining)
+                if not text:
+                    over_budget += 1
+                    continue
+                source_tokens = self.count_tokens(text)
+            packed.append(source)
+            texts.append(text)
+            kept_shingles.append(source_shingles)
+            tokens += source_tokens
+        DOCUMENTS.labels("prompt").inc(len(packed))
+        DOCUMENTS.labels("deduplicated").inc(deduplicated)
+        DOCUMENTS.labels("over_budget").inc(over_budget)
+        return PackedContext("\n".join(texts), packed, tokens, deduplicated, over_budget)
+
+    def build(self, query: str, sources: list[SourceDocument]) -> Prompt:
+        context = self.pack(query, sources)
+        text = TEMPLATE.format(context=context.text or NO_CONTEXT, query=query)
+        tokens = self.count_tokens(text)
+        PROMPT_TOKENS.observe(tokens)
+        return Prompt(text, tokens, context)
@@ -0,0 +1,132 @@
+import time
+from datetime import datetime, timedelta, timezone
+from chromadb import Collection
+from services.lexical_index import stem, words
+from services.trello_sync import TRELLO_SOURCE
+
+# Маркеры временных фильтров по дедлайну
+OVERDUE_MARKERS = ("просроч", "overdue", "опоздан")
+TODAY_MARKERS = ("сегодня", "today")
+WEEK_MARKERS = ("на этой неделе", "на неделе", "this week")
+
+
+# Слово вопроса совпадает со словом имени с точностью до окончания: начинается с основы не короче
+# MIN_STEM_LENGTH букв (у коротких слов основа — все слово) и длиннее слова имени не больше чем
+# на MAX_EXTRA_LETTERS. Так "Ивана" и "Ивановым" узнаются, а "максимальный" не считается Максимом
+MIN_STEM_LENGTH = 4
+MAX_EXTRA_LETTERS = 2
+
+
+def word_matches(word: str, name_word: str) -> bool:
+    base = stem(name_word)
+    if len(base) < MIN_STEM_LENGTH:
+        base = name_word
+    return word.startswith(base) and len(word) <= len(name_word) + MAX_EXTRA_LETTERS
+
+
+# Фраза (имя колонки, участника или метки) встречается в вопросе с точностью до окончаний
+def phrase_in_query(phrase: str, query_words: list[str]) -> bool:
+    phrase_words = words(phrase)
+    if not phrase_words:
+        return False
+    for start in range(len(query_words) - len(phrase_words) + 1):
+        window = query_words[start:start + len(phrase_words)]
+        if all(word_matches(word, phrase_word) for word, phrase_word in zip(window, phrase_words)):
+            return True
+    return False
+
+
+# Словарь доски: колонки, участники и метки, известные по метаданным карточек
+class BoardVocabulary:
+    def __init__(self):
+        self.lists: dict[str, str] = {}
+        self.members: dict[str, str] = {}
+        self.labels: dict[str, str] = {}
+        self.loaded = False
+
+    def add_metadata(self, metadata: dict):
+        if metadata.get("list_id"):
+            self.lists[metadata["list_id"]] = metadata.get("list_name", "")
+        for key, ids, names in (
+            ("members", metadata.get("member_ids", ""), metadata.get("member_names", "")),
+            ("labels", metadata.get("label_ids", ""), metadata.get("label_names", "")),
+        ):
+            if ids:
+                getattr(self, key).update(zip(ids.split("|"), names.split("|")))
+
+    # Загружаем словарь из метаданных карточек в коллекции (один раз после старта или синхронизации)
+    def load(self, collection: Collection):
+        stored = collection.get(where={"source": TRELLO_SOURCE}, include=["metadatas"])
+        self.lists, self.members, self.labels = {}, {}, {}
+        for metadata in stored["metadatas"]:
+            self.add_metadata(metadata or {})
+        self.loaded = True
+
+    def mark_stale(self):
+        self.loaded = False
+
+
+# Извлекает из вопроса очевидные фильтры и превращает их в where-условие Chroma
+class QueryPlanner:
+    def __init__(self, vocabulary: BoardVocabulary):
+        self.vocabulary = vocabulary
+
+    def plan(self, query: str, now: float | None = None) -> dict | None:
+        query_words = words(query)
+        lowered = query.casefold()
+        conditions = []
+
+        list_ids = [list_id for list_id, name in self.vocabulary.lists.items() if phrase_in_query(name, query_words)]
+        if len(list_ids) == 1:
+            conditions.append({"list_id": list_ids[0]})
+        elif list_ids:
+            conditions.append({"list_id": {"$in": list_ids}})
+
+        label_ids = [label_id for label_id, name in self.vocabulary.labels.items() if phrase_in_query(name, query_words)]
+        conditions.extend(self.member_conditions(self.vocabulary.members, query_words))
+        conditions.extend({f"label_{label_id}": True} for label_id in label_ids)
+        conditions.extend(self.due_conditions(lowered, now if now is not None else time.time()))
+
+        if not conditions:
+            return None
+        conditions.insert(0, {"source": TRELLO_SOURCE})
+        return {"$and": conditions}
+
+    # Участника узнаем по полному имени или по любому слову имени длиннее трех букв.
+    # Все названные участники должны быть в карточке. Только если одно слово вопроса совпало с частью
+    # имени нескольких участников (однофамильцы, тезки), подойдет любой из них; разные слова
+    # (две фамилии) — разные участники
+    @staticmethod
+    def member_conditions(members: dict[str, str], query_words: list[str]) -> list[dict]:
+        matched = [member_id for member_id, name in members.items() if phrase_in_query(name, query_words)]
+        if matched:
+            return [{f"member_{member_id}": True} for member_id in matched]
+        by_word: dict[int, list[str]] = {}
+        for member_id, name in members.items():
+            for part in words(name):
+                if len(part) <= 3:
+                    continue
+                for position, word in enumerate(query_words):
+                    if word_matches(word, part) and member_id not in by_word.setdefault(position, []):
+                        by_word[position].append(member_id)
+        conditions = []
+        for member_ids in dict.fromkeys(tuple(member_ids) for member_ids in by_word.values()):
+            if len(member_ids) > 1:
+                conditions.append({"$or": [{f"member_{member_id}": True} for member_id in member_ids]})
+            else:
+                conditions.append({f"member_{member_ids[0]}": True})
+        return conditions
+
+    @staticmethod
+    def due_conditions(lowered: str, now: float) -> list[dict]:
+        if any(marker in lowered for marker in OVERDUE_MARKERS):
+            return [{"due_ts": {"$lt": int(now)}}, {"due_complete": False}]
+        today = datetime.fromtimestamp(now, tz=timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        if any(marker in lowered for marker in TODAY_MARKERS):
+            end = today + timedelta(days=1)
+            return [{"due_ts": {"$gte": int(today.timestamp())}}, {"due_ts": {"$lt": int(end.timestamp())}}]
+        if any(marker in lowered for marker in WEEK_MARKERS):
+            start = today - timedelta(days=today.weekday())
+            end = start + timedelta(days=7)
+            return [{"due_ts": {"$gte": int(start.timestamp())}}, {"due_ts": {"$lt": int(end.timestamp())}}]
+        return []
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import numpy as np
+from chromadb import Collection
+from schemas import RetrievalOptions, SourceDocument
+from db.collection_registry import BoardIndex
+from executors import run_embedding, run_io
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+# Кросс-энкодер для переранжирования (импорт sentence_transformers — только когда он нужен)
+def load_cross_encoder(model_name: str):
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name)
+
+
+# Кандидат на попадание в промпт: фрагмент с рангами в каждом из поисков
+class Candidate:
+    def __init__(self, doc_id: str, text: str, metadata: dict | None):
+        self.doc_id = doc_id
+        self.text = text
+        self.parent_id = (metadata or {}).get("parent_id", doc_id)
+        self.field = (metadata or {}).get("chunk_field")
+        self.score = 0.0
+
+
+# Гибридный поиск: векторный поиск Chroma и BM25, объединенные через reciprocal rank fusion,
+# с необязательным переранжированием кросс-энкодером. Один поисковик обслуживает индексы всех досок.
+# Кросс-энкодер rerank_model загружается при первом переранжировании (или заранее, в прогреве)
+class HybridRetriever:
+    def __init__(
+        self,
+        reranker=None,
+        rerank_model: str = "",
+        n_results: int = 3,
+        vector_weight: float = 1.0,
+        lexical_weight: float = 1.0,
+        rrf_k: int = 60,
+        candidate_multiplier: int = 4,
+        rerank_top_k: int = 20,
+    ):
+        self.reranker = reranker
+        self.rerank_model = rerank_model
+        self._reranker_lock = asyncio.Lock()
+        self.defaults = RetrievalOptions(
+            n_results=n_results,
+            vector_weight=vector_weight,
+            lexical_weight=lexical_weight,
+            rerank=reranker is not None or bool(rerank_model),
+        )
+        self.rrf_k = rrf_k
+        self.candidate_multiplier = candidate_multiplier
+        self.rerank_top_k = rerank_top_k
+
+    # Кросс-энкодер загружается один раз; конкурентные запросы ждут ту же загрузку, после ошибки — новая попытка
+    async def ensure_reranker(self):
+        if self.reranker is not None or not self.rerank_model:
+            return self.reranker
+        async with self._reranker_lock:
+            if self.reranker is None:
+                self.reranker = await run_embedding(load_cross_encoder, self.rerank_model)
+                logger.info("Loaded cross-encoder %s", self.rerank_model)
+        return self.reranker
+
+    # Параметры запроса поверх значений по умолчанию
+    def resolve(self, options: RetrievalOptions | None) -> RetrievalOptions:
+        if options is None:
+            return self.defaults
+        return self.defaults.model_copy(update=options.model_dump(exclude_none=True))
+
+    # BM25-индекс доски строится из ее коллекции при первом поиске
+    async def ensure_lexical_index(self, index: BoardIndex):
+        if index.lexical_index.loaded:
+            return
+        async with index.lexical_lock:
+            if not index.lexical_index.loaded:
+                await run_io(index.lexical_index.load, index.collection)
+                logger.info("Built BM25 index over %d chunks of board %s", len(index.lexical_index), index.board_id)
+
+    async def vector_search(
+        self, query_embedding: np.ndarray, collection: Collection, limit: int, where: dict | None
+    ) -> list[Candidate]:
+        with timed("vector_search"):
+            results = await run_io(
+                collection.query,
+                query_embeddings=[query_embedding],
+                n_results=limit,
+                where=where,
+                include=["documents", "metadatas"],
+            )
+        if not results["documents"]:
+            return []
+        return [
+            Candidate(doc_id, text, metadata)
+            for doc_id, text, metadata in zip(results["ids"][0], results["documents"][0], results["metadatas"][0])
+        ]
+
+    async def lexical_search(self, index: BoardIndex, query: str, limit: int, where: dict | None) -> list[Candidate]:
+        with timed("lexical_search"):
+            hits = await run_io(index.lexical_index.search, query, limit, where)
+        return [Candidate(doc_id, text, metadata) for doc_id, text, metadata, _ in hits]
+
+    # Reciprocal rank fusion: score = сумма weight / (k + rank) по спискам
+    def fuse(self, ranked_lists: list[tuple[float, list[Candidate]]]) -> list[Candidate]:
+        fused: dict[str, Candidate] = {}
+        for weight, candidates in ranked_lists:
+            for rank, candidate in enumerate(candidates, start=1):
+                current = fused.setdefault(candidate.doc_id, candidate)
+                current.score += weight / (self.rrf_k + rank)
+        return sorted(fused.values(), key=lambda candidate: candidate.score, reverse=True)
+
+    async def rerank(self, query: str, candidates: list[Candidate]) -> list[Candidate]:
+        head, tail = candidates[:self.rerank_top_k], candidates[self.rerank_top_k:]
+        with timed("rerank"):
+            scores = await run_embedding(self.reranker.predict, [(query, candidate.text) for candidate in head])
+        for candidate, score in zip(head, scores):
+            candidate.score = float(score)
+        return sorted(head, key=lambda candidate: candidate.score, reverse=True) + tail
+
+    async def retrieve(
+        self,
+        query: str,
+        query_embedding: np.ndarray,
+        index: BoardIndex,
+        where: dict | None = None,
+        options: RetrievalOptions | None = None,
+    ) -> list[SourceDocument]:
+        params = self.resolve(options)
+        use_rerank = bool(params.rerank and (self.reranker is not None or self.rerank_model))
+        limit = params.n_results * self.candidate_multiplier
+        if use_rerank:
+            limit = max(limit, self.rerank_top_k)
+
+        searches = []
+        if params.vector_weight > 0:
+            searches.append((params.vector_weight, self.vector_search(query_embedding, index.collection, limit, where)))
+        if params.lexical_weight > 0:
+            await self.ensure_lexical_index(index)
+            searches.append((params.lexical_weight, self.lexical_search(index, query, limit, where)))
+        results = await asyncio.gather(*(search for _, search in searches))
+        ranked_lists = [(weight, candidates) for (weight, _), candidates in zip(searches, results)]
+
+        if not any(candidates for _, candidates in ranked_lists):
+            # Фильтры ничего не нашли — ищем по всей коллекции
+            if where is not None:
+                return await self.retrieve(query, query_embedding, index, None, options)
+            return []
+
+        candidates = self.fuse(ranked_lists)
+        if use_rerank:
+            try:
+                await self.ensure_reranker()
+            except Exception as e:
+                # Без кросс-энкодера отвечаем по порядку RRF; загрузку повторит следующий запрос
+                logger.error("Failed to load cross-encoder %s: %s", self.rerank_model, e)
+            else:
+                candidates = await self.rerank(query, candidates)
+
+        # Фрагменты одного документа схлопываются: берем лучший фрагмент каждого родителя
+        sources: dict[str, SourceDocument] = {}
+        for candidate in candidates:
+            if candidate.parent_id not in sources:
+                sources[candidate.parent_id] = SourceDocument(
+                    id=candidate.parent_id, text=candidate.text, score=candidate.score, field=candidate.field
+                )
+            if len(sources) == params.n_results:
+                break
+        return list(sources.values())
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Awaitable, Callable
+from schemas import SyncJobStatus, TrelloSyncReport
+from services.trello_sync import SyncProgress
+
+logger = logging.getLogger(__name__)
+
+# Как часто (не чаще, секунды) сохраняем ход задач в файл контрольной точки
+CHECKPOINT_INTERVAL = 1.0
+# Статусы незавершенных задач: после перезапуска они продолжаются
+ACTIVE_STATUSES = ("queued", "running")
+
+# Запуск синхронизации одной доски: (ID доски, ход синхронизации) -> отчет
+SyncRunner = Callable[[str, SyncProgress], Awaitable[TrelloSyncReport]]
+
+
+# Фоновые задачи синхронизации досок Trello: не больше одной задачи на доску,
+# состояние сохраняется в JSON-файл и незавершенные задачи продолжаются после перезапуска
+class SyncJobManager:
+    def __init__(self, run_sync: SyncRunner, path: str = "", history: int = 50, max_concurrent: int = 2):
+        self.run_sync = run_sync
+        self.path = path
+        self.history = history
+        # Общий предел одновременных синхронизаций разных досок; остальные ждут в статусе queued
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._jobs: dict[str, SyncJobStatus] = {}
+        # ID доски -> ID ее незавершенной задачи
+        self._active: dict[str, str] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._last_checkpoint = 0.0
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                records = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.error("Failed to read sync job checkpoint %s: %s", self.path, e)
+            return
+        for record in records:
+            job = SyncJobStatus.model_validate(record)
+            self._jobs[job.job_id] = job
+            if job.status in ACTIVE_STATUSES:
+                self._active[job.board_id] = job.job_id
+
+    # Запись через временный файл, чтобы сбой посреди записи не испортил контрольную точку
+    def _save(self):
+        self._last_checkpoint = time.monotonic()
+        if not self.path:
+            return
+        records = [job.model_dump(mode="json") for job in self._jobs.values()]
+        temporary = f"{self.path}.tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as file:
+                json.dump(records, file, ensure_ascii=False)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            logger.error("Failed to write sync job checkpoint %s: %s", self.path, e)
+
+    def _checkpoint(self):
+        if time.monotonic() - self._last_checkpoint >= CHECKPOINT_INTERVAL:
+            self._save()
+
+    # Храним не больше history завершенных задач
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status not in ACTIVE_STATUSES]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def _on_progress(self, job: SyncJobStatus, progress: SyncProgress):
+        job.stage = progress.stage
+        job.cards_fetched = progress.cards_fetched
+        job.cards_changed = progress.cards_changed
+        job.cards_chunked = progress.cards_chunked
+        job.chunks_total = progress.chunks_total
+        job.chunks_upserted = progress.chunks_upserted
+        job.rate = progress.rate()
+        job.eta_seconds = progress.eta_seconds()
+        self._checkpoint()
+
+    def _start(self, job: SyncJobStatus):
+        self._tasks[job.job_id] = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: SyncJobStatus):
+        progress = SyncProgress(listener=lambda current: self._on_progress(job, current))
+        try:
+            async with self._slots:
+                job.status = "running"
+                job.started_at = time.time()
+                job.attempts += 1
+                self._save()
+                job.report = await self.run_sync(job.board_id, progress)
+            job.status = "completed"
+        except asyncio.CancelledError:
+            # Остановка приложения: задача остается running и продолжится после перезапуска
+            self._save()
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            logger.error("Sync job %s for board %s failed: %s", job.job_id, job.board_id, e)
+        job.finished_at = time.time()
+        job.rate, job.eta_seconds = progress.rate(), None
+        self._active.pop(job.board_id, None)
+        self._tasks.pop(job.job_id, None)
+        self._save()
+
+    # Ставит синхронизацию доски в очередь; если доска уже синхронизируется, возвращает текущую задачу
+    def submit(self, board_id: str) -> SyncJobStatus:
+        active_id = self._active.get(board_id)
+        if active_id is not None:
+            return self._jobs[active_id]
+        job = SyncJobStatus(job_id=uuid.uuid4().hex, board_id=board_id, created_at=time.time())
+        self._jobs[job.job_id] = job
+        self._active[board_id] = job.job_id
+        self._trim()
+        self._start(job)
+        return job
+
+    # Продолжаем задачи, прерванные остановкой или сбоем (вызывается при старте приложения)
+    def resume(self):
+        for job_id in list(self._active.values()):
+            job = self._jobs[job_id]
+            if job_id not in self._tasks:
+                logger.info("Resuming sync job %s for board %s", job_id, job.board_id)
+                self._start(job)
+
+    # Идет ли (или ждет очереди) синхронизация доски
+    def is_active(self, board_id: str) -> bool:
+        return board_id in self._active
+
+    def get(self, job_id: str) -> SyncJobStatus | None:
+        return self._jobs.get(job_id)
+
+    # Задачи от новых к старым
+    def jobs(self) -> list[SyncJobStatus]:
+        return list(reversed(self._jobs.values()))
+
+    async def aclose(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._save()
@@ -0,0 +1,151 @@
+import logging
+import time
+from trello import TrelloClient
+from metrics import TRELLO_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Поля карточки, которые нужны для построения документа
+CARD_FIELDS = "id,name,desc,due,dueComplete,idList,idMembers,idLabels,labels,dateLastActivity,closed"
+# Максимальный размер страницы действий в Trello API
+ACTIONS_PAGE_LIMIT = 1000
+# Максимум запросов в одном вызове /batch Trello API
+BATCH_LIMIT = 10
+# Коды ответов /batch, означающие, что карточки больше нет или она на доске, к которой нет доступа
+MISSING_STATUSES = ("401", "404")
+
+
+# Ключ и токен Trello API не заданы: синхронизация и вебхуки недоступны (503)
+class TrelloNotConfigured(RuntimeError):
+    def __init__(self):
+        super().__init__("Trello API credentials are not configured: set TRELLO_API_KEY and TRELLO_TOKEN")
+
+
+# Снимок доски: списки, участники и карточки с картами id -> имя
+class BoardSnapshot:
+    def __init__(self, board_id: str, lists: list[dict], members: list[dict], cards: list[dict]):
+        self.board_id = board_id
+        self.cards = cards
+        self.list_names = {item["id"]: item.get("name", "") for item in lists}
+        self.member_names = {
+            item["id"]: item.get("fullName") or item.get("username", "")
+            for item in members
+        }
+        # Комментарии по ID карточки, загружаются отдельно и только при необходимости
+        self.comments: dict[str, list[str]] = {}
+
+    def list_name(self, card: dict) -> str:
+        return self.list_names.get(card.get("idList"), "Неизвестно")
+
+    def member_names_for(self, card: dict) -> list[str]:
+        return [self.member_names.get(member_id, member_id) for member_id in card.get("idMembers", [])]
+
+    def comments_for(self, card: dict) -> list[str]:
+        return self.comments.get(card["id"], [])
+
+
+# Колонки, участники и метки доски без карточек: имена для документов и сверки
+class BoardMeta:
+    def __init__(self, lists: list[dict], members: list[dict], labels: list[dict]):
+        self.lists = lists
+        self.members = members
+        self.labels = labels
+        self.list_names = {item["id"]: item.get("name", "") for item in lists}
+        self.member_names = {item["id"]: item.get("fullName") or item.get("username", "") for item in members}
+        self.label_names = {item["id"]: item.get("name", "") for item in labels}
+        self.fetched_at = time.monotonic()
+
+
+# Тело одного ответа из /batch: {"200": тело} или описание ошибки с statusCode; None — карточки нет
+def batch_body(response: dict):
+    if "200" in response:
+        return response["200"]
+    status = str(response.get("statusCode") or next(iter(response), ""))
+    if status in MISSING_STATUSES:
+        return None
+    raise RuntimeError(f"Trello batch request failed with status {status}: {response}")
+
+
+# Загрузчик доски пакетными запросами вместо запросов по каждой карточке
+class TrelloBoardLoader:
+    def __init__(self, trello_client: TrelloClient):
+        self.trello_client = trello_client
+        # Счетчик HTTP-запросов к Trello API
+        self.request_count = 0
+
+    # Время каждого вызова пишется в гистограмму по ресурсу доски (lists, members, cards, actions)
+    def fetch_json(self, path: str, query_params: dict | None = None):
+        self.request_count += 1
+        with TRELLO_REQUEST_SECONDS.labels(path.rsplit("/", 1)[-1]).time():
+            return self.trello_client.fetch_json(path, query_params=query_params or {})
+
+    def fetch_snapshot(self, board_id: str) -> BoardSnapshot:
+        lists = self.fetch_json(f"/boards/{board_id}/lists", {"filter": "all", "fields": "id,name"})
+        members = self.fetch_json(f"/boards/{board_id}/members", {"fields": "id,fullName,username"})
+        # filter=open исключает архивные карточки
+        cards = self.fetch_json(f"/boards/{board_id}/cards", {"filter": "open", "fields": CARD_FIELDS})
+        logger.info(
+            f"Fetched snapshot of board {board_id}: {len(lists)} lists, {len(members)} members, {len(cards)} cards"
+        )
+        return BoardSnapshot(board_id, lists, members, cards)
+
+    # Загружаем все комментарии доски постранично и группируем по карточкам
+    def fetch_comments(self, board_id: str) -> dict[str, list[str]]:
+        comments: dict[str, list[str]] = {}
+        before = None
+        while True:
+            params = {"filter": "commentCard", "limit": ACTIONS_PAGE_LIMIT, "fields": "id,data"}
+            if before:
+                params["before"] = before
+            actions = self.fetch_json(f"/boards/{board_id}/actions", params)
+            for action in actions:
+                data = action.get("data", {})
+                card_id = data.get("card", {}).get("id")
+                if card_id and "text" in data:
+                    comments.setdefault(card_id, []).append(data["text"])
+            if len(actions) < ACTIONS_PAGE_LIMIT:
+                break
+            before = actions[-1]["id"]
+        logger.info(f"Fetched comments for {len(comments)} cards of board {board_id}")
+        return comments
+
+    def load_comments(self, snapshot: BoardSnapshot):
+        snapshot.comments = self.fetch_comments(snapshot.board_id)
+
+    # Колонки, участники и метки доски (перечитываются после их изменений и при сверке)
+    def fetch_meta(self, board_id: str) -> BoardMeta:
+        return BoardMeta(
+            self.fetch_json(f"/boards/{board_id}/lists", {"filter": "all", "fields": "id,name"}),
+            self.fetch_json(f"/boards/{board_id}/members", {"fields": "id,fullName,username"}),
+            self.fetch_json(f"/boards/{board_id}/labels", {"fields": "id,name"}),
+        )
+
+    # Для сверки достаточно ID и времени последней активности открытых карточек
+    def fetch_card_activity(self, board_id: str) -> list[dict]:
+        return self.fetch_json(f"/boards/{board_id}/cards", {"filter": "open", "fields": "id,dateLastActivity"})
+
+    # Отдельные карточки с комментариями через /batch: два запроса на карточку, до BATCH_LIMIT за вызов.
+    # Возвращает найденные карточки, их комментарии и ID карточек, которых больше нет
+    def fetch_cards(self, card_ids: list[str]) -> tuple[list[dict], dict[str, list[str]], list[str]]:
+        urls = []
+        for card_id in card_ids:
+            urls.append(f"/cards/{card_id}")
+            urls.append(f"/cards/{card_id}/actions?filter=commentCard&limit={ACTIONS_PAGE_LIMIT}")
+        responses = []
+        for start in range(0, len(urls), BATCH_LIMIT):
+            responses.extend(self.fetch_json("/batch", {"urls": ",".join(urls[start:start + BATCH_LIMIT])}))
+        cards, comments, missing = [], {}, []
+        for card_id, card_response, actions_response in zip(card_ids, responses[0::2], responses[1::2]):
+            card = batch_body(card_response)
+            if card is None:
+                missing.append(card_id)
+                continue
+            cards.append(card)
+            texts = [
+                action["data"]["text"] for action in batch_body(actions_response) or []
+                if "text" in action.get("data", {})
+            ]
+            if texts:
+                comments[card_id] = texts
+        logger.info(f"Fetched {len(cards)} cards by id, {len(missing)} missing")
+        return cards, comments, missing
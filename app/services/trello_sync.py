@@ -0,0 +1,449 @@
+import hashlib
+import logging
+import time
+from datetime import datetime
+from typing import Callable
+from chromadb import Collection
+from trello import TrelloClient
+from schemas import TrelloSyncReport
+from services.trello_loader import BoardMeta, BoardSnapshot, TrelloBoardLoader
+from services.chunker import Chunk, TextChunker, chunk_id
+from services.lexical_index import BM25Index
+from executors import run_embedding, run_io
+from metrics import DOCUMENTS
+
+logger = logging.getLogger(__name__)
+
+# Метка источника в метаданных Chroma, по ней отличаем карточки от прочих документов
+TRELLO_SOURCE = "trello"
+# Размер пакета upsert: мелкие пакеты позволяют запросам /ask вклиниваться между ними в пуле эмбеддингов
+UPSERT_BATCH_SIZE = 64
+
+
+# Стабильный ID документа по ID карточки Trello
+def card_document_id(card_id: str) -> str:
+    return f"card_{card_id}"
+
+
+# Хэш содержимого документа для определения изменений
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Дедлайн карточки в формате YYYY-MM-DD
+def card_due(card: dict) -> str:
+    due = card.get("due")
+    return due[:10] if due else "Нет"
+
+
+# Дедлайн карточки как unix-время для фильтров Chroma ($lt/$gte)
+def card_due_timestamp(card: dict) -> int | None:
+    due = card.get("due")
+    if not due:
+        return None
+    return int(datetime.fromisoformat(due.replace("Z", "+00:00")).timestamp())
+
+
+# Структурные метаданные карточки. Chroma хранит только скалярные значения, поэтому
+# участники и метки записываются флагами member_<id>/label_<id> плюс строками имен и ID для словаря
+def card_metadata(card: dict, snapshot: BoardSnapshot) -> dict:
+    member_ids = card.get("idMembers", [])
+    labels = card.get("labels", [])
+    metadata = {
+        "list_id": card.get("idList", ""),
+        "list_name": snapshot.list_name(card),
+        "member_ids": "|".join(member_ids),
+        "member_names": "|".join(snapshot.member_names_for(card)),
+        "label_ids": "|".join(label["id"] for label in labels),
+        "label_names": "|".join(label.get("name", "") for label in labels),
+        "due_complete": bool(card.get("dueComplete", False)),
+    }
+    due_ts = card_due_timestamp(card)
+    if due_ts is not None:
+        metadata["due_ts"] = due_ts
+    for member_id in member_ids:
+        metadata[f"member_{member_id}"] = True
+    for label in labels:
+        metadata[f"label_{label['id']}"] = True
+    return metadata
+
+
+# Заголовок документа карточки: структурные поля, повторяются в каждом фрагменте
+def build_card_header(card: dict, snapshot: BoardSnapshot) -> str:
+    members = snapshot.member_names_for(card)
+    members_str = ", ".join(members) if members else "Нет"
+    labels = [label.get("name", "") for label in card.get("labels", []) if label.get("name")]
+    due = card_due(card)
+    if card.get("due") and card.get("dueComplete"):
+        due += " (выполнено)"
+    return (
+        f"Задача: {card.get('name', '')}\n"
+        f"Колонка: {snapshot.list_name(card)}\n"
+        f"Ответственный: {members_str}\n"
+        f"Дедлайн: {due}\n"
+        f"Метки: {', '.join(labels) if labels else 'Нет'}\n"
+    )
+
+
+# Поля тела документа карточки
+BODY_FIELDS = ("Описание", "Комментарии")
+
+
+# Тело документа карточки: описание и комментарии, которые могут быть длинными
+def build_card_body(card: dict, snapshot: BoardSnapshot) -> str:
+    comments = snapshot.comments_for(card)
+    comments_str = "\n".join(comments) if comments else "Нет"
+    return (
+        f"Описание: {card.get('desc') or 'Нет'}\n"
+        f"Комментарии: {comments_str}\n---\n"
+    )
+
+
+# Поле тела карточки, к которому относится строка line тела. Во втором и следующих фрагментах текст
+# после заголовка идет без метки поля, поэтому поле начала фрагмента записываем в его метаданные
+def body_field(body: str, line: int) -> str | None:
+    for text in reversed(body.split("\n")[:line + 1]):
+        label = text.split(": ", 1)[0]
+        if label in BODY_FIELDS:
+            return label
+    return None
+
+
+# Метаданные фрагмента: позиция в документе и поле карточки, с которого начинается его текст (chunk_field)
+def chunk_metadata(metadata: dict, body: str, chunk: Chunk) -> dict:
+    result = {**metadata, "chunk_index": chunk.index, "chunk_count": chunk.count}
+    field = body_field(body, chunk.line)
+    if field is not None:
+        result["chunk_field"] = field
+    return result
+
+
+# Собираем текст документа по карточке из снимка доски без дополнительных запросов
+def build_card_document(card: dict, snapshot: BoardSnapshot) -> str:
+    return build_card_header(card, snapshot) + build_card_body(card, snapshot)
+
+
+# Ход синхронизации: этап и счетчики для отчета о фоновой задаче.
+# listener вызывается после каждого изменения (например, чтобы сохранить контрольную точку)
+class SyncProgress:
+    def __init__(self, listener: Callable[["SyncProgress"], None] | None = None):
+        self.stage = "pending"
+        self.cards_fetched = 0
+        self.cards_changed = 0
+        self.cards_chunked = 0
+        self.chunks_total = 0
+        self.chunks_upserted = 0
+        self.upsert_started: float | None = None
+        self.listener = listener
+
+    def update(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+        if self.listener is not None:
+            self.listener(self)
+
+    # Скорость записи фрагментов (эмбеддинг + upsert), фрагментов в секунду
+    def rate(self) -> float | None:
+        if self.upsert_started is None or not self.chunks_upserted:
+            return None
+        elapsed = time.monotonic() - self.upsert_started
+        return self.chunks_upserted / elapsed if elapsed > 0 else None
+
+    # Оценка оставшегося времени по текущей скорости записи
+    def eta_seconds(self) -> float | None:
+        rate = self.rate()
+        if rate is None:
+            return None
+        return (self.chunks_total - self.chunks_upserted) / rate
+
+
+# Записи одной синхронизации: фрагменты к upsert, метаданные к обновлению и фрагменты к удалению
+class SyncWrites:
+    def __init__(self):
+        self.upsert_ids: list[str] = []
+        self.upsert_documents: list[str] = []
+        self.upsert_metadatas: list[dict] = []
+        self.touch_ids: list[str] = []
+        self.touch_metadatas: list[dict] = []
+        self.stale_chunk_ids: list[str] = []
+        # Документы с новым содержимым и удаленные документы (для сброса кэша ответов)
+        self.changed_doc_ids: list[str] = []
+        self.removed_doc_ids: list[str] = []
+
+    def remove(self, doc_id: str, previous: dict):
+        self.stale_chunk_ids.extend(previous["chunk_ids"])
+        self.removed_doc_ids.append(doc_id)
+
+
+class TrelloSyncEngine:
+    def __init__(
+        self,
+        collection: Collection,
+        trello_client: TrelloClient,
+        chunker: TextChunker | None = None,
+        lexical_index: BM25Index | None = None,
+        on_change: Callable[[list[str]], None] | None = None,
+        progress: SyncProgress | None = None,
+    ):
+        self.collection = collection
+        self.loader = TrelloBoardLoader(trello_client)
+        self.chunker = chunker
+        # BM25-индекс поддерживается синхронно с коллекцией
+        self.lexical_index = lexical_index
+        # Уведомление об измененных и удаленных документах (сброс кэша ответов)
+        self.on_change = on_change
+        self.progress = progress or SyncProgress()
+
+    # Читаем состояние уже загруженных карточек (всех или только doc_ids):
+    # ID документа карточки -> метаданные и ID фрагментов
+    def stored_state(self, doc_ids: list[str] | None = None) -> dict[str, dict]:
+        where = {"source": TRELLO_SOURCE}
+        if doc_ids is not None:
+            if not doc_ids:
+                return {}
+            where = {"$and": [where, {"parent_id": {"$in": doc_ids}}]}
+        stored = self.collection.get(where=where, include=["metadatas"])
+        state: dict[str, dict] = {}
+        for chunk_doc_id, meta in zip(stored["ids"], stored["metadatas"]):
+            meta = meta or {}
+            parent_id = meta.get("parent_id", chunk_doc_id)
+            entry = state.setdefault(parent_id, {"metadata": meta, "chunk_ids": []})
+            entry["chunk_ids"].append(chunk_doc_id)
+        return state
+
+    # Все ли фрагменты карточки в коллекции: синхронизация, прерванная между пакетами upsert,
+    # могла записать только часть фрагментов, хотя у каждого уже новое время активности
+    @staticmethod
+    def is_complete(entry: dict) -> bool:
+        return len(entry["chunk_ids"]) >= entry["metadata"].get("chunk_count", 1)
+
+    # Имена колонки, участников и меток, записанные с карточкой, совпадают со снимком. Переименование
+    # колонки, участника или метки не меняет dateLastActivity карточки, поэтому сравниваем их отдельно
+    @staticmethod
+    def names_match(metadata: dict, card: dict, snapshot: BoardSnapshot) -> bool:
+        return (
+            metadata.get("list_name") == snapshot.list_name(card)
+            and metadata.get("member_names", "") == "|".join(snapshot.member_names_for(card))
+            and metadata.get("label_names", "") == "|".join(label.get("name", "") for label in card.get("labels", []))
+        )
+
+    # ID карточек, у фрагментов которых есть метаданные where (например, {"list_id": ...})
+    def card_ids_where(self, where: dict) -> list[str]:
+        stored = self.collection.get(where={"$and": [{"source": TRELLO_SOURCE}, where]}, include=["metadatas"])
+        return list(dict.fromkeys(meta["card_id"] for meta in stored["metadatas"] if meta and meta.get("card_id")))
+
+    # Сверка без загрузки карточек целиком: ID карточек, у которых другое время активности, новых,
+    # пропавших из открытых и тех, у кого в Trello поменялись имена колонки, участников или меток
+    def outdated_card_ids(self, activity: list[dict], meta: BoardMeta) -> list[str]:
+        stored = {
+            entry["metadata"].get("card_id"): entry
+            for entry in self.stored_state().values()
+            if entry["metadata"].get("card_id")
+        }
+        # Доска еще не загружалась — это работа полной синхронизации (/load_trello), а не сверки
+        if not stored:
+            return []
+        outdated = []
+        for card in activity:
+            entry = stored.pop(card["id"], None)
+            if (
+                entry is None
+                or not self.is_complete(entry)
+                or entry["metadata"].get("date_last_activity") != card.get("dateLastActivity")
+            ):
+                outdated.append(card["id"])
+                continue
+            metadata = entry["metadata"]
+            list_name = metadata.get("list_name")
+            member_ids, label_ids = metadata.get("member_ids", ""), metadata.get("label_ids", "")
+            member_names = metadata.get("member_names", "").split("|") if member_ids else []
+            label_names = metadata.get("label_names", "").split("|") if label_ids else []
+            # Неизвестные в meta колонки, участников и метки не сравниваем
+            if (
+                list_name != meta.list_names.get(metadata.get("list_id"), list_name)
+                or any(
+                    name != meta.member_names.get(member_id, name)
+                    for member_id, name in zip(member_ids.split("|"), member_names)
+                )
+                or any(
+                    name != meta.label_names.get(label_id, name)
+                    for label_id, name in zip(label_ids.split("|"), label_names)
+                )
+            ):
+                outdated.append(card["id"])
+        # Оставшиеся карточки удалены, архивированы или перенесены на другую доску
+        return outdated + list(stored)
+
+    # Делим документ карточки на фрагменты (заголовок с полями повторяется в каждом)
+    def chunk_card(self, doc_id: str, header: str, body: str, metadata: dict) -> tuple[list, list, list]:
+        chunks = self.chunker.chunk(body, header=header) if self.chunker else [Chunk(header + body, 0, 1)]
+        ids = [chunk_id(doc_id, chunk.index) for chunk in chunks]
+        documents = [chunk.text for chunk in chunks]
+        metadatas = [chunk_metadata({**metadata, "parent_id": doc_id}, body, chunk) for chunk in chunks]
+        return ids, documents, metadatas
+
+    # Документ карточки: если текст тот же, обновляем только время активности, иначе нарезаем заново
+    async def prepare_card(
+        self, card: dict, snapshot: BoardSnapshot, previous: dict | None, writes: SyncWrites, report: TrelloSyncReport
+    ):
+        progress = self.progress
+        doc_id = card_document_id(card["id"])
+        last_activity = card.get("dateLastActivity") or ""
+        header = build_card_header(card, snapshot)
+        body = build_card_body(card, snapshot)
+        text_hash = content_hash(header + body)
+        metadata = {
+            "source": TRELLO_SOURCE,
+            "board_id": snapshot.board_id,
+            "card_id": card["id"],
+            "content_hash": text_hash,
+            "date_last_activity": last_activity,
+            **card_metadata(card, snapshot),
+        }
+
+        if previous and self.is_complete(previous) and previous["metadata"].get("content_hash") == text_hash:
+            # Активность была, но текст документа тот же — обновляем только метаданные фрагментов
+            for stored_chunk_id in previous["chunk_ids"]:
+                writes.touch_ids.append(stored_chunk_id)
+                writes.touch_metadatas.append({"date_last_activity": last_activity})
+            report.unchanged += 1
+            progress.update(cards_chunked=progress.cards_chunked + 1)
+            return
+
+        ids, documents, metadatas = await run_embedding(self.chunk_card, doc_id, header, body, metadata)
+        progress.update(cards_chunked=progress.cards_chunked + 1)
+        writes.upsert_ids.extend(ids)
+        writes.upsert_documents.extend(documents)
+        writes.upsert_metadatas.extend(metadatas)
+        writes.changed_doc_ids.append(doc_id)
+        if previous:
+            # Прежние фрагменты удаляем целиком: update в Chroma сливает метаданные,
+            # и флаги снятых участников и меток остались бы в записи
+            writes.stale_chunk_ids.extend(previous["chunk_ids"])
+            report.updated += 1
+        else:
+            report.added += 1
+
+    # Удаление устаревших фрагментов, upsert пакетами и обновление метаданных
+    async def apply(self, writes: SyncWrites):
+        progress = self.progress
+        if writes.stale_chunk_ids:
+            await run_io(self.collection.delete, ids=writes.stale_chunk_ids)
+            DOCUMENTS.labels("removed").inc(len(writes.stale_chunk_ids))
+            if self.lexical_index is not None:
+                await run_io(self.lexical_index.delete, writes.stale_chunk_ids)
+
+        # upsert пересчитывает эмбеддинги, поэтому идет через пул эмбеддингов
+        upsert_ids = writes.upsert_ids
+        progress.update(stage="upserting", chunks_total=len(upsert_ids), upsert_started=time.monotonic())
+        for start in range(0, len(upsert_ids), UPSERT_BATCH_SIZE):
+            end = start + UPSERT_BATCH_SIZE
+            await run_embedding(
+                self.collection.upsert,
+                ids=upsert_ids[start:end],
+                documents=writes.upsert_documents[start:end],
+                metadatas=writes.upsert_metadatas[start:end],
+            )
+            DOCUMENTS.labels("embedded").inc(len(upsert_ids[start:end]))
+            if self.lexical_index is not None:
+                await run_io(
+                    self.lexical_index.upsert,
+                    upsert_ids[start:end],
+                    writes.upsert_documents[start:end],
+                    writes.upsert_metadatas[start:end],
+                )
+            progress.update(chunks_upserted=min(end, len(upsert_ids)))
+        if writes.touch_ids:
+            await run_io(self.collection.update, ids=writes.touch_ids, metadatas=writes.touch_metadatas)
+        if self.on_change is not None:
+            self.on_change(writes.changed_doc_ids + writes.removed_doc_ids)
+
+    # Каждый пакет upsert сразу записывает date_last_activity карточек, поэтому синхронизация,
+    # прерванная на середине, при повторном запуске пропустит уже записанные карточки.
+    # Карточку, записанную не всеми фрагментами (сбой между пакетами) или со старыми именами
+    # колонки, участников или меток, нарезаем и записываем заново
+    async def sync(self, board_id: str) -> TrelloSyncReport:
+        progress = self.progress
+        progress.update(stage="fetching")
+        # Архивные карточки в снимок не попадают и будут удалены из коллекции
+        snapshot = await run_io(self.loader.fetch_snapshot, board_id)
+        progress.update(cards_fetched=len(snapshot.cards))
+        stored = await run_io(self.stored_state)
+        report = TrelloSyncReport(board_id=board_id)
+        writes = SyncWrites()
+        seen_ids = set()
+        changed = []
+
+        for card in snapshot.cards:
+            doc_id = card_document_id(card["id"])
+            seen_ids.add(doc_id)
+            previous = stored.get(doc_id)
+            last_activity = card.get("dateLastActivity") or ""
+
+            # Карточка не менялась с прошлой синхронизации: не пересчитываем эмбеддинг
+            if (
+                previous
+                and last_activity
+                and previous["metadata"].get("date_last_activity") == last_activity
+                and self.is_complete(previous)
+                and self.names_match(previous["metadata"], card, snapshot)
+            ):
+                report.unchanged += 1
+                continue
+            changed.append(card)
+
+        # Комментарии нужны только для измененных карточек
+        progress.update(stage="comments", cards_changed=len(changed))
+        if changed:
+            await run_io(self.loader.load_comments, snapshot)
+
+        progress.update(stage="chunking")
+        for card in changed:
+            await self.prepare_card(card, snapshot, stored.get(card_document_id(card["id"])), writes, report)
+
+        # Удаляем карточки текущей доски, которых больше нет среди открытых
+        for doc_id, entry in stored.items():
+            if doc_id not in seen_ids and entry["metadata"].get("board_id", board_id) == board_id:
+                writes.remove(doc_id, entry)
+        await self.apply(writes)
+
+        report.removed = len(writes.removed_doc_ids)
+        DOCUMENTS.labels("unchanged").inc(report.unchanged)
+        progress.update(stage="done")
+
+        logger.info(
+            f"Synced board {board_id}: added={report.added}, updated={report.updated}, "
+            f"unchanged={report.unchanged}, removed={report.removed}, chunks={len(writes.upsert_ids)}, "
+            f"trello_requests={self.loader.request_count}"
+        )
+        return report
+
+    # Обновление только указанных карточек (события вебхука): карточки и их комментарии загружаются
+    # через /batch, колонки и участники берутся из meta. Удаленные, архивные и перенесенные
+    # на другую доску карточки удаляются из коллекции
+    async def sync_cards(self, board_id: str, card_ids: list[str], meta: BoardMeta) -> TrelloSyncReport:
+        cards, comments, _ = await run_io(self.loader.fetch_cards, card_ids)
+        open_cards = [
+            card for card in cards
+            if not card.get("closed") and card.get("idBoard", board_id) == board_id
+        ]
+        snapshot = BoardSnapshot(board_id, meta.lists, meta.members, open_cards)
+        snapshot.comments = comments
+        doc_ids = [card_document_id(card_id) for card_id in card_ids]
+        stored = await run_io(self.stored_state, doc_ids)
+        report = TrelloSyncReport(board_id=board_id)
+        writes = SyncWrites()
+
+        for card in open_cards:
+            await self.prepare_card(card, snapshot, stored.pop(card_document_id(card["id"]), None), writes, report)
+        for doc_id, entry in stored.items():
+            writes.remove(doc_id, entry)
+        await self.apply(writes)
+
+        report.removed = len(writes.removed_doc_ids)
+        DOCUMENTS.labels("unchanged").inc(report.unchanged)
+        logger.info(
+            f"Updated {len(card_ids)} cards of board {board_id}: added={report.added}, updated={report.updated}, "
+            f"unchanged={report.unchanged}, removed={report.removed}, chunks={len(writes.upsert_ids)}"
+        )
+        return report
@@ -0,0 +1,398 @@
+# Прием вебхуков Trello: события копятся по карточкам и после паузы (debounce) обновляют только
+# затронутые карточки небольшими пакетами; периодическая сверка ловит события, которые не дошли
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import time
+from typing import Callable
+from trello import TrelloClient
+from db.collection_registry import BoardIndex, CollectionRegistry, UnknownBoard
+from services.chunker import TextChunker
+from services.trello_loader import BoardMeta
+from services.trello_sync import TrelloSyncEngine
+from executors import run_io
+from metrics import WEBHOOK_EVENTS, WEBHOOK_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Условие на метаданные фрагментов: (поле, значение), например ("list_id", ID колонки)
+Scope = tuple[str, object]
+
+
+# Подпись Trello: base64(HMAC-SHA1(секрет приложения, тело запроса + адрес обратного вызова))
+def webhook_signature(secret: str, body: bytes, callback_url: str) -> str:
+    digest = hmac.new(secret.encode("utf-8"), body + callback_url.encode("utf-8"), hashlib.sha1).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+def verify_signature(secret: str, body: bytes, callback_url: str, signature: str) -> bool:
+    return hmac.compare_digest(webhook_signature(secret, body, callback_url), signature)
+
+
+# Что затронуло действие: ID доски, ID карточки (для действий с карточкой, в том числе комментариев)
+# и условия на метаданные карточек для действий с колонкой, участником или меткой доски
+def action_targets(payload: dict) -> tuple[str | None, str | None, list[Scope]]:
+    action = payload.get("action") or {}
+    data = action.get("data") or {}
+    model = payload.get("model") or {}
+    board_id = (data.get("board") or {}).get("id") or model.get("idBoard") or model.get("id")
+    card_id = (data.get("card") or {}).get("id")
+    if card_id:
+        return board_id, card_id, []
+    scopes: list[Scope] = []
+    list_id = (data.get("list") or {}).get("id")
+    if list_id:
+        scopes.append(("list_id", list_id))
+    member_id = (data.get("member") or {}).get("id") or data.get("idMemberAdded")
+    if member_id:
+        scopes.append((f"member_{member_id}", True))
+    label_id = (data.get("label") or {}).get("id")
+    if label_id:
+        scopes.append((f"label_{label_id}", True))
+    return board_id, None, scopes
+
+
+# Ожидающие обновления одной доски: карточки и условия -> [время первого события, время последнего]
+class PendingBoard:
+    def __init__(self):
+        self.cards: dict[str, list[float]] = {}
+        self.scopes: dict[Scope, list[float]] = {}
+        # Колонки, участники или метки доски изменились — перечитать их перед обновлением карточек
+        self.meta_stale = False
+        # Ошибок обновления подряд и время, раньше которого доску не обновляем (экспоненциальная пауза)
+        self.failures = 0
+        self.retry_at = 0.0
+
+
+class TrelloWebhookProcessor:
+    def __init__(
+        self,
+        registry: CollectionRegistry,
+        trello_client: TrelloClient,
+        chunker: TextChunker | None = None,
+        on_change: Callable[[list[str]], None] | None = None,
+        is_syncing: Callable[[str], bool] | None = None,
+        secret: str = "",
+        trello_configured: bool = True,
+        callback_url: str = "",
+        debounce_seconds: float = 2.0,
+        max_delay_seconds: float = 30.0,
+        batch_size: int = 10,
+        reconcile_seconds: float = 900.0,
+        record_path: str = "",
+        retry_base_seconds: float = 5.0,
+        retry_max_seconds: float = 300.0,
+        max_retries: int = 6,
+    ):
+        self.registry = registry
+        self.trello_client = trello_client
+        self.chunker = chunker
+        # Уведомление об измененных и удаленных документах (сброс кэша ответов)
+        self.on_change = on_change
+        # Пока доска синхронизируется целиком, ее события ждут: синхронизация и так их учтет
+        self.is_syncing = is_syncing or (lambda board_id: False)
+        self.secret = secret
+        self.trello_configured = trello_configured
+        self.callback_url = callback_url
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.batch_size = batch_size
+        self.reconcile_seconds = reconcile_seconds
+        self.record_path = record_path
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.max_retries = max_retries
+        self._pending: dict[str, PendingBoard] = {}
+        # Колонки, участники и метки по доскам: перечитываются после их изменений и при сверке
+        self._meta: dict[str, BoardMeta] = {}
+        # Доски, которые сверяем с Trello: доска по умолчанию и все, от которых приходили события
+        self.boards: set[str] = {registry.default_board_id} if registry.default_board_id else set()
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self.counters = dict.fromkeys(
+            (
+                "accepted", "ignored", "rejected", "coalesced", "batches", "cards_added", "cards_updated",
+                "cards_unchanged", "cards_removed", "trello_requests", "errors", "retries", "dropped_cards",
+                "reconciles", "reconciled_cards",
+            ),
+            0,
+        )
+        self.last_error: str | None = None
+        self.last_reconcile: float | None = None
+        # Сколько досок обновляется прямо сейчас (их карточки уже не в очереди)
+        self.updating = 0
+
+    # Прием выключен, пока не задан секрет приложения (без него подпись не проверить)
+    # или ключ и токен Trello API (без них карточки из событий не загрузить)
+    @property
+    def disabled_reason(self) -> str | None:
+        if not self.secret:
+            return "TRELLO_API_SECRET is not set"
+        if not self.trello_configured:
+            return "TRELLO_API_KEY and TRELLO_TOKEN are not set"
+        return None
+
+    @property
+    def enabled(self) -> bool:
+        return self.disabled_reason is None
+
+    def verify(self, body: bytes, callback_url: str, signature: str) -> bool:
+        if signature and verify_signature(self.secret, body, self.callback_url or callback_url, signature):
+            return True
+        self.counters["rejected"] += 1
+        WEBHOOK_EVENTS.labels("rejected").inc()
+        return False
+
+    # Запись принятого вебхука для воспроизведения (benchmarks/webhook_replay.py)
+    async def record(self, body: bytes, signature: str, callback_url: str):
+        if not self.record_path:
+            return
+        line = json.dumps(
+            {
+                "received_at": time.time(),
+                "callback_url": self.callback_url or callback_url,
+                "signature": signature,
+                "body": body.decode("utf-8"),
+            },
+            ensure_ascii=False,
+        )
+
+        def append():
+            with open(self.record_path, "a", encoding="utf-8") as file:
+                file.write(line + "\n")
+
+        await run_io(append)
+
+    # Событие только ставит карточки в очередь: ответ Trello уходит сразу, обновление — после паузы
+    def receive(self, payload: dict) -> bool:
+        board_id, card_id, scopes = action_targets(payload)
+        if not board_id or (card_id is None and not scopes):
+            self.counters["ignored"] += 1
+            WEBHOOK_EVENTS.labels("ignored").inc()
+            return False
+        self.boards.add(board_id)
+        pending = self._pending.setdefault(board_id, PendingBoard())
+        now = time.monotonic()
+        if card_id is not None:
+            self._enqueue(pending.cards, card_id, now)
+        for scope in scopes:
+            self._enqueue(pending.scopes, scope, now)
+        if scopes:
+            pending.meta_stale = True
+        self.counters["accepted"] += 1
+        WEBHOOK_EVENTS.labels("accepted").inc()
+        self._wakeup.set()
+        return True
+
+    # Повторное событие той же карточки сдвигает время последнего события (debounce)
+    def _enqueue(self, entries: dict, key, now: float):
+        entry = entries.get(key)
+        if entry is None:
+            entries[key] = [now, now]
+            return
+        entry[1] = now
+        self.counters["coalesced"] += 1
+        WEBHOOK_EVENTS.labels("coalesced").inc()
+
+    # Когда обновлять: после паузы без событий, но не позже max_delay от первого события
+    # и не раньше конца паузы после ошибки обновления доски
+    def _due(self, entry: list[float], pending: PendingBoard) -> float:
+        return max(min(entry[1] + self.debounce_seconds, entry[0] + self.max_delay_seconds), pending.retry_at)
+
+    # Через сколько секунд созреет ближайшее обновление; None — ждать нечего
+    def next_delay(self, now: float) -> float | None:
+        delays = []
+        for board_id, pending in self._pending.items():
+            entries = list(pending.cards.values()) + list(pending.scopes.values())
+            if not entries:
+                continue
+            if self.is_syncing(board_id):
+                delays.append(self.debounce_seconds)
+                continue
+            delays.append(max(0.0, min(self._due(entry, pending) for entry in entries) - now))
+        return min(delays) if delays else None
+
+    async def run_flusher(self):
+        while True:
+            delay = self.next_delay(time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    # Обновляем созревшие карточки всех досок
+    async def flush(self, now: float | None = None):
+        now = now if now is not None else time.monotonic()
+        for board_id, pending in list(self._pending.items()):
+            if self.is_syncing(board_id):
+                continue
+            cards = {key: entry for key, entry in pending.cards.items() if self._due(entry, pending) <= now}
+            scopes = {key: entry for key, entry in pending.scopes.items() if self._due(entry, pending) <= now}
+            if not cards and not scopes:
+                continue
+            for key in cards:
+                del pending.cards[key]
+            for key in scopes:
+                del pending.scopes[key]
+            meta_stale, pending.meta_stale = pending.meta_stale, False
+            await self.update_board(board_id, cards, scopes, meta_stale)
+            if not pending.cards and not pending.scopes:
+                self._pending.pop(board_id, None)
+
+    def _engine(self, index: BoardIndex) -> TrelloSyncEngine:
+        return TrelloSyncEngine(
+            index.collection,
+            self.trello_client,
+            chunker=self.chunker,
+            lexical_index=index.lexical_index,
+            on_change=self.on_change,
+        )
+
+    # Обновление карточек доски пакетами по batch_size: между пакетами запросы /ask получают пул эмбеддингов.
+    # При ошибке необработанные карточки возвращаются в очередь и повторяются после паузы, которая удваивается
+    # с каждой ошибкой подряд; после max_retries ошибок карточки снимаются с очереди до сверки
+    async def update_board(
+        self, board_id: str, cards: dict[str, list[float]], scopes: dict[Scope, list[float]], meta_stale: bool
+    ):
+        first_seen = {card_id: entry[0] for card_id, entry in cards.items()}
+        card_ids = list(cards)
+        done = 0
+        engine = None
+        self.updating += 1
+        try:
+            async with self.registry.use(board_id) as index:
+                engine = self._engine(index)
+                if meta_stale or board_id not in self._meta:
+                    self._meta[board_id] = await run_io(engine.loader.fetch_meta, board_id)
+                # Карточки переименованной колонки, участника или метки находим по метаданным в коллекции
+                for (field, value), entry in scopes.items():
+                    for card_id in await run_io(engine.card_ids_where, {field: value}):
+                        first_seen.setdefault(card_id, entry[0])
+                scopes = {}
+                card_ids = list(first_seen)
+                changed = False
+                for start in range(0, len(card_ids), self.batch_size):
+                    batch = card_ids[start:start + self.batch_size]
+                    report = await engine.sync_cards(board_id, batch, self._meta[board_id])
+                    done = start + len(batch)
+                    finished = time.monotonic()
+                    for card_id in batch:
+                        WEBHOOK_LAG_SECONDS.observe(finished - first_seen[card_id])
+                    self.counters["batches"] += 1
+                    self.counters["cards_added"] += report.added
+                    self.counters["cards_updated"] += report.updated
+                    self.counters["cards_unchanged"] += report.unchanged
+                    self.counters["cards_removed"] += report.removed
+                    changed = changed or bool(report.added or report.updated or report.removed)
+                if changed:
+                    # Колонки, участники и метки могли измениться — словарь перечитаем при следующем запросе
+                    index.vocabulary.mark_stale()
+            pending = self._pending.get(board_id)
+            if pending is not None:
+                pending.failures, pending.retry_at = 0, 0.0
+        except UnknownBoard:
+            # Доска не загружалась в ассистент (нет /load_trello): события по ней не применяем
+            self.boards.discard(board_id)
+            self.counters["ignored"] += 1
+            logger.warning("Ignoring webhook events for board %s: it has not been loaded", board_id)
+        except Exception as e:
+            self.counters["errors"] += 1
+            self.last_error = str(e)
+            pending = self._pending.setdefault(board_id, PendingBoard())
+            pending.failures += 1
+            if pending.failures > self.max_retries:
+                # Trello долго недоступен: не копим очередь, пропущенное найдет сверка
+                dropped = len(card_ids) - done + len(pending.cards)
+                self.counters["dropped_cards"] += dropped
+                logger.error(
+                    "Failed to update cards of board %s from webhooks %d times in a row, "
+                    "leaving %d cards to reconciliation: %s", board_id, pending.failures, dropped, e,
+                )
+                self._pending.pop(board_id, None)
+                return
+            now = time.monotonic()
+            delay = min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (pending.failures - 1))
+            pending.retry_at = now + delay
+            self.counters["retries"] += 1
+            logger.error(
+                "Failed to update cards of board %s from webhooks (attempt %d), retrying in %.0fs: %s",
+                board_id, pending.failures, delay, e,
+            )
+            for card_id in card_ids[done:]:
+                pending.cards.setdefault(card_id, [first_seen[card_id], now])
+            for scope, entry in scopes.items():
+                pending.scopes.setdefault(scope, [entry[0], now])
+            pending.meta_stale = pending.meta_stale or meta_stale
+        finally:
+            self.updating -= 1
+            if engine is not None:
+                self.counters["trello_requests"] += engine.loader.request_count
+
+    # Сверка: колонки, участники, метки и время активности карточек (четыре легких запроса на доску).
+    # Расхождения встают в ту же очередь, что и события
+    async def reconcile(self):
+        for board_id in sorted(self.boards):
+            if self.is_syncing(board_id):
+                continue
+            try:
+                async with self.registry.use(board_id) as index:
+                    engine = self._engine(index)
+                    meta = await run_io(engine.loader.fetch_meta, board_id)
+                    activity = await run_io(engine.loader.fetch_card_activity, board_id)
+                    outdated = await run_io(engine.outdated_card_ids, activity, meta)
+                self._meta[board_id] = meta
+                self.counters["trello_requests"] += engine.loader.request_count
+            except UnknownBoard:
+                self.boards.discard(board_id)
+                continue
+            except Exception as e:
+                self.counters["errors"] += 1
+                self.last_error = str(e)
+                logger.error("Failed to reconcile board %s with Trello: %s", board_id, e)
+                continue
+            if outdated:
+                pending = self._pending.setdefault(board_id, PendingBoard())
+                now = time.monotonic()
+                for card_id in outdated:
+                    pending.cards.setdefault(card_id, [now, now])
+                self._wakeup.set()
+                logger.info("Reconciliation found %d outdated cards on board %s", len(outdated), board_id)
+            self.counters["reconciles"] += 1
+            self.counters["reconciled_cards"] += len(outdated)
+        self.last_reconcile = time.time()
+
+    async def run_reconciler(self):
+        while True:
+            await asyncio.sleep(self.reconcile_seconds)
+            await self.reconcile()
+
+    # Фоновые задачи запускаются из lifespan и только при настроенном секрете
+    def start(self):
+        if not self.enabled:
+            return
+        self._tasks.append(asyncio.create_task(self.run_flusher()))
+        if self.reconcile_seconds > 0:
+            self._tasks.append(asyncio.create_task(self.run_reconciler()))
+
+    async def aclose(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pending_cards": sum(len(pending.cards) for pending in self._pending.values()),
+            "pending_scopes": sum(len(pending.scopes) for pending in self._pending.values()),
+            "updating_boards": self.updating,
+            "boards": sorted(self.boards),
+            **self.counters,
+            "last_error": self.last_error,
+            "last_reconcile": self.last_reconcile,
+        }
@@ -11,7 +11,8 @@ from fastapi.openapi.docs import (
 
 # Функция создает и настраивает FastAPI-приложение
 # create_custom_static_urls: если True, добавляем кастомные маршруты документации
-def start_app(create_custom_static_urls: bool = False) -> FastAPI:
+# lifespan: контекст запуска и остановки приложения (создание и закрытие ресурсов)
+def start_app(create_custom_static_urls: bool = False, lifespan=None) -> FastAPI:
     # Создаем приложение с названием и версией
     # default_response_class=ORJSONResponse ускоряет ответы
     # docs_url и redoc_url отключаем для кастомных маршрутов
@@ -21,6 +22,7 @@ def start_app(create_custom_static_urls: bool = False) -> FastAPI:
         default_response_class=ORJSONResponse,
         docs_url=None if create_custom_static_urls else "/docs",
         redoc_url=None if create_custom_static_urls else "/redoc",
+        lifespan=lifespan,
     )
     # Если включены кастомные маршруты, регистрируем их
     if create_custom_static_urls: